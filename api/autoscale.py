@@ -0,0 +1,146 @@
+# api/autoscale.py
+"""
+Worker-count recommendation from queue depth, arrival rate and service time.
+
+  arrivals  - create_run bumps a per-bucket counter (record_arrival)
+  service   - average execution time reported by live worker heartbeats
+  capacity  - one worker serves slots / service_time runs per second
+
+  needed = (arrival_rate * S) / (slots * TARGET_UTIL)      # keep up with traffic
+         + (depth * S) / (slots * TARGET_WAIT_SEC)         # drain the backlog in time
+
+The raw value is smoothed with a time-based EWMA kept in Redis (so every API
+replica agrees), scale-ups apply immediately and scale-downs only after the
+smoothed value has stayed lower for DOWN_COOLDOWN_SEC.
+"""
+from __future__ import annotations
+import os, math, time
+from typing import Any, Dict
+
+from api.routes.routes_queue_and_metrics import aggregate_workers, live_workers
+from runqueue import make_queue
+
+BUCKET_SEC = 5
+WINDOW_SEC = int(os.getenv("AUTOSCALE_WINDOW_SEC", "60"))
+SMOOTHING_SEC = float(os.getenv("AUTOSCALE_SMOOTHING_SEC", "60"))
+DOWN_COOLDOWN_SEC = float(os.getenv("AUTOSCALE_DOWN_COOLDOWN_SEC", "300"))
+TARGET_WAIT_SEC = float(os.getenv("AUTOSCALE_TARGET_WAIT_SEC", "30"))
+TARGET_UTIL = float(os.getenv("AUTOSCALE_TARGET_UTIL", "0.8"))
+DEFAULT_SERVICE_SEC = float(os.getenv("AUTOSCALE_DEFAULT_SERVICE_SEC", "1.0"))
+MIN_WORKERS = int(os.getenv("AUTOSCALE_MIN_WORKERS", "1"))
+MAX_WORKERS = int(os.getenv("AUTOSCALE_MAX_WORKERS", "20"))
+
+ARRIVALS_PREFIX = "metrics:arrivals:"
+STATE_KEY = "autoscale:state"
+
+def record_arrival(r, n: int = 1) -> None:
+    """Called from create_run. Never raises: sampling must not fail a submission."""
+    key = f"{ARRIVALS_PREFIX}{int(time.time() // BUCKET_SEC)}"
+    try:
+        p = r.pipeline(transaction=False)
+        p.incrby(key, n)
+        p.expire(key, WINDOW_SEC + BUCKET_SEC * 2)
+        p.execute()
+    except Exception:
+        pass
+
+def arrival_rate(r, window: int = WINDOW_SEC) -> float:
+    """Runs/sec over the last `window` seconds of complete buckets."""
+    current = int(time.time() // BUCKET_SEC)
+    n = max(1, window // BUCKET_SEC)
+    keys = [f"{ARRIVALS_PREFIX}{b}" for b in range(current - n, current)]
+    total = sum(int(v or 0) for v in r.mget(keys))
+    return total / (n * BUCKET_SEC)
+
+def raw_workers(rate: float, depth: int, service_sec: float, slots_per_worker: float) -> float:
+    per_worker = max(1.0, slots_per_worker)
+    steady = rate * service_sec / (per_worker * TARGET_UTIL)
+    backlog = depth * service_sec / (per_worker * TARGET_WAIT_SEC)
+    return steady + backlog
+
+def _clamp(n: int) -> int:
+    return max(MIN_WORKERS, min(MAX_WORKERS, n))
+
+def _step(state: Dict[str, str], raw: float, now: float) -> Dict[str, str]:
+    prev_ts = float(state.get("ts") or 0)
+    now = max(now, prev_ts)  # a replica with an older sample must not move the clock back
+    ewma = float(state["ewma"]) if "ewma" in state else raw
+    if prev_ts:
+        alpha = 1 - math.exp(-max(0.0, now - prev_ts) / SMOOTHING_SEC)
+        ewma += alpha * (raw - ewma)
+    target = _clamp(math.ceil(ewma - 1e-9))
+
+    current = int(state.get("recommended") or 0) or target
+    changed_at = float(state.get("changed_at") or now)
+    if target > current:
+        current, changed_at = target, now
+    elif target < current:
+        # Only step down once the lower value has held for the cooldown
+        if now - float(state.get("below_since") or now) >= DOWN_COOLDOWN_SEC:
+            current, changed_at = target, now
+    below_since = "" if target >= current else (state.get("below_since") or str(now))
+    return {
+        "ts": str(now),
+        "ewma": str(ewma),
+        "target": str(target),
+        "recommended": str(current),
+        "changed_at": str(changed_at),
+        "below_since": below_since,
+    }
+
+def update(r, raw: float, now: float | None = None) -> Dict[str, str]:
+    """
+    Fold one raw sample into the shared state. Every API process's refresher
+    calls this, so the read-modify-write runs under WATCH and is retried when
+    another process updated the state in between.
+    """
+    now = time.time() if now is None else now
+
+    def step(p) -> Dict[str, str]:
+        state = _step(p.hgetall(STATE_KEY) or {}, raw, now)
+        p.multi()
+        p.hset(STATE_KEY, mapping=state)
+        return state
+
+    return r.transaction(step, STATE_KEY, value_from_callable=True)
+
+def recommend(r, step: bool = True, queue=None, depth: int | None = None) -> Dict[str, Any]:
+    """
+    `step`: fold this sample into the shared EWMA / cooldown state. Only the
+    metrics refresher does; readers (GET /v1/ops/autoscale) see the state as
+    it is, so polling the endpoint does not move it. `queue` / `depth`: the
+    caller's queue on `r`, or a depth it has just read.
+    """
+    now = time.time()
+    if depth is None:
+        depth = (queue or make_queue(r)).depth()
+    rate = arrival_rate(r)
+    live = live_workers(r)
+    agg = aggregate_workers(live)
+    service = agg.get("avg_exec_sec") or DEFAULT_SERVICE_SEC
+    slots_per_worker = (agg["slots"] / agg["live"]) if agg["live"] else 1.0
+    raw = raw_workers(rate, depth, service, slots_per_worker)
+
+    if step:
+        state = update(r, raw, now)
+    else:
+        stored = r.hgetall(STATE_KEY) or {}
+        # Never stepped yet: show what the first sample would give, without writing it
+        state = stored if "recommended" in stored and "target" in stored else _step(stored, raw, now)
+    ewma, target = float(state["ewma"]), int(state["target"])
+    current, changed_at = int(state["recommended"]), float(state["changed_at"])
+    return {
+        "recommended_workers": current,
+        "target_workers": target,
+        "raw_workers": round(raw, 3),
+        "smoothed_workers": round(ewma, 3),
+        "current_workers": agg["live"],
+        "queue_depth": depth,
+        "arrival_rate_per_sec": round(rate, 4),
+        "service_time_sec": round(service, 4),
+        "slots_per_worker": slots_per_worker,
+        "target_wait_sec": TARGET_WAIT_SEC,
+        "target_utilisation": TARGET_UTIL,
+        "bounds": {"min": MIN_WORKERS, "max": MAX_WORKERS},
+        "last_change_ts": changed_at,
+    }
@@ -0,0 +1,101 @@
+# api/latency.py
+"""
+Run latency histograms written by the worker (worker/timings.py).
+
+  metrics:hist:{kind}:{language}:{attempt} -> {<le>: n, "+Inf": n, "sum": s, "count": n}
+
+kind is queue_wait | exec | total. Bucket fields are per-bucket counts; they
+are made cumulative here for Prometheus and for quantile estimates.
+"""
+from __future__ import annotations
+import math
+from typing import Any, Dict, List, Tuple
+
+HIST_PREFIX = "metrics:hist:"
+HIST_INDEX = "metrics:hist:index"
+KINDS = ("queue_wait", "exec", "total")
+QUANTILES = (0.5, 0.95, 0.99)
+# Same bounds as worker/metrics.py LATENCY_BUCKETS; empty buckets are filled in
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+Buckets = List[Tuple[float, int]]  # (upper bound, cumulative count), ascending, ends with +Inf
+
+def _cumulative(fields: Dict[str, str]) -> Buckets:
+    per = dict.fromkeys(LATENCY_BUCKETS, 0)
+    for k, v in fields.items():
+        if k in ("sum", "count"):
+            continue
+        try:
+            per[float(k)] = per.get(float(k), 0) + int(v)
+        except ValueError:
+            continue
+    per.setdefault(math.inf, 0)
+    out, total = [], 0
+    for le in sorted(per):
+        total += per[le]
+        out.append((le, total))
+    return out
+
+def read_histograms(r, keys=None) -> Dict[Tuple[str, str, str], Dict[str, Any]]:
+    """{(kind, language, attempt): {"buckets", "sum", "count"}} in one pipelined read.
+
+    `keys` is HIST_INDEX's members if the caller already fetched them.
+    """
+    keys = sorted(r.smembers(HIST_INDEX) if keys is None else keys or [])
+    if not keys:
+        return {}
+    p = r.pipeline(transaction=False)
+    for key in keys:
+        p.hgetall(key)
+    out = {}
+    for key, fields in zip(keys, p.execute()):
+        parts = key[len(HIST_PREFIX):].split(":")
+        if len(parts) < 3 or not fields:
+            continue
+        kind, attempt, language = parts[0], parts[-1], ":".join(parts[1:-1])
+        out[(kind, language, attempt)] = {
+            "buckets": _cumulative(fields),
+            "sum": float(fields.get("sum") or 0),
+            "count": int(fields.get("count") or 0),
+        }
+    return out
+
+def merge(hists: List[Buckets]) -> Buckets:
+    totals: Dict[float, int] = {}
+    for buckets in hists:
+        prev = 0
+        for le, cum in buckets:
+            totals[le] = totals.get(le, 0) + cum - prev
+            prev = cum
+    return _cumulative({repr(le) if le != math.inf else "+Inf": str(n) for le, n in totals.items()})
+
+def quantile(q: float, buckets: Buckets) -> float | None:
+    """Linear interpolation inside the bucket, like PromQL histogram_quantile."""
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    rank = q * buckets[-1][1]
+    lower, below = 0.0, 0
+    for le, cum in buckets:
+        if cum >= rank:
+            if le == math.inf:
+                return lower  # no upper bound: report the highest finite bucket
+            if cum == below:
+                return le
+            return lower + (le - lower) * (rank - below) / (cum - below)
+        lower, below = le, cum
+    return lower
+
+def summary(hists: Dict[Tuple[str, str, str], Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """p50/p95/p99 per kind across all languages and attempts."""
+    out = {}
+    for kind in KINDS:
+        parts = [h for (k, _, _), h in hists.items() if k == kind]
+        merged = merge([h["buckets"] for h in parts])
+        count = sum(h["count"] for h in parts)
+        entry: Dict[str, Any] = {"count": count}
+        for q in QUANTILES:
+            v = quantile(q, merged)
+            entry[f"p{int(q * 100)}"] = None if v is None else round(v, 4)
+        entry["avg"] = round(sum(h["sum"] for h in parts) / count, 4) if count else None
+        out[kind] = entry
+    return out
@@ -1,30 +1,43 @@
 # api/main.py
 from __future__ import annotations
-import os, json, time, uuid, hashlib
-from typing import List, Optional
+import os, json, time, uuid, codecs, hashlib
+from itertools import chain
+from typing import Iterator, List, Optional
 
 import redis
 from fastapi import FastAPI, HTTPException, Request, Response, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
-# Routers (keep your existing ops router if you have one)
+# Routers. The ops router is required (quotas, limits, profiler): an import
+# error must fail start-up, not silently drop the endpoints.
+from api.routes.ops import router as ops_router, authorized as admin_authorized
+
 try:
-    from routes.ops import router as ops_router
+    from api.routes.routes_queue_and_metrics import router as queue_metrics_router
 except Exception:
-    ops_router = None
+    queue_metrics_router = None
 
 # Observability
-from api.observability import install_observability, RUNS_PROCESSED
+from api.observability import install_observability
+from api.profiler import ProfileMiddleware, save as save_profile
+from api.autoscale import record_arrival, recommend
+from api.latency import read_histograms, summary as latency_summary
+from api.usage import rollup as usage_rollup
+from runqueue import make_queue
+from blobstore import make_store, store_for
+from records import decode_project, decode_run, encode_project, encode_run, now_ms, pick_run, run_field_names
+import tracing
 
 # --------------------------
 # Config & Redis connection
 # --------------------------
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-RUNS_QUEUE = os.getenv("RUNS_QUEUE", "runs")
 DLQ_QUEUE = os.getenv("RUNS_DLQ", "runs:dead")
 r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+queue = make_queue(r)  # RUNS_QUEUE_BACKEND=list|stream
+tracer = tracing.make_exporter()  # TRACE_EXPORTERS=redis (default), ndjson, none
 
 # Allow one or more UI origins via env (comma-separated)
 UI_ORIGINS = [o.strip() for o in os.getenv("UI_ORIGINS", "").split(",") if o.strip()]
@@ -45,11 +58,15 @@ app = FastAPI(
 )
 
 # Install observability (request ID, Prometheus /metrics)
-install_observability(app)
+install_observability(app, r, queue)
+# Per-request CPU profiles (X-Profile: 1 + X-Admin-Token), see api/profiler.py
+app.add_middleware(ProfileMiddleware, authorize=admin_authorized,
+                   save=lambda profile_id, stacks: save_profile(r, profile_id, stacks))
 
+app.include_router(ops_router, tags=["ops"])
 # Attach external router if present
-if ops_router is not None:
-    app.include_router(ops_router, tags=["ops"])
+if queue_metrics_router is not None:
+    app.include_router(queue_metrics_router, tags=["ops"])
 
 # --------------------------
 # CORS
@@ -74,20 +91,18 @@ else:
 # --------------------------
 # Models
 # --------------------------
+# Upper bounds keep project / run hashes in Redis' listpack encoding (records/__init__.py)
 class ProjectCreate(BaseModel):
-    name: str = Field(..., min_length=1)
+    name: str = Field(..., min_length=1, max_length=64)
 
 class RunCreate(BaseModel):
-    project_id: str = Field(..., min_length=1)
-    language: str = Field(..., min_length=1)
+    project_id: str = Field(..., min_length=1, max_length=64)
+    language: str = Field(..., min_length=1, max_length=32)
     code: str = Field(..., min_length=1)
 
 # --------------------------
 # Helpers
 # --------------------------
-def now_ts() -> float:
-    return time.time()
-
 def ensure_project_exists(project_id: str):
     if not r.exists(f"project:{project_id}"):
         raise HTTPException(status_code=404, detail="Project not found")
@@ -95,14 +110,7 @@ def ensure_project_exists(project_id: str):
 def _create_project_inner(name: str):
     project_id = str(uuid.uuid4())
     key = f"project:{project_id}"
-    r.hset(
-        key,
-        mapping={
-            "project_id": project_id,
-            "name": name or "Untitled",
-            "created_at": str(now_ts()),
-        },
-    )
+    r.hset(key, mapping=encode_project({"name": name or "Untitled", "created_at": now_ms()}))
     r.sadd("projects", project_id)
     return {"project_id": project_id, "name": name or "Untitled"}
 
@@ -115,6 +123,54 @@ def _hash_run_fields(project_id: str, language: str, code: str) -> str:
     h.update(code.encode())
     return h.hexdigest()
 
+def _read_logs(run_id: str, data: dict) -> tuple[List[str], int]:
+    """
+    Log lines (newest first) and how many the worker's ring buffer dropped.
+    Entries are chunks of lines; `log_lines` on the run hash counts every line appended.
+    """
+    lines: List[str] = []
+    for chunk in r.lrange(f"run:{run_id}:logs", 0, -1):
+        lines.extend(reversed(chunk.split("\n")))
+    dropped = max(0, int(data.get("log_lines") or 0) - len(lines))
+    if dropped:
+        lines.append(f"... {dropped} earlier lines dropped")
+    return lines, dropped
+
+blobs = make_store()  # BLOB_STORE; blob-backed results are readable whatever it is set to
+
+def _open_blob(ref: str) -> Iterator[bytes]:
+    """
+    The blob's blocks, with the file already opened: a pruned or unreachable blob
+    fails here, before any status line is sent, not halfway through a 200.
+    """
+    try:
+        blocks = store_for(ref, blobs).open(ref)
+        first = next(blocks, b"")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Result blob not found")
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=502, detail=f"Result blob unreadable: {e}")
+    return chain([first], blocks)
+
+def _blob_json(blocks: Iterator[bytes]) -> Iterator[str]:
+    """A blob as one JSON string literal, encoded block by block."""
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    yield '"'
+    for block in blocks:
+        yield json.dumps(decoder.decode(block))[1:-1]
+    yield json.dumps(decoder.decode(b"", final=True))[1:-1] + '"'
+
+def _read_result(run_id: str) -> Optional[str]:
+    """
+    Plain string, or the chunk list a streaming worker appends to (worker/output.py), joined.
+    None for blob-backed results (`result_ref` on the run hash): stream those instead.
+    """
+    key = f"run:{run_id}:result"
+    try:
+        return r.get(key)
+    except redis.ResponseError:
+        return "".join(r.lrange(key, 0, -1))
+
 # --------------------------
 # System / Discovery
 # --------------------------
@@ -186,13 +242,13 @@ def create_project_simple(name: str = "Auto Smoke"):
 def list_projects(limit: int = 50):
     ids = list(r.smembers("projects"))
     projects = []
+    p = r.pipeline(transaction=False)
     for pid in ids:
-        data = r.hgetall(f"project:{pid}")
+        p.hgetall(f"project:{pid}")
+    for pid, data in zip(ids, p.execute() if ids else []):
         if data:
-            try:
-                data["created_at"] = float(data.get("created_at", "0"))
-            except Exception:
-                data["created_at"] = 0.0
+            data = {"project_id": pid, **decode_project(data)}
+            data["created_at"] = data.get("created_at") or 0.0
             projects.append(data)
     projects.sort(key=lambda d: d.get("created_at", 0.0), reverse=True)
     return {"projects": projects[: max(1, min(limit, 200))]}
@@ -206,8 +262,10 @@ class RunCreateBody(RunCreate):
 @app.post("/v1/runs", tags=["runs"])
 def create_run(
     body: RunCreateBody,
+    request: Request,
     idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key"),
 ):
+    received = now_ms() / 1000  # same ms clock as `_created`, so the API span sorts first
     ensure_project_exists(body.project_id)
 
     # Compute a stable fingerprint; also allow client-supplied Idempotency-Key
@@ -218,9 +276,9 @@ def create_run(
     # Fast-path: if we have a run_id recorded for this idempotency key, return it
     run_id_existing = r.get(idem_redis_key)
     if run_id_existing and r.exists(f"run:{run_id_existing}"):
-        data = r.hgetall(f"run:{run_id_existing}")
-        logs = r.lrange(f"run:{run_id_existing}:logs", 0, -1) if r.exists(f"run:{run_id_existing}:logs") else []
-        result = r.get(f"run:{run_id_existing}:result")
+        data = decode_run(r.hgetall(f"run:{run_id_existing}"))
+        logs, _ = _read_logs(run_id_existing, data)
+        result = _read_result(run_id_existing)
         return {
             "run_id": run_id_existing,
             "status": data.get("status", "queued"),
@@ -231,18 +289,21 @@ def create_run(
 
     # Otherwise, create a new run
     run_id = str(uuid.uuid4())
-    now = str(now_ts())
+    now = now_ms()
+    # Continue the caller's trace (traceparent) or start one; the worker's spans hang off this request's span
+    trace_id, parent_id = tracing.parse_traceparent(request.headers.get("traceparent")) or (tracing.new_trace_id(), None)
+    request_id = getattr(request.state, "request_id", None)
+    trace = {"trace_id": trace_id, "span_id": tracing.new_span_id(), "request_id": request_id}
     run_key = f"run:{run_id}"
     r.hset(
         run_key,
-        mapping={
-            "run_id": run_id,
+        mapping=encode_run({
             "project_id": body.project_id,
             "language": body.language,
             "status": "queued",
             "created_at": now,
             "updated_at": now,
-        },
+        }),
     )
     r.sadd("runs", run_id)
 
@@ -252,35 +313,117 @@ def create_run(
         "language": body.language,
         "code": body.code,
         "_content_hash": content_hash,
-        "_created": now,
+        "_created": str(now / 1000),
+        tracing.PAYLOAD_KEY: trace,
     }
-    r.lpush(RUNS_QUEUE, json.dumps(payload))
+    queue.enqueue(json.dumps(payload))
+    record_arrival(r)
 
     # Remember idempotency mapping with a TTL (avoid unbounded growth)
-    r.setex(idem_redis_key, int(os.getenv("IDEMPOTENCY_TTL_SEC", "86400")), run_id)
+    p = r.pipeline(transaction=False)
+    p.setex(idem_redis_key, int(os.getenv("IDEMPOTENCY_TTL_SEC", "86400")), run_id)
+    if tracer is not None:
+        span = tracing.span("api.create_run", {"trace_id": trace_id, "span_id": parent_id}, received, time.time(),
+                            "api", span_id=trace["span_id"], request_id=request_id, project_id=body.project_id)
+        tracer.export(p, run_id, [span])
+    p.execute()
 
-    return {"run_id": run_id, "status": "queued", "idempotent": False}
+    return {"run_id": run_id, "status": "queued", "idempotent": False, "trace_id": trace_id}
 
 @app.get("/v1/runs/{run_id}", tags=["runs"])
 def get_run(run_id: str):
     run_key = f"run:{run_id}"
     if not r.exists(run_key):
         raise HTTPException(status_code=404, detail="Run not found")
-    data = r.hgetall(run_key)
-    logs_key = f"run:{run_id}:logs"
-    logs: List[str] = r.lrange(logs_key, 0, -1) if r.exists(logs_key) else []
-    result_key = f"run:{run_id}:result"
-    result: Optional[str] = r.get(result_key)
-    return {
-        "run_id": data.get("run_id", run_id),
+    data = decode_run(r.hgetall(run_key))
+    logs, dropped = _read_logs(run_id, data)
+    ref = data.get("result_ref")
+    body = {
+        "run_id": run_id,
         "project_id": data.get("project_id"),
         "language": data.get("language"),
         "status": data.get("status"),
         "created_at": data.get("created_at"),
         "updated_at": data.get("updated_at"),
+        "usage": {k: data[k] for k in ("cpu_time", "max_rss_kb", "wall_time") if k in data},
+        "failure": {"class": data["failure_class"], "error": data.get("error")} if "failure_class" in data else None,
         "logs": logs,
-        "result": result,
+        "logs_dropped": dropped,
     }
+    if not ref:
+        return {**body, "result": _read_result(run_id)}
+    # Large result in the blob store: stream it into the JSON instead of loading it
+    body["result_bytes"] = int(data.get("result_bytes") or 0)
+    blocks = _open_blob(ref)
+    head = json.dumps(body)[:-1] + ', "result": '
+    return StreamingResponse(chain([head], _blob_json(blocks), ["}"]), media_type="application/json")
+
+@app.get("/v1/runs/{run_id}/result", tags=["runs"])
+def get_run_result(run_id: str):
+    """The result alone, as text/plain; blob-backed results are streamed."""
+    [ref] = pick_run(["result_ref"], r.hmget(f"run:{run_id}", run_field_names("result_ref")))
+    if ref:
+        return StreamingResponse(_open_blob(ref), media_type="text/plain; charset=utf-8")
+    result = _read_result(run_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return PlainTextResponse(result)
+
+RUN_DONE = ("succeeded", "failed", "timeout")
+
+@app.get("/v1/runs/{run_id}/trace", tags=["runs"])
+def get_run_trace(run_id: str):
+    """
+    Timeline of a run: the API request that submitted it, then every worker
+    attempt (dequeue, mark_running, execute, status_write). `offset_ms` is
+    relative to the first span.
+    """
+    if not r.exists(f"run:{run_id}"):
+        raise HTTPException(status_code=404, detail="Run not found")
+    spans = tracing.read_trace(r, run_id)
+    t0 = spans[0]["start"] if spans else None
+    end = max((s["start"] + s["duration_ms"] / 1000 for s in spans), default=t0)
+    for s in spans:
+        s["offset_ms"] = round((s["start"] - t0) * 1000, 3)
+    api = next((s for s in spans if s.get("service") == "api"), {})
+    return {
+        "run_id": run_id,
+        "trace_id": spans[0].get("trace_id") if spans else None,
+        "request_id": api.get("attrs", {}).get("request_id"),
+        "duration_ms": round((end - t0) * 1000, 3) if spans else None,
+        "spans": spans,
+    }
+
+@app.get("/v1/runs/{run_id}/output", tags=["runs"])
+def get_run_output(run_id: str, offset: int = 0, limit: int = 256):
+    """
+    Stdout chunks from `offset` on, while the run executes; poll again with `next`.
+    `done` once the run has finished and every chunk has been returned.
+    """
+    key = f"run:{run_id}:result"
+    p = r.pipeline(transaction=False)
+    names = ("status", "result_ref")
+    p.hmget(f"run:{run_id}", run_field_names(*names))
+    p.type(key)
+    values, kind = p.execute()
+    status, ref = pick_run(names, values)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if ref:
+        # Finished and offloaded to the blob store: fetch it whole from /result
+        return {"run_id": run_id, "status": status, "chunks": [], "next": offset, "done": True,
+                "result_url": f"/v1/runs/{run_id}/result"}
+    offset, limit = max(0, offset), max(1, min(limit, 1024))
+    if kind == "list":
+        chunks = r.lrange(key, offset, offset + limit - 1)
+        total = offset + len(chunks) if len(chunks) < limit else r.llen(key)
+    else:
+        value = r.get(key) if kind == "string" else None
+        chunks = [value] if value and offset == 0 else []
+        total = 1 if value else 0
+    nxt = offset + len(chunks)
+    return {"run_id": run_id, "status": status, "chunks": chunks, "next": nxt,
+            "done": status in RUN_DONE and nxt >= total}
 
 # --------------------------
 # Ops helpers (queues / dlq)
@@ -288,19 +431,36 @@ def get_run(run_id: str):
 @app.get("/v1/ops/queues", tags=["ops"])
 def queues():
     sizes = {
-        "runs": r.llen(RUNS_QUEUE),
+        "runs": queue.depth(),
         "dead": r.llen(DLQ_QUEUE),
         "projects": r.scard("projects"),
         "runs_set": r.scard("runs"),
     }
-    return {"ok": True, "sizes": sizes}
+    # Seconds, across languages/attempts; per-label histograms are on /metrics
+    return {"ok": True, "sizes": sizes, "queue": queue.stats(), "latency": latency_summary(read_histograms(r))}
+
+@app.get("/v1/ops/usage", tags=["ops"])
+def usage(days: int = 1, top: int = 50):
+    """Per-project cpu/wall seconds, peak memory and timeouts over the last `days` UTC days."""
+    days = max(1, min(days, 35))
+    return {"ok": True, "days": days, "projects": usage_rollup(r, days, max(1, min(top, 500)))}
+
+@app.get("/v1/ops/autoscale", tags=["ops"])
+def autoscale():
+    """
+    Recommended scw-worker replica count (smoothed); also exported as a Prometheus
+    gauge. Read-only: the metrics refresher advances the smoothing state.
+    """
+    return {"ok": True, **recommend(r, step=False, queue=queue)}
 
 @app.post("/v1/ops/dlq/retry", tags=["ops"])
 def dlq_retry(limit: int = 100):
-    moved = 0
-    for _ in range(max(1, min(limit, 1000))):
-        item = r.rpop(DLQ_QUEUE)
-        if not item: break
-        r.lpush(RUNS_QUEUE, item)
-        moved += 1
-    return {"ok": True, "moved": moved}
+    items = r.rpop(DLQ_QUEUE, max(1, min(limit, 1000))) or []
+    try:
+        queue.enqueue_many(items)
+    except Exception as e:
+        # Put them back where they were (oldest at the tail): a failed retry must not lose runs
+        if items:
+            r.rpush(DLQ_QUEUE, *reversed(items))
+        raise HTTPException(status_code=503, detail=f"enqueue failed, {len(items)} entries left in the DLQ: {e}")
+    return {"ok": True, "moved": len(items)}
@@ -1,69 +1,309 @@
 # api/observability.py
 from __future__ import annotations
-import uuid, os
-from typing import Callable, Awaitable
-from fastapi import FastAPI, Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+import uuid, os, re, time, threading
+from fastapi import FastAPI, Response
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from prometheus_client import (
-    Counter, Gauge, Histogram, CollectorRegistry,
-    generate_latest, CONTENT_TYPE_LATEST
+    Counter, Gauge, Histogram, CollectorRegistry, REGISTRY,
+    generate_latest, CONTENT_TYPE_LATEST, multiprocess
 )
+from prometheus_client.core import HistogramMetricFamily
+
+from api.latency import HIST_INDEX, KINDS, read_histograms
+from runqueue import make_queue
 
 # ---- Core HTTP metrics ----
+# `path` is the matched route template (/v1/runs/{run_id}), never the raw URL
+def _buckets(raw: str) -> tuple[float, ...]:
+    try:
+        return tuple(sorted(float(b) for b in raw.split(",") if b.strip())) or Histogram.DEFAULT_BUCKETS
+    except ValueError:
+        return Histogram.DEFAULT_BUCKETS
+
+HTTP_LATENCY_BUCKETS = _buckets(os.getenv("HTTP_LATENCY_BUCKETS", ""))
+HTTP_MAX_LABEL_SETS = int(os.getenv("HTTP_METRICS_MAX_LABEL_SETS", "500"))  # distinct (path, method) pairs
+UNMATCHED_PATH, OVERFLOW_PATH = "<unmatched>", "<overflow>"
+METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
 HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests", ["path", "method", "code"])
-HTTP_INFLIGHT = Gauge("http_inflight_requests", "In-flight requests")
-HTTP_LATENCY = Histogram("http_request_duration_seconds", "Request latency (seconds)", ["path", "method"])
-
-# ---- App/queue metrics (exported at scrape time) ----
-RUNS_QUEUE_DEPTH = Gauge("scw_runs_queue_depth", "Depth of the runs queue")
-RUNS_DLQ_DEPTH   = Gauge("scw_runs_dead_queue_depth", "Depth of the dead-letter queue")
-RUNS_PROCESSED_TOTAL = Gauge("scw_runs_processed_total", "Total runs processed (from Redis counter)")
-RUNS_PROCESSED_BY_LANG = Gauge("scw_runs_processed_by_language", "Runs processed by language", ["language"])
-
-class RequestIdMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
-        rid = request.headers.get("x-request-id") or str(uuid.uuid4())
-        response: Response = await call_next(request)
-        response.headers["x-request-id"] = rid
-        return response
-
-class MetricsMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next: Callable[[Request], Awaitable[Response]]) -> Response:
+HTTP_INFLIGHT = Gauge("http_inflight_requests", "In-flight requests", multiprocess_mode="livesum")
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Request latency (seconds)", ["path", "method"],
+                         buckets=HTTP_LATENCY_BUCKETS)
+HTTP_LABEL_OVERFLOW = Counter("http_metrics_label_overflow_total",
+                              "Requests recorded under path=<overflow> because HTTP_METRICS_MAX_LABEL_SETS was reached")
+
+# ---- App/queue metrics (read from Redis by _Refresher) ----
+# Every API process reads the same Redis values: export the freshest live one
+FROM_REDIS = "livemostrecent"
+RUNS_QUEUE_DEPTH = Gauge("scw_runs_queue_depth", "Depth of the runs queue", multiprocess_mode=FROM_REDIS)
+RUNS_DLQ_DEPTH   = Gauge("scw_runs_dead_queue_depth", "Depth of the dead-letter queue", multiprocess_mode=FROM_REDIS)
+RUNS_PROCESSED_TOTAL = Gauge("scw_runs_processed_total", "Total runs processed (from Redis counter)", multiprocess_mode=FROM_REDIS)
+RUNS_COALESCED_TOTAL = Gauge("scw_runs_coalesced_total", "Runs answered from an identical in-flight run (from Redis counter)", multiprocess_mode=FROM_REDIS)
+RUNS_FAILURES_BY_CLASS = Gauge("scw_runs_failures_by_class", "Failed run attempts by failure class (from Redis hash)", ["class"], multiprocess_mode=FROM_REDIS)
+RUNS_PROCESSED_BY_LANG = Gauge("scw_runs_processed_by_language", "Runs processed by language", ["language"], multiprocess_mode=FROM_REDIS)
+AUTOSCALE_RECOMMENDED = Gauge("scw_autoscale_recommended_workers", "Recommended scw-worker replicas (smoothed)", multiprocess_mode=FROM_REDIS)
+RUNS_ARRIVAL_RATE = Gauge("scw_runs_arrival_rate", "Run submissions per second (sliding window)", multiprocess_mode=FROM_REDIS)
+# Stream backend only (RUNS_QUEUE_BACKEND=stream)
+RUNS_STREAM_LENGTH = Gauge("scw_runs_stream_length", "Entries in the runs stream (after MAXLEN trimming)", multiprocess_mode=FROM_REDIS)
+RUNS_STREAM_LAG = Gauge("scw_runs_stream_lag", "Stream entries not yet delivered to the worker group", multiprocess_mode=FROM_REDIS)
+RUNS_STREAM_PENDING = Gauge("scw_runs_stream_pending", "Stream entries delivered but not acknowledged", multiprocess_mode=FROM_REDIS)
+RUNS_STREAM_CONSUMERS = Gauge("scw_runs_stream_consumers", "Consumers in the worker group", multiprocess_mode=FROM_REDIS)
+
+class _RunLatencyCollector:
+    """Fleet-wide run latency histograms, from the worker's Redis bucket counters."""
+    HELP = {
+        "queue_wait": "Run queue wait (dequeue minus enqueue)",
+        "exec": "Run execution time",
+        "total": "Run submission to final status",
+    }
+
+    def __init__(self):
+        self.hists = {}  # replaced by the background _Refresher
+
+    def collect(self):
+        for kind in KINDS:
+            fam = HistogramMetricFamily(f"scw_run_{kind}_seconds", self.HELP[kind], labels=["language", "attempt"])
+            for (k, lang, attempt), h in sorted(self.hists.items()):
+                if k != kind:
+                    continue
+                buckets = [("+Inf" if le == float("inf") else repr(le), cum) for le, cum in h["buckets"]]
+                fam.add_metric([lang, attempt], buckets, h["sum"])
+            yield fam
+
+RUN_LATENCY = _RunLatencyCollector()
+REGISTRY.register(RUN_LATENCY)
+
+class _RouteLabels:
+    """(path, method) labels for a finished request, capped at `limit` distinct pairs."""
+
+    def __init__(self, limit: int):
+        self.limit, self.seen = limit, set()
+
+    def __call__(self, scope: Scope, root_path: str) -> tuple[str, str]:
+        method = scope["method"] if scope["method"] in METHODS else "OTHER"
+        # mounted apps extend root_path: keep their prefix in the label
+        prefix = scope.get("root_path", "")[len(root_path):]
+        template = getattr(scope.get("route"), "path_format", None)  # set on a match, including 405s
+        if template is None:
+            if not prefix:
+                return UNMATCHED_PATH, method
+            template = "/*"  # a mount without routes of its own (StaticFiles, ...)
+        key = (prefix + template, method)
+        if key not in self.seen:
+            if len(self.seen) >= self.limit:
+                HTTP_LABEL_OVERFLOW.inc()
+                return OVERFLOW_PATH, method
+            self.seen.add(key)  # a lost race only lets the set grow by a few past the cap
+        return key
+
+class ObservabilityMiddleware:
+    """
+    Pure ASGI: request id, latency, response counts and in-flight requests in
+    one layer. It only touches the `http.response.start` message, so bodies
+    (streamed ones included) pass through untouched and no task is spawned.
+    Latency runs until the last body chunk has been handed to the server.
+    """
+
+    def __init__(self, app: ASGIApp, max_label_sets: int = HTTP_MAX_LABEL_SETS):
+        self.app = app
+        self.labels = _RouteLabels(max_label_sets)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rid = ""
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                rid = value.decode("latin-1")
+                break
+        rid = rid or str(uuid.uuid4())
+        scope.setdefault("state", {})["request_id"] = rid
+        status = 500  # if the app raises before responding
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message)["x-request-id"] = rid
+            await send(message)
+
+        root_path = scope.get("root_path", "")
         HTTP_INFLIGHT.inc()
-        path, method = request.url.path, request.method
-        with HTTP_LATENCY.labels(path, method).time():
-            try:
-                response: Response = await call_next(request)
-                HTTP_REQUESTS.labels(path, method, str(response.status_code)).inc()
-                return response
-            finally:
-                HTTP_INFLIGHT.dec()
-
-def _refresh_runtime_gauges_from_redis():
-    """Called at scrape time: pull counters/gauges from Redis if available."""
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_INFLIGHT.dec()
+            path, method = self.labels(scope, root_path)
+            HTTP_LATENCY.labels(path, method).observe(time.perf_counter() - t0)
+            HTTP_REQUESTS.labels(path, method, str(status)).inc()
+
+# ---- Scrape-time values, refreshed in the background ----
+REFRESH_SEC = float(os.getenv("METRICS_REFRESH_SEC", "5"))
+STALE_SEC = float(os.getenv("METRICS_STALE_SEC", str(3 * REFRESH_SEC)))
+DLQ_KEY = os.getenv("RUNS_DLQ", "runs:dead")
+
+# Created by the first refresher of a process, not at import: in multiprocess mode
+# an unlabelled gauge writes 0 to its file straight away, and a worker that never
+# refreshed would then report "fresh". Max over live processes, so one stale
+# refresher is enough to raise the alarm.
+METRICS_AGE: Gauge | None = None
+METRICS_STALE: Gauge | None = None
+_age_lock = threading.Lock()
+
+def _age_gauges() -> tuple[Gauge, Gauge]:
+    global METRICS_AGE, METRICS_STALE
+    with _age_lock:
+        if METRICS_AGE is None:
+            METRICS_AGE = Gauge("scw_metrics_age_seconds", "Seconds since the Redis-backed metrics were last refreshed",
+                                multiprocess_mode="livemax")
+            METRICS_STALE = Gauge("scw_metrics_stale", "1 if the Redis-backed metrics are older than METRICS_STALE_SEC",
+                                  multiprocess_mode="livemax")
+    return METRICS_AGE, METRICS_STALE
+
+METRICS_REFRESH_ERRORS = Counter("scw_metrics_refresh_errors_total", "Failed background reads of the Redis-backed metrics")
+
+class _Refresher(threading.Thread):
+    """
+    Reads the Redis-backed gauges every REFRESH_SEC on one shared client, so
+    /metrics only renders what is cached and never waits on Redis. When reads
+    keep failing the last values stay exported and scw_metrics_stale turns 1
+    (no successful refresh for STALE_SEC).
+    """
+
+    def __init__(self, r, interval: float = REFRESH_SEC, stale_sec: float = STALE_SEC, queue=None):
+        super().__init__(name="metrics-refresher", daemon=True)
+        self.r, self.interval, self.stale_sec = r, max(0.5, interval), stale_sec
+        # Built once: a stream queue would redo its consumer-group setup on every refresh
+        self.queue = queue or make_queue(r)
+        self.last_ok = 0.0
+        self.stopped = threading.Event()
+
+    def age(self) -> float:
+        return time.time() - self.last_ok if self.last_ok else float("inf")
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.refresh()
+            self.mark()
+            if MULTIPROC_DIR:
+                mark_dead_processes()
+
+    def mark(self) -> None:
+        """Age / staleness gauges; plain values (not set_function) so multiprocess mode sees them."""
+        age, (age_gauge, stale_gauge) = self.age(), _age_gauges()
+        age_gauge.set(age)
+        stale_gauge.set(float(age > self.stale_sec))
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def refresh(self) -> bool:
+        try:
+            _read_runtime_gauges(self.r, self.queue)
+        except Exception:
+            # Avoid breaking /metrics if Redis is unavailable
+            METRICS_REFRESH_ERRORS.inc()
+            return False
+        self.last_ok = time.time()
+        return True
+
+def _read_runtime_gauges(r, queue) -> None:
+    """Every read goes through `r` (and `queue`, built on it): one client, one pool."""
+    p = r.pipeline(transaction=False)
+    p.llen(DLQ_KEY)
+    p.get("metrics:runs_processed_total")
+    p.get("metrics:runs_coalesced_total")
+    # by-language hash: metrics:runs_processed_by_lang -> {py: 10, js: 2}
+    p.hgetall("metrics:runs_processed_by_lang")
+    p.hgetall("metrics:runs_failures_by_class")
+    p.smembers(HIST_INDEX)
+    dlq, processed, coalesced, by_lang, by_class, hist_keys = p.execute()
+    # Backend-specific and derived reads: a few more round trips, off the scrape path
+    qs = queue.stats()
+    hists = read_histograms(r, hist_keys)
+    from api.autoscale import recommend
+    rec = recommend(r, step=True, queue=queue, depth=qs["depth"])  # the one place the smoothing state advances
+
+    RUNS_QUEUE_DEPTH.set(qs["depth"])
+    if qs["backend"] == "stream":
+        RUNS_STREAM_LENGTH.set(qs["length"])
+        RUNS_STREAM_LAG.set(qs["depth"])
+        RUNS_STREAM_PENDING.set(qs["pending"])
+        RUNS_STREAM_CONSUMERS.set(qs["consumers"])
+    RUNS_DLQ_DEPTH.set(int(dlq or 0))
+    RUNS_PROCESSED_TOTAL.set(int(processed or 0))
+    RUNS_COALESCED_TOTAL.set(int(coalesced or 0))
+    for lang, cnt in (by_lang or {}).items():
+        try:
+            RUNS_PROCESSED_BY_LANG.labels(lang).set(int(cnt))
+        except ValueError:
+            pass
+    for cls, cnt in (by_class or {}).items():
+        RUNS_FAILURES_BY_CLASS.labels(cls).set(int(cnt))
+    RUN_LATENCY.hists = hists
+    AUTOSCALE_RECOMMENDED.set(rec["recommended_workers"])
+    RUNS_ARRIVAL_RATE.set(rec["arrival_rate_per_sec"])
+
+_refresher: _Refresher | None = None
+_refresher_lock = threading.Lock()
+
+def _ensure_refresher(r, queue=None) -> _Refresher:
+    """Started by the first scrape, which also does one blocking refresh so it is not empty."""
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = _Refresher(r, queue=queue)
+            _refresher.refresh()
+            _refresher.start()
+        return _refresher
+
+# ---- Multiprocess mode (uvicorn/gunicorn with several workers) ----
+# prometheus_client switches every metric above to mmap files in this directory
+# when the variable is set before it is imported; /metrics then merges all files.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir")
+
+_LIVE_FILE = re.compile(r"^gauge_live\w+_(\d+)\.db$")
+
+def _pid_alive(pid: int) -> bool:
     try:
-        import redis
-        r = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
-        RUNS_QUEUE_DEPTH.set(r.llen(os.getenv("RUNS_QUEUE", "runs")))
-        RUNS_DLQ_DEPTH.set(r.llen(os.getenv("RUNS_DLQ", "runs:dead")))
-        total = int(r.get("metrics:runs_processed_total") or 0)
-        RUNS_PROCESSED_TOTAL.set(total)
-        # by-language hash: metrics:runs_processed_by_lang -> {py: 10, js: 2}
-        for lang, cnt in (r.hgetall("metrics:runs_processed_by_lang") or {}).items():
-            try:
-                RUNS_PROCESSED_BY_LANG.labels(lang).set(int(cnt))
-            except Exception:
-                pass
-    except Exception:
-        # Avoid breaking /metrics if Redis is unavailable
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
         pass
+    return True
+
+def mark_dead_processes(path: str | None = None) -> list[int]:
+    """Drop the live* gauge files of exited workers (uvicorn has no child_exit hook); counters stay."""
+    pids = set()
+    for name in os.listdir(path or MULTIPROC_DIR):
+        m = _LIVE_FILE.match(name)
+        if m and not _pid_alive(int(m.group(1))):
+            pids.add(int(m.group(1)))
+    for pid in pids:
+        multiprocess.mark_process_dead(pid, path or MULTIPROC_DIR)
+    return sorted(pids)
+
+def render() -> bytes:
+    """Exposition for this process, or for the whole process group in multiprocess mode."""
+    if not MULTIPROC_DIR:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, MULTIPROC_DIR)
+    registry.register(RUN_LATENCY)  # fleet-wide already (read from Redis), not per process
+    return generate_latest(registry)
 
-def install_observability(app: FastAPI) -> None:
-    app.add_middleware(RequestIdMiddleware)
-    app.add_middleware(MetricsMiddleware)
+def install_observability(app: FastAPI, r=None, queue=None) -> None:
+    """`r` / `queue`: the app's Redis client and run queue, which the metrics refresher shares."""
+    app.add_middleware(ObservabilityMiddleware)
+    if r is None:
+        import redis
+        r = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
 
     @app.get("/metrics")
     def _metrics() -> Response:
-        # Pull fresh queue/counter values before exposing
-        _refresh_runtime_gauges_from_redis()
-        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+        _ensure_refresher(r, queue).mark()
+        return Response(render(), media_type=CONTENT_TYPE_LATEST)
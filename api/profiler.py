@@ -0,0 +1,215 @@
+# api/profiler.py
+"""
+Sampling CPU profiler for the running API process (no redeploy, no extra deps).
+
+A daemon thread walks sys._current_frames() every `interval` seconds and
+counts identical stacks. Output is collapsed stacks (flamegraph.pl, speedscope,
+inferno: "thread;outer (file:line);inner (file:line) count") or a speedscope
+JSON document.
+
+  whole process   GET /v1/ops/profile?seconds=N          (api/routes/ops.py)
+  one request     X-Profile: 1 + X-Admin-Token on any request: the response
+                  carries X-Profile-Id, the profile is kept in Redis as
+                  profile:req:{id} for PROFILE_TTL_SEC and served by
+                  GET /v1/ops/profile/requests/{id}
+
+A request profile keeps the samples of the event-loop thread while this
+request's coroutine is on the stack, and of any thread running the matched
+endpoint (sync endpoints run in the threadpool; concurrent requests to the
+same sync endpoint are included too).
+"""
+from __future__ import annotations
+import os, re, sys, time, uuid, threading
+from collections import Counter
+from typing import Callable
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+INTERVAL_SEC = float(os.getenv("PROFILE_INTERVAL_MS", "10")) / 1000
+MAX_SEC = float(os.getenv("PROFILE_MAX_SEC", "60"))
+TTL_SEC = int(os.getenv("PROFILE_TTL_SEC", "3600"))
+MAX_REQUESTS = int(os.getenv("PROFILE_MAX_CONCURRENT_REQUESTS", "2"))
+FORMATS = ("collapsed", "speedscope")
+KEY_PREFIX = "profile:req:"
+
+Frame = tuple  # (function, file, line)
+Stacks = Counter  # tuple[Frame, ...] (outermost first) -> samples
+
+class ProfilerBusy(Exception):
+    pass
+
+_whole = threading.Lock()  # one process-wide profile at a time
+_requests = threading.BoundedSemaphore(max(1, MAX_REQUESTS))
+
+class Sampler(threading.Thread):
+    """Counts stacks until stop(); `select(thread_id, frame)` limits which threads are sampled."""
+
+    def __init__(self, interval: float = INTERVAL_SEC, select: Callable | None = None, skip: set[int] | None = None):
+        super().__init__(name="profiler", daemon=True)
+        self.interval, self.select, self.skip = max(0.001, interval), select, set(skip or ())
+        self.stacks: Stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self._labels: dict = {}
+
+    def _frame(self, code) -> Frame:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+        return label
+
+    def sample(self) -> None:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        self.samples += 1
+        for tid, frame in sys._current_frames().items():
+            if tid in self.skip or tid == self.ident or (self.select is not None and not self.select(tid, frame)):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame(frame.f_code))
+                frame = frame.f_back
+            stack.append((names.get(tid, f"thread-{tid}"), "", 0))
+            self.stacks[tuple(reversed(stack))] += 1
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self) -> Stacks:
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        return self.stacks
+
+def profile(seconds: float, interval: float = INTERVAL_SEC) -> Stacks:
+    """Every thread of this process (but the caller's) for `seconds`; ProfilerBusy if one is running."""
+    if not _whole.acquire(blocking=False):
+        raise ProfilerBusy("a profile is already running")
+    try:
+        s = Sampler(interval, skip={threading.get_ident()})
+        s.start()
+        time.sleep(max(0.0, min(seconds, MAX_SEC)))
+        return s.stop()
+    finally:
+        _whole.release()
+
+# ---- Output formats ----
+def _label(f: Frame) -> str:
+    return f[0] if not f[1] else f"{f[0]} ({f[1]}:{f[2]})"
+
+_LABEL = re.compile(r"^(.*) \((.*):(\d+)\)$")
+
+def collapsed(stacks: Stacks) -> str:
+    lines = (";".join(_label(f) for f in stack) + f" {n}" for stack, n in stacks.most_common())
+    return "\n".join(lines) + "\n" if stacks else ""
+
+def parse_collapsed(text: str) -> Stacks:
+    out: Stacks = Counter()
+    for line in text.splitlines():
+        stack, _, n = line.rpartition(" ")
+        if not stack or not n.isdigit():
+            continue
+        frames = []
+        for part in stack.split(";"):
+            m = _LABEL.match(part)
+            frames.append((m.group(1), m.group(2), int(m.group(3))) if m else (part, "", 0))
+        out[tuple(frames)] += int(n)
+    return out
+
+def speedscope(stacks: Stacks, name: str, interval: float = INTERVAL_SEC) -> dict:
+    """speedscope.app file format, one sampled profile weighted in seconds."""
+    index: dict[Frame, int] = {}
+    frames, samples, weights = [], [], []
+    for stack, n in stacks.most_common():
+        ids = []
+        for f in stack:
+            if f not in index:
+                index[f] = len(frames)
+                frames.append({"name": f[0], **({"file": f[1], "line": f[2]} if f[1] else {})})
+            ids.append(index[f])
+        samples.append(ids)
+        weights.append(round(n * interval, 6))
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name, "exporter": "scw-api", "activeProfileIndex": 0,
+        "shared": {"frames": frames},
+        "profiles": [{"type": "sampled", "name": name, "unit": "seconds", "startValue": 0,
+                      "endValue": round(sum(weights), 6), "samples": samples, "weights": weights}],
+    }
+
+# ---- Per-request profiles ----
+def _on_stack(frame, target) -> bool:
+    while frame is not None:
+        if frame is target:
+            return True
+        frame = frame.f_back
+    return False
+
+def _runs(frame, code) -> bool:
+    while frame is not None:
+        if frame.f_code is code:
+            return True
+        frame = frame.f_back
+    return False
+
+class ProfileMiddleware:
+    """
+    Profiles single requests sent with `X-Profile: 1` and a valid X-Admin-Token
+    (`authorize(token) -> bool`, the ops router's check) and hands the stacks to
+    `save(profile_id, stacks)`; everything else passes straight through.
+    """
+
+    def __init__(self, app: ASGIApp, authorize: Callable[[str | None], bool],
+                 save: Callable[[str, Stacks], None], interval: float = INTERVAL_SEC):
+        self.app, self.authorize, self.save, self.interval = app, authorize, save, interval
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if headers.get(b"x-profile", b"").lower() not in (b"1", b"true"):
+            await self.app(scope, receive, send)
+            return
+        token = headers.get(b"x-admin-token", b"").decode("latin-1") or None
+        if not self.authorize(token) or not _requests.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+        profile_id = uuid.uuid4().hex
+        here = sys._getframe()  # this request's coroutine frame, on the loop thread's stack while it runs
+
+        def select(tid: int, frame) -> bool:
+            endpoint = scope.get("endpoint")  # set by the router once matched
+            code = getattr(endpoint, "__code__", None)
+            return _on_stack(frame, here) or (code is not None and _runs(frame, code))
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["x-profile-id"] = profile_id
+            await send(message)
+
+        sampler = Sampler(self.interval, select=select)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # join + Redis write off the event loop
+            await run_in_threadpool(self._store, sampler, profile_id)
+
+    def _store(self, sampler: Sampler, profile_id: str) -> None:
+        try:
+            stacks = sampler.stop()
+            self.save(profile_id, stacks)
+        except Exception as e:
+            print(f"request profile {profile_id} not stored: {e!r}")
+        finally:
+            _requests.release()
+
+def save(r, profile_id: str, stacks: Stacks) -> None:
+    r.set(f"{KEY_PREFIX}{profile_id}", collapsed(stacks) or "\n", ex=TTL_SEC)
+
+def load(r, profile_id: str) -> Stacks | None:
+    text = r.get(f"{KEY_PREFIX}{profile_id}")
+    return None if text is None else parse_collapsed(text)
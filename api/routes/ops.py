@@ -5,6 +5,10 @@ from typing import Optional, Dict, Any
 
 import redis
 from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from api import profiler
+from runqueue import make_queue
 
 router = APIRouter(prefix="/v1/ops", tags=["ops"])
 
@@ -43,6 +47,9 @@ CFG_KEYS = [
     "CLOUDFLARE_ZONE_ID",
     "CLOUDFLARE_API_TOKEN",
     "MIN_REDEPLOY_INTERVAL_S",
+    "PROJECT_MAX_CONCURRENCY",  # default per-project limit; per-project: PROJECT_MAX_CONCURRENCY:{project_id}
+    "RUN_CPU_LIMIT_SEC",        # default run limits; per-project / per-language via /v1/ops/limits
+    "RUN_WALL_LIMIT_SEC",
 ]
 
 def _admin_token() -> str:
@@ -55,6 +62,14 @@ def _auth(token: Optional[str]):
     if not token or token != admin:
         raise HTTPException(status_code=403, detail="forbidden")
 
+def authorized(token: Optional[str]) -> bool:
+    """_auth as a predicate, for checks outside a route (api/profiler.py ProfileMiddleware)."""
+    try:
+        _auth(token)
+    except HTTPException:
+        return False
+    return True
+
 _last_call_at: Dict[str, float] = {}
 def _throttle(key: str):
     now = time.time()
@@ -190,6 +205,110 @@ def config_set(payload: Dict[str, str], x_admin_token: Optional[str] = Header(de
         changed[k] = "<set>" if v else None
     return {"ok": True, "changed": changed}
 
+# Per-project concurrency quotas (enforced by the worker, see worker/quota.py)
+def _quota(project_id: str) -> Dict[str, Any]:
+    own = r.get(f"config:PROJECT_MAX_CONCURRENCY:{project_id}")
+    limit = own if own is not None else get_cfg("PROJECT_MAX_CONCURRENCY", "0")
+    p = r.pipeline(transaction=False)
+    p.zcount(f"quota:leases:{project_id}", f"({time.time()}", "+inf")
+    p.llen(f"quota:held:{project_id}")
+    running, held = p.execute()
+    return {"project_id": project_id, "max_concurrency": int(limit or 0),
+            "override": own is not None, "running": int(running or 0), "held": int(held or 0)}
+
+@router.get("/quotas/{project_id}")
+def quota_get(project_id: str, x_admin_token: Optional[str] = Header(default=None, alias="X-Admin-Token")):
+    _auth(x_admin_token)
+    return {"ok": True, **_quota(project_id)}
+
+@router.post("/quotas/{project_id}")
+def quota_set(project_id: str, payload: Dict[str, Any], x_admin_token: Optional[str] = Header(default=None, alias="X-Admin-Token")):
+    """max_concurrency: runs of this project executing at once (0 = unlimited, null = back to the default)."""
+    _auth(x_admin_token)
+    value = (payload or {}).get("max_concurrency")
+    if value is not None:
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="max_concurrency must be an integer")
+        if value < 0:
+            raise HTTPException(status_code=400, detail="max_concurrency must be >= 0")
+    set_cfg(f"PROJECT_MAX_CONCURRENCY:{project_id}", None if value is None else str(value))
+    return {"ok": True, **_quota(project_id)}
+
+# Per-run CPU/wall limits (resolved by the worker, see worker/limits.py)
+LIMIT_KEYS = {"cpu_sec": "RUN_CPU_LIMIT_SEC", "wall_sec": "RUN_WALL_LIMIT_SEC"}
+
+def _limits(scope: str) -> Dict[str, Any]:
+    return {field: r.get(f"config:{name}:{scope}") for field, name in LIMIT_KEYS.items()}
+
+def _set_limits(scope: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    for field, name in LIMIT_KEYS.items():
+        if field not in (payload or {}):
+            continue
+        value = payload[field]
+        if value is not None:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail=f"{field} must be a number")
+            if value <= 0:
+                raise HTTPException(status_code=400, detail=f"{field} must be > 0")
+            value = str(int(value)) if field == "cpu_sec" else f"{value:g}"
+        set_cfg(f"{name}:{scope}", value)
+    defaults = {field: get_cfg(name) for field, name in LIMIT_KEYS.items()}
+    return {"ok": True, "scope": scope, "limits": _limits(scope), "defaults": defaults}
+
+@router.post("/limits/project/{project_id}")
+def limits_project(project_id: str, payload: Dict[str, Any], x_admin_token: Optional[str] = Header(default=None, alias="X-Admin-Token")):
+    """cpu_sec / wall_sec for this project's runs (null = back to the language/global default)."""
+    _auth(x_admin_token)
+    return _set_limits(project_id, payload)
+
+@router.post("/limits/language/{language}")
+def limits_language(language: str, payload: Dict[str, Any], x_admin_token: Optional[str] = Header(default=None, alias="X-Admin-Token")):
+    """cpu_sec / wall_sec for every run in `language` unless its project overrides them."""
+    _auth(x_admin_token)
+    return _set_limits(f"lang:{language.strip().lower()}", payload)
+
+# Sampling CPU profiler of this API process (see api/profiler.py)
+def _profile_response(stacks, fmt: str, name: str, interval: float):
+    if fmt == "speedscope":
+        return JSONResponse(profiler.speedscope(stacks, name, interval))
+    return PlainTextResponse(profiler.collapsed(stacks))
+
+def _profile_format(fmt: str) -> str:
+    fmt = fmt.strip().lower()
+    if fmt not in profiler.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(profiler.FORMATS)}")
+    return fmt
+
+@router.get("/profile")
+def profile(seconds: float = 10, interval_ms: float = 10, format: str = "collapsed",
+            x_admin_token: Optional[str] = Header(default=None, alias="X-Admin-Token")):
+    """Sample every thread of this API process for `seconds`; collapsed stacks or speedscope JSON."""
+    _auth(x_admin_token)
+    fmt = _profile_format(format)
+    if not 0 < seconds <= profiler.MAX_SEC:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {profiler.MAX_SEC:g}]")
+    interval = min(max(interval_ms, 1), 1000) / 1000
+    try:
+        stacks = profiler.profile(seconds, interval)
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _profile_response(stacks, fmt, f"scw-api pid {os.getpid()} {seconds:g}s", interval)
+
+@router.get("/profile/requests/{profile_id}")
+def profile_request(profile_id: str, format: str = "collapsed",
+                    x_admin_token: Optional[str] = Header(default=None, alias="X-Admin-Token")):
+    """Profile of one request sent with `X-Profile: 1` (its X-Profile-Id response header)."""
+    _auth(x_admin_token)
+    fmt = _profile_format(format)
+    stacks = profiler.load(r, profile_id)
+    if stacks is None:
+        raise HTTPException(status_code=404, detail="profile not found or expired")
+    return _profile_response(stacks, fmt, f"request {profile_id}", profiler.INTERVAL_SEC)
+
 # Cloudflare config helpers
 @router.post("/config/cloudflare/set")
 def cf_set(payload: Dict[str, str], x_admin_token: Optional[str] = Header(default=None, alias="X-Admin-Token")):
@@ -287,7 +406,9 @@ def worker_reset(payload: Dict[str, Any] | None = None, x_admin_token: Optional[
     """
     Safely reset worker state in Redis.
     - dry_run (bool): report-only
-    - purge_runs (bool): delete run queues + per-run logs/results
+    - purge_runs (bool): also delete the run-id set + per-run logs/results
+    The run queue (every key of the configured backend) and the quota holding
+    lists are always cleared.
     """
     _auth(x_admin_token)
     dry = bool((payload or {}).get("dry_run", False))
@@ -295,9 +416,15 @@ def worker_reset(payload: Dict[str, Any] | None = None, x_admin_token: Optional[
 
     summary = {"deleted": [], "kept": [], "notes": []}
 
-    queue_keys = ["runs"]
+    queue = make_queue(r)
+    queue_keys = queue.keys()
+    held_keys = sorted(r.scan_iter(match="quota:held:*", count=500))
+    if r.exists("quota:held"):
+        held_keys.append("quota:held")
     run_keys = []
     if purge_runs:
+        if r.exists("runs"):
+            run_keys.append("runs")
         cursor = 0
         while True:
             cursor, batch = r.scan(cursor=cursor, match="run:*", count=500)
@@ -305,18 +432,17 @@ def worker_reset(payload: Dict[str, Any] | None = None, x_admin_token: Optional[
             if cursor == 0:
                 break
 
-    targets = []
-    for k in queue_keys:
-        if r.exists(k):
-            targets.append(k)
-    targets.extend(run_keys)
-
+    targets = queue_keys + held_keys + run_keys
     summary["notes"].append(f"found {len(targets)} keys to remove")
 
     if dry:
         summary["deleted"] = targets
         return {"ok": True, "dry_run": True, "summary": summary}
 
+    if queue.name == "memory":
+        queue.purge()
+        summary["notes"].append("cleared the in-process queue")
+
     deleted = 0
     for k in targets:
         try:
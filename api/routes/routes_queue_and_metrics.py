@@ -1,32 +1,88 @@
 from fastapi import APIRouter
 import os, json, time, redis
 
+from runqueue import make_queue
+
 router = APIRouter()
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-QUEUE_KEY = os.getenv("RUNS_QUEUE_KEY", "queue:runs")
-KEY_PROCESSED = os.getenv("RUNS_PROCESSED_KEY", "metrics:runs:processed")
-KEY_FAILED    = os.getenv("RUNS_FAILED_KEY",    "metrics:runs:failed")
-KEY_HEARTBEAT = os.getenv("WORKER_HEARTBEAT_KEY","worker:heartbeat")
+# Counters written by worker/worker.py (incr_processed / incr_failed)
+KEY_PROCESSED = os.getenv("RUNS_PROCESSED_KEY", "metrics:runs_processed_total")
+KEY_FAILED    = os.getenv("RUNS_FAILED_KEY",    "metrics:runs_failed_total")
+KEY_COALESCED = os.getenv("RUNS_COALESCED_KEY", "metrics:runs_coalesced_total")
+KEY_FAILURES  = os.getenv("RUNS_FAILURES_KEY",  "metrics:runs_failures_by_class")
+# Hash: worker_id -> JSON stats, refreshed by worker/heartbeat.py
+KEY_HEARTBEAT = os.getenv("WORKER_HEARTBEAT_KEY","workers:heartbeat")
+HEARTBEAT_TTL = int(os.getenv("WORKER_HEARTBEAT_TTL_SEC", "30"))
 
 r = redis.from_url(REDIS_URL, decode_responses=True)
+queue = make_queue(r)  # RUNS_QUEUE_BACKEND / RUNS_QUEUE_KEY, same as api/main.py and the worker
 
 @router.post("/v1/ops/queue/test")
 def queue_test():
     payload = {"task":"test", "ts": int(time.time())}
-    r.lpush(QUEUE_KEY, json.dumps(payload))
-    return {"queued": True, "key": QUEUE_KEY, "payload": payload}
+    queue.enqueue(json.dumps(payload))
+    return {"queued": True, "key": queue.key, "payload": payload}
+
+def live_workers(client=None) -> dict:
+    """
+    One HGETALL over the heartbeat hash; expired entries are dropped (and pruned).
+    `client`: the caller's Redis client (this module's by default).
+    """
+    client = client or r
+    now = time.time()
+    live, expired = {}, []
+    for wid, raw in (client.hgetall(KEY_HEARTBEAT) or {}).items():
+        try:
+            hb = json.loads(raw)
+            ts = float(hb.get("ts", 0))
+        except Exception:
+            expired.append(wid)
+            continue
+        if now - ts > HEARTBEAT_TTL:
+            expired.append(wid)
+        else:
+            live[wid] = hb
+    if expired:
+        try:
+            client.hdel(KEY_HEARTBEAT, *expired)
+        except Exception:
+            pass
+    return live
+
+def aggregate_workers(live: dict) -> dict:
+    jobs = sum(int(w.get("jobs_in_window") or 0) for w in live.values())
+    slots = sum(int(w.get("slots") or 1) for w in live.values())
+    busy = sum(int(w.get("busy") or 0) for w in live.values())
+    # Execution time weighted by how many jobs each worker finished
+    weighted = sum((w.get("avg_exec_sec") or 0) * int(w.get("jobs_in_window") or 0) for w in live.values())
+    util = sum((w.get("utilisation") or 0) * int(w.get("slots") or 1) for w in live.values())
+    return {
+        "live": len(live),
+        "slots": slots,
+        "busy": busy,
+        "jobs_per_sec": round(sum(w.get("jobs_per_sec") or 0 for w in live.values()), 4),
+        "avg_exec_sec": round(weighted / jobs, 4) if jobs else None,
+        "utilisation": round(util / slots, 4) if slots else None,
+    }
 
 @router.get("/v1/ops/metrics")
 def metrics():
     processed = int(r.get(KEY_PROCESSED) or 0)
     failed    = int(r.get(KEY_FAILED) or 0)
-    hb        = int(r.get(KEY_HEARTBEAT) or 0)
+    coalesced = int(r.get(KEY_COALESCED) or 0)
+    failures  = {k: int(v) for k, v in (r.hgetall(KEY_FAILURES) or {}).items()}
+    live      = live_workers()
+    hb        = int(max((w.get("ts", 0) for w in live.values()), default=0))
     age       = int(time.time()) - hb if hb else None
     return {
-        "queue_key": QUEUE_KEY,
+        "queue_key": queue.key,
         "processed": processed,
         "failed": failed,
+        "coalesced": coalesced,
+        "failures_by_class": failures,
         "worker_heartbeat_ts": hb,
-        "worker_heartbeat_age_sec": age
+        "worker_heartbeat_age_sec": age,
+        "workers": aggregate_workers(live),
+        "workers_live": live,
     }
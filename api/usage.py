@@ -0,0 +1,49 @@
+# api/usage.py
+"""
+Per-project resource rollup written by the worker (worker/usage.py).
+
+  usage:{day}:p:{project}   hash  executions, timeouts, cpu_time, wall_time
+  usage:{day}:peak_rss_kb   zset  project -> highest max_rss_kb of one execution
+  usage:{day}:projects      set   projects with usage that day
+"""
+from __future__ import annotations
+import time
+from typing import Any, Dict, List
+
+PREFIX = "usage:"
+
+def days(n: int, now: float | None = None) -> List[str]:
+    """The last n UTC days, today first."""
+    now = time.time() if now is None else now
+    return [time.strftime("%Y-%m-%d", time.gmtime(now - i * 86400)) for i in range(max(1, n))]
+
+def rollup(r, n_days: int = 1, top: int = 50, now: float | None = None) -> List[Dict[str, Any]]:
+    """Projects by cpu_time over the last n_days, heaviest first; two pipelined round trips."""
+    ds = days(n_days, now)
+    p = r.pipeline(transaction=False)
+    for d in ds:
+        p.smembers(f"{PREFIX}{d}:projects")
+        p.zrange(f"{PREFIX}{d}:peak_rss_kb", 0, -1, withscores=True)
+    res = p.execute()
+    members = [(d, sorted(res[2 * i] or [])) for i, d in enumerate(ds)]
+    peaks: Dict[str, int] = {}
+    for scores in res[1::2]:
+        for project, kb in scores or []:
+            peaks[project] = max(peaks.get(project, 0), int(kb))
+    p = r.pipeline(transaction=False)
+    for d, projects in members:
+        for project in projects:
+            p.hgetall(f"{PREFIX}{d}:p:{project}")
+    out: Dict[str, Dict[str, Any]] = {}
+    flat = [project for _, projects in members for project in projects]
+    for project, fields in zip(flat, p.execute() if flat else []):
+        e = out.setdefault(project, {"project_id": project, "executions": 0, "timeouts": 0,
+                                     "cpu_time": 0.0, "wall_time": 0.0, "peak_rss_kb": peaks.get(project)})
+        e["executions"] += int(fields.get("executions") or 0)
+        e["timeouts"] += int(fields.get("timeouts") or 0)
+        e["cpu_time"] += float(fields.get("cpu_time") or 0)
+        e["wall_time"] += float(fields.get("wall_time") or 0)
+    rows = sorted(out.values(), key=lambda e: (-e["cpu_time"], -e["wall_time"]))[:max(1, top)]
+    for e in rows:
+        e["cpu_time"], e["wall_time"] = round(e["cpu_time"], 3), round(e["wall_time"], 3)
+    return rows
@@ -0,0 +1,39 @@
+# blobstore/__init__.py
+"""
+Blob storage for large run results, shared by the worker (writer) and the API (reader).
+
+  BLOB_STORE=none   (default) everything stays in Redis
+  BLOB_STORE=local  files under BLOB_DIR, sharded by key hash; the directory
+                    must be shared by the API and the workers (one volume)
+
+Redis keeps only a reference ("local:ab/cd/<digest>") on the run hash. Other
+backends (e.g. S3-compatible) implement blobstore.base.BlobStore and register
+in make_store().
+"""
+from __future__ import annotations
+import os
+
+from blobstore.base import BlobStore, BlobWriter, BLOCK_BYTES
+from blobstore.local import LocalBlobStore
+
+BACKEND = os.getenv("BLOB_STORE", "none").strip().lower()
+THRESHOLD_BYTES = int(os.getenv("BLOB_THRESHOLD_BYTES", str(64 * 1024)))
+
+def make_store(backend: str | None = None) -> BlobStore | None:
+    """Store for the configured backend; None when offloading is off."""
+    backend = backend or BACKEND
+    if backend in ("", "none"):
+        return None
+    if backend == "local":
+        return LocalBlobStore()
+    raise ValueError(f"unknown BLOB_STORE {backend!r} (expected none or local)")
+
+def store_for(ref: str, default: BlobStore | None = None) -> BlobStore:
+    """The store a reference was written to (the API may be configured with none)."""
+    name = ref.split(":", 1)[0]
+    if default is not None and default.name == name:
+        return default
+    return make_store(name)
+
+__all__ = ["BlobStore", "BlobWriter", "LocalBlobStore", "make_store", "store_for", "BACKEND",
+           "THRESHOLD_BYTES", "BLOCK_BYTES"]
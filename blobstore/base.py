@@ -0,0 +1,34 @@
+# blobstore/base.py
+from __future__ import annotations
+from typing import Iterator
+
+BLOCK_BYTES = 64 * 1024  # read size when streaming a blob back
+
+class BlobWriter:
+    """Append-only; nothing is visible under the key until commit()."""
+
+    def write(self, data: bytes | str) -> None:
+        raise NotImplementedError
+
+    def commit(self) -> str:
+        """Publish the blob; returns its reference ("<store>:<path>")."""
+        raise NotImplementedError
+
+    def abort(self) -> None:
+        raise NotImplementedError
+
+class BlobStore:
+    name = "base"
+
+    def writer(self, key: str) -> BlobWriter:
+        raise NotImplementedError
+
+    def open(self, ref: str, offset: int = 0, block: int = BLOCK_BYTES) -> Iterator[bytes]:
+        """The blob from `offset` on, `block` bytes at a time (never all of it at once)."""
+        raise NotImplementedError
+
+    def size(self, ref: str) -> int:
+        raise NotImplementedError
+
+    def delete(self, ref: str) -> None:
+        raise NotImplementedError
@@ -0,0 +1,79 @@
+# blobstore/local.py
+"""
+Local-filesystem blobs: BLOB_DIR/ab/cd/<first 128 bits of sha256(key), hex>.
+
+The reference ("local:ab/cd/<32 hex>", 44 bytes) fits a compact run hash value.
+
+Writers fill a temp file next to the target and os.replace() it on commit,
+so readers only ever see complete blobs and a rewrite (retry) is atomic.
+"""
+from __future__ import annotations
+import os, hashlib, tempfile
+from typing import Iterator
+
+from blobstore.base import BlobStore, BlobWriter, BLOCK_BYTES
+
+BLOB_DIR = os.getenv("BLOB_DIR", "/data/blobs")
+
+class _LocalWriter(BlobWriter):
+    def __init__(self, store: "LocalBlobStore", rel: str):
+        self.store, self.rel = store, rel
+        path = store.path(rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        self.f = os.fdopen(fd, "wb")
+
+    def write(self, data: bytes | str) -> None:
+        self.f.write(data.encode("utf-8", "replace") if isinstance(data, str) else data)
+
+    def commit(self) -> str:
+        self.f.close()
+        os.replace(self.tmp, self.store.path(self.rel))
+        return f"{self.store.name}:{self.rel}"
+
+    def abort(self) -> None:
+        self.f.close()
+        try:
+            os.unlink(self.tmp)
+        except FileNotFoundError:
+            pass
+
+class LocalBlobStore(BlobStore):
+    name = "local"
+
+    def __init__(self, root: str = BLOB_DIR):
+        self.root = root
+
+    def path(self, rel: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, rel))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"blob path escapes {self.root}: {rel!r}")
+        return path
+
+    def _rel(self, ref: str) -> str:
+        name, _, rel = ref.partition(":")
+        if name != self.name or not rel:
+            raise ValueError(f"not a {self.name} blob reference: {ref!r}")
+        return rel
+
+    def writer(self, key: str) -> BlobWriter:
+        digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+        return _LocalWriter(self, f"{digest[:2]}/{digest[2:4]}/{digest}")
+
+    def open(self, ref: str, offset: int = 0, block: int = BLOCK_BYTES) -> Iterator[bytes]:
+        with open(self.path(self._rel(ref)), "rb") as f:
+            f.seek(max(0, offset))
+            while True:
+                data = f.read(block)
+                if not data:
+                    return
+                yield data
+
+    def size(self, ref: str) -> int:
+        return os.path.getsize(self.path(self._rel(ref)))
+
+    def delete(self, ref: str) -> None:
+        try:
+            os.unlink(self.path(self._rel(ref)))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,139 @@
+# records/__init__.py
+"""
+Compact run / project hashes, shared by the API and the worker.
+
+  run:{id}       p project_id   l language     s status       c created_at (ms)
+                 u updated_at (ms)   cpu / rss / wall usage   fc failure_class
+                 err error (first ERROR_MAX_BYTES)   ll log_lines
+                 cw coalesced_with   rr result_ref   rb result_bytes
+  project:{id}   n name   c created_at (ms)
+
+The id lives in the key only. Timestamps are integer milliseconds, which a
+listpack stores as one 64-bit integer instead of a 17-byte float string.
+Every value stays under hash-max-listpack-value (64 bytes; the API also caps
+name / language length, and the encoders clip them in bytes), so Redis keeps
+each record in its compact listpack encoding rather than a hashtable.
+
+Readers go through decode_run / decode_project, which also accept the old
+long-name records; migrate() (scripts/migrate_records.py) rewrites those in
+place without clobbering fields a worker has already written compactly.
+"""
+from __future__ import annotations
+import time
+
+RUN_FIELDS = {
+    "project_id": "p", "language": "l", "status": "s", "created_at": "c", "updated_at": "u",
+    "cpu_time": "cpu", "max_rss_kb": "rss", "wall_time": "wall", "failure_class": "fc", "error": "err",
+    "log_lines": "ll", "coalesced_with": "cw", "result_ref": "rr", "result_bytes": "rb",
+}
+PROJECT_FIELDS = {"name": "n", "created_at": "c"}
+TIMESTAMPS = ("created_at", "updated_at")
+# Old records repeated the id from their key
+REDUNDANT = {"run": "run_id", "project": "project_id"}
+ERROR_MAX_BYTES = 60  # the full message is in the run log and the DLQ entry
+VALUE_MAX_BYTES = 64  # hash-max-listpack-value: client-supplied text is clipped to it
+# Free-text fields and their byte caps; everything else is ids, numbers and refs we generate
+CLIPPED = {"error": ERROR_MAX_BYTES, "name": VALUE_MAX_BYTES, "language": VALUE_MAX_BYTES}
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+def _clip(text: str, limit: int) -> str:
+    data = str(text).encode("utf-8")
+    return text if len(data) <= limit else data[:limit].decode("utf-8", "ignore")
+
+def _encode(fields: dict, names: dict) -> dict:
+    out = {}
+    for k, v in fields.items():
+        if k in CLIPPED and v is not None:
+            v = _clip(v, CLIPPED[k])
+        out[names.get(k, k)] = v
+    return out
+
+def encode_run(fields: dict) -> dict:
+    """Long field names -> compact mapping for HSET (timestamps as now_ms() ints)."""
+    return _encode(fields, RUN_FIELDS)
+
+def encode_project(fields: dict) -> dict:
+    return _encode(fields, PROJECT_FIELDS)
+
+def _seconds(v) -> float | None:
+    try:
+        return int(v) / 1000
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(v)  # legacy float seconds
+    except (TypeError, ValueError):
+        return None
+
+def _decode(data: dict, names: dict) -> dict:
+    out = dict(data)
+    for long, short in names.items():
+        if short in data:
+            out[long] = out.pop(short)  # compact wins over a leftover legacy field
+    for k in TIMESTAMPS:
+        if k in out:
+            out[k] = _seconds(out[k])
+    return out
+
+def decode_run(data: dict) -> dict:
+    """HGETALL of run:{id} (either schema) -> long names, timestamps as float seconds."""
+    return _decode(data, RUN_FIELDS)
+
+def decode_project(data: dict) -> dict:
+    return _decode(data, PROJECT_FIELDS)
+
+def run_field_names(*names: str) -> list[str]:
+    """HMGET fields for `names` in both schemas (compact first); pair with pick_run()."""
+    return [RUN_FIELDS[n] for n in names] + list(names)
+
+def pick_run(names: tuple[str, ...] | list[str], values: list) -> list:
+    """Values of an HMGET over run_field_names(*names): compact if set, else legacy."""
+    n = len(names)
+    return [values[i] if values[i] is not None else values[n + i] for i in range(n)]
+
+# KEYS: hash   ARGV: error max bytes, then (long, short, kind) triples; kind t=timestamp e=error x=drop
+_MIGRATE_LUA = """
+local moved, cap = 0, tonumber(ARGV[1])
+for i = 2, #ARGV, 3 do
+  local long, short, kind = ARGV[i], ARGV[i + 1], ARGV[i + 2]
+  local v = redis.call('HGET', KEYS[1], long)
+  if v then
+    if kind ~= 'x' and redis.call('HEXISTS', KEYS[1], short) == 0 then
+      if kind == 't' then
+        local n = tonumber(v)
+        v = n and string.format('%d', math.floor(n * 1000 + 0.5))
+      elseif kind == 'e' and #v > cap then
+        local j = cap
+        -- never cut a UTF-8 sequence in half
+        while j > 0 and string.byte(v, j + 1) and string.byte(v, j + 1) >= 128 and string.byte(v, j + 1) < 192 do j = j - 1 end
+        v = string.sub(v, 1, j)
+      end
+      if v then redis.call('HSET', KEYS[1], short, v) end
+    end
+    redis.call('HDEL', KEYS[1], long)
+    moved = moved + 1
+  end
+end
+return moved
+"""
+
+def _migrate_args(kind: str) -> list:
+    names = RUN_FIELDS if kind == "run" else PROJECT_FIELDS
+    args: list = [ERROR_MAX_BYTES]
+    for long, short in names.items():
+        args += [long, short, "t" if long in TIMESTAMPS else "e" if long == "error" else "s"]
+    return args + [REDUNDANT[kind], "", "x"]
+
+def migrate(r, keys: list[str], kind: str = "run") -> int:
+    """Rewrite legacy records to the compact schema, atomically per key (idempotent); fields moved."""
+    script = r.register_script(_MIGRATE_LUA)
+    args = _migrate_args(kind)
+    p = r.pipeline(transaction=False)
+    for key in keys:
+        script(keys=[key], args=args, client=p)
+    return sum(int(n or 0) for n in p.execute())
+
+__all__ = ["RUN_FIELDS", "PROJECT_FIELDS", "ERROR_MAX_BYTES", "now_ms", "encode_run", "encode_project",
+           "decode_run", "decode_project", "run_field_names", "pick_run", "migrate"]
@@ -0,0 +1,37 @@
+# runqueue/__init__.py
+"""
+Run queue backends shared by the API (producer) and the worker (consumer).
+
+  RUNS_QUEUE_BACKEND=list    (default) Redis list RUNS_QUEUE_KEY: LPUSH / BRPOP
+  RUNS_QUEUE_BACKEND=stream  Redis stream RUNS_STREAM read through a consumer
+                             group: XREADGROUP / XACK / XAUTOCLAIM, MAXLEN-trimmed
+  RUNS_QUEUE_BACKEND=fair    per-project Redis lists served round-robin (weighted) by a Lua script
+  RUNS_QUEUE_BACKEND=memory  in-process (API and worker in one process; tests, benchmarks)
+
+Every backend implements runqueue.base.Queue.
+"""
+from __future__ import annotations
+import os
+
+from runqueue.base import Job, Queue
+from runqueue.memory import MemoryQueue
+from runqueue.redis_fair import FairQueue
+from runqueue.redis_list import ListQueue
+from runqueue.redis_stream import StreamQueue
+
+BACKEND = os.getenv("RUNS_QUEUE_BACKEND", "list").strip().lower()
+
+def make_queue(r, backend: str | None = None, consumer: str | None = None) -> Queue:
+    """Queue for the configured backend. `consumer` names this worker in the stream group."""
+    backend = (backend or BACKEND)
+    if backend == "list":
+        return ListQueue(r)
+    if backend == "stream":
+        return StreamQueue(r, consumer=consumer)
+    if backend == "fair":
+        return FairQueue(r)
+    if backend == "memory":
+        return MemoryQueue.named()
+    raise ValueError(f"unknown RUNS_QUEUE_BACKEND {backend!r} (expected list, stream, fair or memory)")
+
+__all__ = ["Job", "Queue", "ListQueue", "StreamQueue", "FairQueue", "MemoryQueue", "make_queue", "BACKEND"]
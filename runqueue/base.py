@@ -0,0 +1,73 @@
+# runqueue/base.py
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Iterable
+
+@dataclass
+class Job:
+    """
+    One dequeued payload. `id` is the backend's delivery id (None for list
+    queues); `deliveries` counts handovers of this entry to a consumer, where
+    the backend tracks them (streams), so a crash-looping entry can be dropped.
+    """
+    data: str
+    id: str | None = None
+    deliveries: int = 1
+
+class Queue:
+    """
+    What the API and worker need from a run queue.
+
+    Writes take an optional `w`: a Redis pipeline or the worker's Deferred
+    recorder, so queue ops ship in the same round trip as a run's status
+    writes. Backends that do not live in Redis apply them once `w` is flushed.
+    """
+    name = "base"
+    key = ""
+
+    def enqueue(self, data: str, w=None) -> None:
+        self.enqueue_many([data], w)
+
+    def enqueue_many(self, items: Iterable[str], w=None) -> None:
+        raise NotImplementedError
+
+    def dequeue_blocking(self, n: int = 1, timeout: float = 0,
+                         with_depth: bool = False) -> tuple[list[Job], int | None]:
+        """
+        Up to n jobs, waiting at most `timeout` seconds for the first one
+        (0 = return immediately). The depth afterwards is included when
+        `with_depth`, in the same round trip where the backend allows it.
+        """
+        raise NotImplementedError
+
+    def ack(self, job: Job, w=None) -> None:
+        """The job is finished (succeeded, failed for good, or dead-lettered)."""
+
+    def renew(self) -> None:
+        """Mark this consumer's unacknowledged jobs as alive; called from the heartbeat."""
+
+    def abandon(self, job: Job) -> None:
+        """Stop renewing a job that will never be acked here, so another consumer can reclaim it."""
+
+    def nack(self, job: Job, data: str | None = None, w=None) -> None:
+        """Hand the job back for another attempt, optionally with an updated payload."""
+        self.enqueue(job.data if data is None else data, w)
+        self.ack(job, w)
+
+    def depth(self) -> int:
+        raise NotImplementedError
+
+    def keys(self) -> list[str]:
+        """Redis keys currently holding this queue's jobs (ops reset / inspection)."""
+        return []
+
+    def purge(self) -> list[str]:
+        """Drop every queued and in-flight job. Returns the keys removed."""
+        keys = self.keys()
+        if keys:
+            self.r.delete(*keys)
+        return keys
+
+    def stats(self) -> dict:
+        n = self.depth()
+        return {"backend": self.name, "key": self.key, "depth": n, "length": n}
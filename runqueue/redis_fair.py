@@ -0,0 +1,179 @@
+# runqueue/redis_fair.py
+"""
+Fair queueing across projects (RUNS_QUEUE_BACKEND=fair).
+
+  {key}:p:{project}   per-project list (LPUSH / RPOP, FIFO within a project)
+  {key}:active        ring of projects with queued runs; the tail is the project being served
+  {key}:active:set    membership of the ring, so a project is in it at most once
+  {key}:credit        hash project -> runs served in its current turn
+  {key}:weights       hash project -> runs per turn (default 1); weighted round-robin
+  {key}:signal        wake-up tokens for idle workers (Lua cannot block)
+  {key}:total         runs queued across all projects, kept by both scripts
+
+Enqueue and dequeue are single Lua scripts, so concurrent workers never serve
+the same project turn twice or lose a ring entry. A project dumping 10k runs
+gets one turn (of `weight` runs) per cycle like everyone else. The dequeue
+script returns the running total, so a batching worker's depth reading costs
+nothing extra.
+"""
+from __future__ import annotations
+import os, json
+from typing import Iterable
+
+from runqueue.base import Job, Queue
+from runqueue.redis_list import RUNS_QUEUE
+
+SIGNAL_CAP = 64          # at most this many idle workers are woken per burst
+DEFAULT_PROJECT = "_none"
+PROJECTS_SHOWN = int(os.getenv("RUNS_FAIR_PROJECTS_SHOWN", "50"))
+
+# KEYS: project list, ring, ring set, signal, total   ARGV: project, cap, payload...
+_ENQUEUE_LUA = """
+for i = 3, #ARGV do redis.call('LPUSH', KEYS[1], ARGV[i]) end
+if redis.call('SADD', KEYS[3], ARGV[1]) == 1 then redis.call('LPUSH', KEYS[2], ARGV[1]) end
+redis.call('INCRBY', KEYS[5], #ARGV - 2)
+redis.call('LPUSH', KEYS[4], '1')
+redis.call('LTRIM', KEYS[4], 0, tonumber(ARGV[2]) - 1)
+return 1
+"""
+
+# KEYS: ring, ring set, credit, weights, total, then one list per candidate project
+# ARGV: n, then the candidate projects (same order as their lists)
+# Every key is declared (Redis Cluster, key-pattern ACLs): the caller passes the
+# ring's tail as candidates, and serving stops at the first project not among
+# them (the ring moved since it was read); the caller simply asks again.
+_DEQUEUE_LUA = """
+local out, n = {}, tonumber(ARGV[1])
+local lists = {}
+for i = 2, #ARGV do lists[ARGV[i]] = KEYS[i + 4] end
+local guard = redis.call('LLEN', KEYS[1]) + n
+while #out < n and guard > 0 do
+  guard = guard - 1
+  local p = redis.call('LINDEX', KEYS[1], -1)
+  if not p then break end
+  local q = lists[p]
+  if not q then break end
+  local item = redis.call('RPOP', q)
+  if item then
+    table.insert(out, item)
+    local credit = redis.call('HINCRBY', KEYS[3], p, 1)
+    local weight = tonumber(redis.call('HGET', KEYS[4], p) or '1') or 1
+    if redis.call('LLEN', q) == 0 then
+      redis.call('RPOP', KEYS[1]); redis.call('SREM', KEYS[2], p); redis.call('HDEL', KEYS[3], p)
+    elseif credit >= weight then
+      redis.call('HDEL', KEYS[3], p)
+      redis.call('RPOPLPUSH', KEYS[1], KEYS[1])
+    end
+  else
+    redis.call('RPOP', KEYS[1]); redis.call('SREM', KEYS[2], p); redis.call('HDEL', KEYS[3], p)
+  end
+end
+local total = redis.call('DECRBY', KEYS[5], #out)
+if total < 0 or redis.call('LLEN', KEYS[1]) == 0 then
+  -- Drained, or runs queued before the counter existed: resynchronise at 0
+  total = 0
+  redis.call('SET', KEYS[5], 0)
+end
+return {out, total}
+"""
+
+class FairQueue(Queue):
+    name = "fair"
+
+    def __init__(self, r, key: str = RUNS_QUEUE):
+        self.r, self.key = r, key
+        self.prefix = f"{key}:p:"
+        self.ring, self.ring_set = f"{key}:active", f"{key}:active:set"
+        self.credit, self.weights, self.signal = f"{key}:credit", f"{key}:weights", f"{key}:signal"
+        self.total = f"{key}:total"
+        self._enqueue = r.register_script(_ENQUEUE_LUA)
+        self._dequeue = r.register_script(_DEQUEUE_LUA)
+
+    @staticmethod
+    def project_of(data: str) -> str:
+        try:
+            return str(json.loads(data).get("project_id") or DEFAULT_PROJECT)
+        except Exception:
+            return DEFAULT_PROJECT  # still delivered; the worker dead-letters bad JSON
+
+    def enqueue_many(self, items: Iterable[str], w=None) -> None:
+        by_project: dict[str, list[str]] = {}
+        for data in items:
+            by_project.setdefault(self.project_of(data), []).append(data)
+        if not by_project:
+            return
+        p = self.r.pipeline(transaction=False) if w is None else None
+        for project, datas in by_project.items():
+            keys = [self.prefix + project, self.ring, self.ring_set, self.signal, self.total]
+            args = [project, SIGNAL_CAP, *datas]
+            if p is not None:
+                self._enqueue(keys=keys, args=args, client=p)
+            else:
+                # Deferred recorders replay plain commands; EVAL carries the script itself
+                w.eval(_ENQUEUE_LUA, len(keys), *keys, *args)
+        if p is not None:
+            p.execute()
+
+    def _take(self, n: int) -> tuple[list[Job], int]:
+        jobs, total = [], 0
+        for _ in range(3):  # comes back short only if the ring moved since we read it, or ran dry
+            want = max(1, n) - len(jobs)
+            # The ring's tail, next-served first: the only projects the script may touch
+            projects = list(dict.fromkeys(reversed(self.r.lrange(self.ring, -want, -1) or [])))
+            if not projects:
+                break
+            keys = [self.ring, self.ring_set, self.credit, self.weights, self.total]
+            items, total = self._dequeue(keys=keys + [self.prefix + p for p in projects], args=[want, *projects])
+            jobs.extend(Job(data) for data in items)
+            total = int(total)
+            if len(jobs) >= max(1, n) or not total:
+                break
+        return jobs, total
+
+    def dequeue_blocking(self, n: int = 1, timeout: float = 0,
+                         with_depth: bool = False) -> tuple[list[Job], int | None]:
+        """The depth is the script's running total, not a scan of every project's list."""
+        jobs, total = self._take(n)
+        if not jobs and timeout:
+            # Sleep until an enqueue drops a token (or the timeout), then try once more
+            self.r.brpop(self.signal, timeout=max(1, int(timeout)))
+            jobs, total = self._take(n)
+        return jobs, (total if with_depth else None)
+
+    def set_weight(self, project: str, weight: int | None) -> None:
+        """Runs served per turn for `project`; None/1 restores the default."""
+        if not weight or weight == 1:
+            self.r.hdel(self.weights, project)
+        else:
+            self.r.hset(self.weights, project, int(weight))
+
+    def depth_by_project(self) -> dict[str, int]:
+        projects = sorted(self.r.smembers(self.ring_set) or [])
+        if not projects:
+            return {}
+        p = self.r.pipeline(transaction=False)
+        for project in projects:
+            p.llen(self.prefix + project)
+        return {project: int(n or 0) for project, n in zip(projects, p.execute())}
+
+    def depth(self) -> int:
+        return sum(self.depth_by_project().values())
+
+    def keys(self) -> list[str]:
+        """Everything but the weights, which are configuration rather than queued work."""
+        keys = sorted(self.r.scan_iter(match=f"{self.prefix}*", count=500))
+        state = (self.ring, self.ring_set, self.credit, self.signal, self.total)
+        return keys + [k for k in state if self.r.exists(k)]
+
+    def stats(self) -> dict:
+        by_project = self.depth_by_project()
+        total = sum(by_project.values())
+        top = sorted(by_project.items(), key=lambda kv: -kv[1])[:PROJECTS_SHOWN]
+        return {
+            "backend": self.name,
+            "key": self.key,
+            "depth": total,
+            "length": total,
+            "active_projects": len(by_project),
+            "projects": dict(top),
+        }
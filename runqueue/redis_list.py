@@ -0,0 +1,118 @@
+# runqueue/redis_list.py
+"""
+Plain Redis lists: producers LPUSH, consumers (B)RPOP. No delivery tracking.
+
+Language routing (optional):
+  RUNS_LANGUAGES=python,node   these languages get their own list {key}:lang:{language};
+                               everything else goes to the catch-all list {key}
+  WORKER_LANGUAGES=python,node a worker pops only those lists, with one multi-key
+                               BRPOP (LMPOP for batches); add "*" to also take the
+                               catch-all. Unset: every list, catch-all last. Every
+                               language listed must also be in RUNS_LANGUAGES.
+"""
+from __future__ import annotations
+import os, json
+from typing import Iterable
+
+from runqueue.base import Job, Queue
+
+# RUNS_QUEUE_KEY is what ops tooling and CI already set; RUNS_QUEUE is the older worker name
+RUNS_QUEUE = os.getenv("RUNS_QUEUE_KEY") or os.getenv("RUNS_QUEUE") or "queue:runs"
+CATCH_ALL = "*"
+
+def _languages(value: str | None) -> list[str]:
+    return [s.strip().lower() for s in (value or "").split(",") if s.strip()]
+
+ROUTED_LANGUAGES = _languages(os.getenv("RUNS_LANGUAGES"))
+WORKER_LANGUAGES = _languages(os.getenv("WORKER_LANGUAGES"))
+
+class ListQueue(Queue):
+    name = "list"
+
+    def __init__(self, r, key: str = RUNS_QUEUE, languages: list[str] | None = None,
+                 consume: list[str] | None = None):
+        self.r, self.key = r, key
+        self.languages = list(ROUTED_LANGUAGES if languages is None else languages)
+        consume = list(WORKER_LANGUAGES if consume is None else consume)
+        # Pop order: dedicated lists first, the catch-all last
+        consume = consume or [*self.languages, CATCH_ALL]
+        # Named directly, not through lang_key: an unrouted language must not fall back to the catch-all
+        keys = [f"{key}:lang:{lang}" for lang in consume if lang != CATCH_ALL]
+        if CATCH_ALL in consume:
+            keys.append(self.key)
+        self.consume_keys = list(dict.fromkeys(keys))
+        self.unrouted = [lang for lang in dict.fromkeys(consume) if lang != CATCH_ALL and lang not in self.languages]
+
+    def lang_key(self, language: str | None) -> str:
+        language = (language or "").strip().lower()
+        return f"{self.key}:lang:{language}" if language in self.languages else self.key
+
+    def route(self, data: str) -> str:
+        if not self.languages:
+            return self.key
+        try:
+            return self.lang_key(json.loads(data).get("language"))
+        except Exception:
+            return self.key  # the worker dead-letters bad JSON from the catch-all
+
+    def enqueue_many(self, items: Iterable[str], w=None) -> None:
+        by_key: dict[str, list[str]] = {}
+        for data in items:
+            by_key.setdefault(self.route(data), []).append(data)
+        for key, datas in by_key.items():
+            (w or self.r).lpush(key, *datas)
+
+    def dequeue_blocking(self, n: int = 1, timeout: float = 0,
+                         with_depth: bool = False) -> tuple[list[Job], int | None]:
+        """
+        n > 1: one RPOP count / LMPOP (never blocks). Otherwise BRPOP over every
+        consumed list when timeout, plain RPOP / LMPOP when not. The depth rides
+        in the same pipeline.
+        """
+        keys = self.consume_keys
+        p = self.r.pipeline(transaction=False)
+        if timeout and n <= 1:
+            p.brpop(keys, timeout=max(1, int(timeout)))
+        elif len(keys) == 1:
+            p.rpop(keys[0], max(1, n))
+        else:
+            p.lmpop(len(keys), *keys, direction="RIGHT", count=max(1, n))
+        if with_depth:
+            for key in keys:
+                p.llen(key)
+        out = p.execute()
+        res = out[0]
+        if not res:
+            items = []
+        elif timeout and n <= 1:
+            items = [res[1]]              # BRPOP: (key, value)
+        elif len(keys) == 1:
+            items = res                   # RPOP count: [values]
+        else:
+            items = res[1]                # LMPOP: [key, [values]]
+        depth = sum(int(x or 0) for x in out[1:]) if with_depth else None
+        return [Job(data) for data in items], depth
+
+    def depth_by_language(self) -> dict[str, int]:
+        keys = {lang: self.lang_key(lang) for lang in self.languages}
+        keys[CATCH_ALL] = self.key
+        p = self.r.pipeline(transaction=False)
+        for key in keys.values():
+            p.llen(key)
+        return {lang: int(n or 0) for lang, n in zip(keys, p.execute())}
+
+    def depth(self) -> int:
+        return sum(self.depth_by_language().values())
+
+    def keys(self) -> list[str]:
+        # Lists for languages no longer in RUNS_LANGUAGES can still hold runs
+        keys = sorted(self.r.scan_iter(match=f"{self.key}:lang:*", count=500))
+        return ([self.key] if self.r.exists(self.key) else []) + keys
+
+    def stats(self) -> dict:
+        by_lang = self.depth_by_language()
+        n = sum(by_lang.values())
+        out = {"backend": self.name, "key": self.key, "depth": n, "length": n}
+        if self.languages:
+            out["languages"] = by_lang
+        return out
@@ -0,0 +1,171 @@
+# runqueue/redis_stream.py
+"""
+Redis stream with one consumer group per worker pool.
+
+  enqueue  XADD RUNS_STREAM MAXLEN ~ RUNS_STREAM_MAXLEN * payload <json>
+  dequeue  XREADGROUP GROUP RUNS_STREAM_GROUP <consumer> COUNT n BLOCK ms
+  ack      XACK, recorded on the caller's writer so it ships with the run's final writes
+  nack     XADD the (updated) payload again + XACK the old entry
+  renew    every heartbeat, XCLAIM ... JUSTID this consumer's in-flight entries,
+           resetting their idle time (no matter how long a run waits or executes)
+  reclaim  every RUNS_STREAM_CLAIM_INTERVAL_SEC, XAUTOCLAIM entries that have sat
+           unacknowledged for RUNS_STREAM_CLAIM_IDLE_SEC (their consumer died); each
+           job carries the entry's delivery count so the worker can dead-letter
+           one that keeps killing its consumers
+
+MAXLEN trimming is approximate and also removes entries nobody has read yet,
+so keep RUNS_STREAM_MAXLEN well above the deepest backlog you expect.
+"""
+from __future__ import annotations
+import os, time, socket, threading
+from typing import Iterable
+
+import redis
+
+from runqueue.base import Job, Queue
+
+RUNS_STREAM = os.getenv("RUNS_STREAM", "runs:stream")
+GROUP = os.getenv("RUNS_STREAM_GROUP", "workers")
+MAXLEN = int(os.getenv("RUNS_STREAM_MAXLEN", "100000"))
+# Live consumers renew their entries every heartbeat: keep this well above WORKER_HEARTBEAT_SEC
+CLAIM_IDLE_SEC = float(os.getenv("RUNS_STREAM_CLAIM_IDLE_SEC", "300"))
+CLAIM_INTERVAL_SEC = float(os.getenv("RUNS_STREAM_CLAIM_INTERVAL_SEC", "30"))
+
+class StreamQueue(Queue):
+    name = "stream"
+
+    def __init__(self, r, key: str = RUNS_STREAM, group: str = GROUP, consumer: str | None = None,
+                 maxlen: int = MAXLEN):
+        self.r, self.key, self.group, self.maxlen = r, key, group, maxlen
+        self.consumer = consumer or f"{socket.gethostname()}:{os.getpid()}"
+        self._group_ready = False
+        self._next_claim = 0.0
+        self._claim_cursor = "0-0"
+        self._inflight: set[str] = set()  # delivered to us, not acked yet (renewed by the heartbeat)
+        self._lock = threading.Lock()
+
+    def _ensure_group(self, force: bool = False) -> None:
+        if self._group_ready and not force:
+            return
+        try:
+            # From the start of the stream: entries added before the group existed still run
+            self.r.xgroup_create(self.key, self.group, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    def enqueue_many(self, items: Iterable[str], w=None) -> None:
+        p = w or self.r.pipeline(transaction=False)
+        for data in items:
+            p.xadd(self.key, {"payload": data}, maxlen=self.maxlen, approximate=True)
+        if w is None:
+            p.execute()
+
+    def _jobs(self, entries, deliveries: dict[str, int] | None = None) -> list[Job]:
+        # Entries trimmed away while pending come back with no fields
+        jobs = [Job(fields["payload"], id=eid, deliveries=(deliveries or {}).get(eid, 1))
+                for eid, fields in entries or [] if fields and "payload" in fields]
+        with self._lock:
+            self._inflight.update(job.id for job in jobs)
+        return jobs
+
+    def reclaim(self, n: int) -> list[Job]:
+        """Take over up to n entries whose consumer stopped acknowledging them."""
+        cursor, entries, *_ = self.r.xautoclaim(self.key, self.group, self.consumer,
+                                                min_idle_time=int(CLAIM_IDLE_SEC * 1000),
+                                                start_id=self._claim_cursor, count=n)
+        self._claim_cursor = cursor or "0-0"
+        deliveries = {}
+        if entries:
+            with self._lock:
+                count = len(entries) + len(self._inflight)  # our older in-flight ids can sit in the range
+            pending = self.r.xpending_range(self.key, self.group, min=entries[0][0], max=entries[-1][0],
+                                            count=count, consumername=self.consumer)
+            deliveries = {p["message_id"]: int(p["times_delivered"]) for p in pending}
+        return self._jobs(entries, deliveries)
+
+    def renew(self) -> None:
+        with self._lock:
+            ids = list(self._inflight)
+        if ids:
+            # JUSTID: resets the idle time without counting another delivery
+            self.r.xclaim(self.key, self.group, self.consumer, min_idle_time=0, message_ids=ids, justid=True)
+
+    def dequeue_blocking(self, n: int = 1, timeout: float = 0,
+                         with_depth: bool = False) -> tuple[list[Job], int | None]:
+        self._ensure_group()
+        try:
+            return self._dequeue(n, timeout, with_depth)
+        except redis.ResponseError as e:
+            if "NOGROUP" not in str(e):
+                raise
+            self._ensure_group(force=True)  # stream was deleted under us
+            return [], None
+
+    def _dequeue(self, n: int, block_sec: float, with_depth: bool) -> tuple[list[Job], int | None]:
+        n = max(1, n)
+        now = time.monotonic()
+        if now >= self._next_claim:
+            self._next_claim = now + CLAIM_INTERVAL_SEC
+            jobs = self.reclaim(n)
+            if jobs:
+                return jobs, (self.depth() if with_depth else None)
+        # The depth rides in the same pipeline, read after the entries were delivered
+        p = self.r.pipeline(transaction=False)
+        p.xreadgroup(self.group, self.consumer, {self.key: ">"}, count=n,
+                     block=int(block_sec * 1000) if block_sec else None)
+        if with_depth:
+            p.xinfo_groups(self.key)
+            p.xlen(self.key)
+        res, *info = p.execute()
+        jobs = []
+        for _, entries in res or []:
+            jobs.extend(self._jobs(entries))
+        return jobs, (self._stats(*info)["depth"] if with_depth else None)
+
+    def abandon(self, job: Job) -> None:
+        with self._lock:
+            self._inflight.discard(job.id)
+
+    def ack(self, job: Job, w=None) -> None:
+        if job.id is not None:
+            with self._lock:
+                self._inflight.discard(job.id)
+            (w or self.r).xack(self.key, self.group, job.id)
+
+    def keys(self) -> list[str]:
+        # The consumer group goes with the stream; the next dequeue recreates it
+        return [self.key] if self.r.exists(self.key) else []
+
+    def purge(self) -> list[str]:
+        keys = super().purge()
+        self._group_ready = False
+        return keys
+
+    def depth(self) -> int:
+        """Entries not yet delivered to the group (consumer lag)."""
+        return self.stats()["depth"]
+
+    def stats(self) -> dict:
+        self._ensure_group()
+        p = self.r.pipeline(transaction=False)
+        p.xinfo_groups(self.key)
+        p.xlen(self.key)
+        return self._stats(*p.execute())
+
+    def _stats(self, groups: list, length) -> dict:
+        g = next((g for g in groups or [] if g.get("name") == self.group), {})
+        length = int(length or 0)
+        lag = g.get("lag")
+        return {
+            "backend": self.name,
+            "key": self.key,
+            "group": self.group,
+            # Redis < 7 reports no lag: fall back to the stream length
+            "depth": int(lag) if lag is not None else length,
+            "length": length,
+            "lag": lag,
+            "pending": int(g.get("pending") or 0),
+            "consumers": int(g.get("consumers") or 0),
+        }
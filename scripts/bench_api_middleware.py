@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Per-request overhead of the API observability middleware on /healthz.
+
+  none     - the bare app (floor)
+  before   - RequestIdMiddleware + MetricsMiddleware as two BaseHTTPMiddleware
+             layers (the previous api/observability.py, reproduced here)
+  after    - the single pure-ASGI ObservabilityMiddleware
+
+Requests are driven straight through the ASGI callable in one event loop, so
+the numbers are middleware + routing cost without socket or server noise.
+Run with: python3 scripts/bench_api_middleware.py [-n 20000]
+"""
+import os, sys, time, uuid, asyncio, argparse, statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from fastapi import FastAPI  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+from api.observability import HTTP_INFLIGHT, HTTP_LATENCY, HTTP_REQUESTS, ObservabilityMiddleware  # noqa: E402
+
+class RequestIdMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        rid = request.headers.get("x-request-id") or str(uuid.uuid4())
+        response = await call_next(request)
+        response.headers["x-request-id"] = rid
+        return response
+
+class MetricsMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        HTTP_INFLIGHT.inc()
+        path, method = request.url.path, request.method
+        with HTTP_LATENCY.labels(path, method).time():
+            try:
+                response = await call_next(request)
+                HTTP_REQUESTS.labels(path, method, str(response.status_code)).inc()
+                return response
+            finally:
+                HTTP_INFLIGHT.dec()
+
+def make_app(variant: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/healthz")
+    def healthz():
+        return {"status": "ok"}
+
+    if variant == "before":
+        app.add_middleware(RequestIdMiddleware)
+        app.add_middleware(MetricsMiddleware)
+    elif variant == "after":
+        app.add_middleware(ObservabilityMiddleware)
+    return app
+
+SCOPE = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+         "path": "/healthz", "raw_path": b"/healthz", "query_string": b"", "root_path": "",
+         "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80)}
+
+async def one(app) -> None:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200
+
+    await app(dict(SCOPE), receive, send)
+
+async def bench(app, n: int) -> list[float]:
+    for _ in range(200):  # warm-up: route compilation, middleware stack build
+        await one(app)
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        await one(app)
+        out.append(time.perf_counter() - t0)
+    return out
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=20_000)
+    args = ap.parse_args()
+    floor = None
+    for variant in ("none", "before", "after"):
+        us = sorted(s * 1e6 for s in asyncio.run(bench(make_app(variant), args.n)))
+        mean, p50, p99 = statistics.mean(us), us[len(us) // 2], us[min(len(us) - 1, int(len(us) * 0.99))]
+        floor = mean if floor is None else floor
+        print(f"{variant:<7} mean={mean:8.1f}us  p50={p50:8.1f}us  p99={p99:8.1f}us  overhead={mean - floor:7.1f}us")
+
+if __name__ == "__main__":
+    main()
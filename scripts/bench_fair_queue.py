@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Noisy-neighbour tail latency: shared FIFO (list) vs fair round-robin (fair).
+
+One noisy project dumps --noisy runs at t=0; --small projects then submit one
+run every --every ticks each. A single consumer serves one run per tick
+(--service-ms of virtual time), so waits are deterministic and only reflect
+the queueing order. Uses throwaway keys on REDIS_URL (or --fake).
+Run with: python3 scripts/bench_fair_queue.py [--noisy 5000] [--small 5] [--fake]
+"""
+import os, sys, json, argparse, statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import redis  # noqa: E402
+from runqueue import FairQueue, ListQueue  # noqa: E402
+
+def pct(values: list[float], q: float) -> float:
+    v = sorted(values)
+    return v[min(len(v) - 1, int(len(v) * q))] if v else float("nan")
+
+def simulate(q, noisy: int, small: int, every: int, per_small: int) -> dict[str, list[int]]:
+    q.enqueue_many(json.dumps({"project_id": "noisy", "t": 0}) for _ in range(noisy))
+    waits: dict[str, list[int]] = {"noisy": [], "small": []}
+    submitted, tick = 0, 0
+    while True:
+        if tick % every == 0 and submitted < per_small:
+            q.enqueue_many(json.dumps({"project_id": f"small-{i}", "t": tick}) for i in range(small))
+            submitted += 1
+        jobs, _ = q.dequeue_blocking(1)
+        if not jobs:
+            break
+        payload = json.loads(jobs[0].data)
+        waits["noisy" if payload["project_id"] == "noisy" else "small"].append(tick - payload["t"])
+        tick += 1
+    return waits
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--noisy", type=int, default=5000, help="runs dumped by the noisy project")
+    ap.add_argument("--small", type=int, default=5, help="number of small projects")
+    ap.add_argument("--every", type=int, default=100, help="ticks between small-project submissions")
+    ap.add_argument("--per-small", type=int, default=20, help="runs per small project")
+    ap.add_argument("--service-ms", type=float, default=50.0, help="virtual service time per run")
+    ap.add_argument("--fake", action="store_true", help="use fakeredis instead of REDIS_URL")
+    args = ap.parse_args()
+
+    if args.fake:
+        import fakeredis
+        r = fakeredis.FakeRedis(decode_responses=True)
+    else:
+        r = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+    tag = f"bench:fair:{os.getpid()}"
+    print(f"noisy={args.noisy} small={args.small}x{args.per_small} every={args.every} ticks, "
+          f"service={args.service_ms}ms/run (virtual)")
+    print(f"{'backend':8} {'who':6} {'p50 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for backend, q in (("list", ListQueue(r, key=f"{tag}:list")), ("fair", FairQueue(r, key=f"{tag}:fair"))):
+        try:
+            waits = simulate(q, args.noisy, args.small, args.every, args.per_small)
+        finally:
+            r.delete(*r.keys(f"{tag}:*") or [f"{tag}:none"])
+        for who in ("small", "noisy"):
+            ms = [w * args.service_ms for w in waits[who]]
+            print(f"{backend:8} {who:6} {statistics.median(ms):>10,.0f} {pct(ms, 0.99):>10,.0f} {max(ms):>10,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Throughput of the run queue backends (runqueue/): Redis list vs Redis stream,
+with the in-process queue as the no-network ceiling.
+
+For each backend and batch size: enqueue N payloads (pipelined), then drain
+them the way the worker does (dequeue up to `batch`, ack in one pipeline).
+Uses throwaway keys on REDIS_URL and deletes them afterwards.
+Run with: python3 scripts/bench_queue_backends.py [-n 20000] [--batch 1,8,32] [--fake]
+"""
+import os, sys, json, time, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import redis  # noqa: E402
+from runqueue import ListQueue, MemoryQueue, StreamQueue  # noqa: E402
+
+def make(backend: str, r, tag: str):
+    if backend == "list":
+        return ListQueue(r, key=f"bench:{tag}:list")
+    if backend == "memory":
+        return MemoryQueue(f"bench:{tag}:memory")
+    return StreamQueue(r, key=f"bench:{tag}:stream", group="bench", consumer="bench-1", maxlen=10_000_000)
+
+def bench(r, backend: str, n: int, batch: int, payload: str) -> tuple[float, float]:
+    q = make(backend, r, f"{os.getpid()}:{batch}")
+    try:
+        t0 = time.perf_counter()
+        for i in range(0, n, 500):
+            p = r.pipeline(transaction=False)
+            for _ in range(min(500, n - i)):
+                q.enqueue(payload, p)
+            p.execute()
+        produced = time.perf_counter() - t0
+
+        t0, seen = time.perf_counter(), 0
+        while seen < n:
+            jobs, _ = q.dequeue_blocking(batch)
+            if not jobs:
+                break
+            p = r.pipeline(transaction=False)
+            for job in jobs:
+                q.ack(job, p)
+            p.execute()
+            seen += len(jobs)
+        consumed = time.perf_counter() - t0
+        return n / produced, seen / consumed
+    finally:
+        r.delete(q.key)
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=20000, help="payloads per case")
+    ap.add_argument("--batch", default="1,8,32", help="comma-separated dequeue batch sizes")
+    ap.add_argument("--fake", action="store_true", help="use fakeredis (no server; numbers only show code overhead)")
+    args = ap.parse_args()
+
+    if args.fake:
+        import fakeredis
+        r = fakeredis.FakeRedis(decode_responses=True)
+    else:
+        r = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+        r.ping()
+    payload = json.dumps({"run_id": "x" * 36, "project_id": "y" * 36, "language": "python",
+                          "code": "print('hello')", "_created": str(time.time())})
+
+    print(f"n={args.n}, payload={len(payload)}B, {'fakeredis' if args.fake else r.connection_pool.connection_kwargs.get('host')}")
+    print(f"{'backend':8} {'batch':>5} {'enqueue/s':>12} {'dequeue+ack/s':>14}")
+    for batch in [int(b) for b in args.batch.split(",") if b]:
+        for backend in ("list", "stream", "memory"):
+            prod, cons = bench(r, backend, args.n, batch, payload)
+            print(f"{backend:8} {batch:>5} {prod:>12,.0f} {cons:>14,.0f}")
+
+if __name__ == "__main__":
+    main()
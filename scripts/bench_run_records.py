@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Memory per run record: the old long-name hash vs the compact schema (records/).
+
+Writes N finished runs of each kind under throwaway keys on REDIS_URL,
+reports the used_memory delta, MEMORY USAGE / OBJECT ENCODING of a sample,
+and the same extrapolated to 1M runs; deletes the keys afterwards.
+--model skips Redis and estimates listpack sizes from the field layout
+(header, per-entry encoding and backlen, allocator rounding, per-key
+overhead); useful where no server is at hand, but only an estimate.
+Run with: python3 scripts/bench_run_records.py [-n 100000] [--model]
+"""
+import os, sys, time, uuid, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import redis  # noqa: E402
+from records import encode_run  # noqa: E402
+
+KEY_OVERHEAD = 96  # dictEntry + robj + key sds + expires-less db slot, roughly
+
+def legacy_run(run_id: str, now: float) -> dict:
+    return {"run_id": run_id, "project_id": "p-7f3a9c", "language": "python", "status": "succeeded",
+            "created_at": str(now), "updated_at": str(now + 0.734), "cpu_time": "0.412",
+            "max_rss_kb": "23816", "wall_time": "0.7021", "log_lines": "3"}
+
+def compact_run(run_id: str, now: float) -> dict:
+    ms = int(now * 1000)
+    return encode_run({"project_id": "p-7f3a9c", "language": "python", "status": "succeeded",
+                       "created_at": ms, "updated_at": ms + 734, "cpu_time": "0.412",
+                       "max_rss_kb": 23816, "wall_time": "0.7021", "log_lines": 3})
+
+def _entry(v) -> int:
+    """Bytes of one listpack entry: encoding + data + backlen."""
+    s = str(v)
+    try:
+        n = int(s)
+        if str(n) == s:
+            data = 1 if 0 <= n < 128 else 2 if -4096 <= n < 4096 else 3 if -2**15 <= n < 2**15 \
+                else 4 if -2**23 <= n < 2**23 else 5 if -2**31 <= n < 2**31 else 9
+            return data + 1
+    except ValueError:
+        pass
+    size = len(s.encode())
+    head = 1 if size < 64 else 2 if size < 4096 else 5
+    body = head + size
+    return body + (1 if body < 128 else 2)
+
+def _jemalloc(n: int) -> int:
+    for cls in (8, 16, 32, 48, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384, 448, 512, 640, 768, 896, 1024):
+        if n <= cls:
+            return cls
+    return (n + 255) // 256 * 256
+
+def model(fields: dict, key: str) -> int:
+    lp = 7 + sum(_entry(k) + _entry(v) for k, v in fields.items())  # 6-byte header + end byte
+    return _jemalloc(lp) + _jemalloc(len(key) + 9) + KEY_OVERHEAD
+
+def measure(r, make, n: int, tag: str) -> tuple[int, int | None, str]:
+    keys = [f"bench:{tag}:{uuid.uuid4().hex}" for _ in range(n)]
+    r.execute_command("MEMORY", "PURGE")
+    before = int(r.info("memory")["used_memory"])
+    now = time.time()
+    try:
+        for i in range(0, n, 1000):
+            p = r.pipeline(transaction=False)
+            for key in keys[i:i + 1000]:
+                p.hset(key, mapping=make(key.rsplit(":", 1)[1], now))
+            p.execute()
+        after = int(r.info("memory")["used_memory"])
+        sample = r.memory_usage(keys[0])
+        encoding = r.object("encoding", keys[0])
+        return (after - before) // n, sample, str(encoding)
+    finally:
+        for i in range(0, n, 1000):
+            r.delete(*keys[i:i + 1000])
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=100_000)
+    ap.add_argument("--model", action="store_true", help="estimate without a Redis server")
+    args = ap.parse_args()
+    run_id, now = uuid.uuid4().hex, time.time()
+    rows = []
+    if args.model:
+        for name, make in (("legacy", legacy_run), ("compact", compact_run)):
+            rows.append((name, model(make(run_id, now), f"run:{run_id}"), None, "listpack (model)"))
+    else:
+        r = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+        for name, make in (("legacy", legacy_run), ("compact", compact_run)):
+            rows.append((name, *measure(r, make, args.n, f"{os.getpid()}:{name}")))
+    print(f"{'schema':<8} {'bytes/run':>10} {'MEMORY USAGE':>13} {'encoding':<18} {'1M runs':>9}")
+    for name, per, sample, enc in rows:
+        print(f"{name:<8} {per:>10} {sample if sample is not None else '-':>13} {enc:<18} {per * 1_000_000 / 2**20:>7.0f}MB")
+    saved = rows[0][1] - rows[1][1]
+    print(f"compact saves {saved} B/run ({saved / rows[0][1]:.0%}), ~{saved * 1_000_000 / 2**20:.0f}MB per 1M runs")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Start-up latency of the worker execution engines.
+
+Compares, per run:
+  subprocess  - a fresh `python -c <code>` per run (naive baseline)
+  pool        - pre-warmed pooled interpreters (WORKER_ENGINE=pool)
+  forkserver  - fork from a zygote with --preload imported (WORKER_ENGINE=forkserver)
+
+for a trivial snippet and an import-heavy one.
+Run with: python3 scripts/bench_worker_startup.py [-n 50] [--heavy numpy,pandas]
+"""
+import os, sys, time, argparse, statistics, subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "worker"))
+import engine as E  # noqa: E402
+
+DEFAULT_HEAVY = "asyncio,decimal,email.mime.multipart,http.server,json,unittest,xml.dom.minidom"
+
+def _stats(samples: list[float]) -> str:
+    ms = sorted(s * 1000 for s in samples)
+    p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+    return f"mean={statistics.mean(ms):8.2f}ms  p50={statistics.median(ms):8.2f}ms  p95={p95:8.2f}ms"
+
+def bench_subprocess(code: str, n: int) -> list[float]:
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, stdout=subprocess.DEVNULL)
+        out.append(time.perf_counter() - t0)
+    return out
+
+def bench_engine(engine, code: str, n: int) -> list[float]:
+    payload = {"language": "python", "code": code}
+    engine.run(payload)  # first job after warm-up is not representative for either engine
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        engine.run(payload)
+        out.append(time.perf_counter() - t0)
+    return out
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=50, help="runs per case")
+    ap.add_argument("--heavy", default=DEFAULT_HEAVY, help="comma-separated modules for the import-heavy snippet")
+    args = ap.parse_args()
+
+    heavy = [m for m in args.heavy.split(",") if m]
+    snippets = {
+        "trivial": "print(1)",
+        "import-heavy": "".join(f"import {m}\n" for m in heavy) + "print(1)",
+    }
+    preload = ",".join(heavy)
+    runners = {"python": [sys.executable, "-u", E.RUNNER_PATH]}  # pool children start with nothing preloaded
+    zygote = [sys.executable, "-u", E.RUNNER_PATH, "--zygote", "--preload", preload]
+
+    pool = E.PooledEngine(runners=runners, size=1)
+    fork = E.ForkServerEngine(runners={}, size=1, zygote_argv=zygote)
+
+    print(f"python {sys.version.split()[0]}, n={args.n}, preload={preload}")
+    try:
+        for label, code in snippets.items():
+            print(f"\n[{label}]")
+            print(f"  subprocess  {_stats(bench_subprocess(code, args.n))}")
+            print(f"  pool        {_stats(bench_engine(pool, code, args.n))}")
+            print(f"  forkserver  {_stats(bench_engine(fork, code, args.n))}")
+        # A pooled interpreter keeps modules imported by earlier runs, so its
+        # import-heavy number is the best case (state shared between runs);
+        # fork-server gets the same imports with a fresh process per run.
+    finally:
+        for e in (pool, fork):
+            e.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Rewrite run:{id} / project:{id} hashes from the old long-name schema to the
+compact one (records/). Safe to run while API and workers are live: each key
+is converted by one Lua script that never overwrites a compact field, and
+readers accept both schemas until it finishes. Re-running it is a no-op.
+
+Run with: python3 scripts/migrate_records.py [--dry-run] [--batch 500]
+"""
+import os, sys, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import redis  # noqa: E402
+from records import migrate  # noqa: E402
+
+LEGACY_MARKERS = {"run": "created_at", "project": "created_at"}
+
+def scan_hashes(r, pattern: str, batch: int):
+    """Record hashes only: run:{id}:logs / :result and friends have other types or more colons."""
+    for key in r.scan_iter(match=pattern, count=batch, _type="hash"):
+        if key.count(":") == 1:
+            yield key
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dry-run", action="store_true", help="only count legacy records")
+    ap.add_argument("--batch", type=int, default=500, help="keys per SCAN page / pipeline")
+    args = ap.parse_args()
+    r = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+
+    for kind, pattern in (("run", "run:*"), ("project", "project:*")):
+        seen = legacy = moved = 0
+        pending: list[str] = []
+        for key in scan_hashes(r, pattern, args.batch):
+            seen += 1
+            pending.append(key)
+            if len(pending) >= args.batch:
+                n, m = flush(r, pending, kind, args.dry_run)
+                legacy, moved, pending = legacy + n, moved + m, []
+        n, m = flush(r, pending, kind, args.dry_run)
+        legacy, moved = legacy + n, moved + m
+        verb = "would migrate" if args.dry_run else "migrated"
+        print(f"{kind}: {seen} records, {verb} {legacy} ({moved} fields moved)")
+
+def flush(r, keys: list[str], kind: str, dry_run: bool) -> tuple[int, int]:
+    if not keys:
+        return 0, 0
+    p = r.pipeline(transaction=False)
+    for key in keys:
+        p.hexists(key, LEGACY_MARKERS[kind])
+    old = [key for key, is_old in zip(keys, p.execute()) if is_old]
+    if dry_run or not old:
+        return len(old), 0
+    return len(old), migrate(r, old, kind)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import math
+
+import pytest
+
+from api import autoscale
+from api.autoscale import TARGET_UTIL, TARGET_WAIT_SEC, raw_workers
+
+def test_idle_needs_nothing():
+    assert raw_workers(0.0, 0, 1.0, 1) == 0
+
+def test_steady_state_and_backlog():
+    # 4 runs/s at 0.5s each is 2 busy slots; plus draining 60 queued runs in TARGET_WAIT_SEC
+    steady = 4 * 0.5 / TARGET_UTIL
+    backlog = 60 * 0.5 / TARGET_WAIT_SEC
+    assert raw_workers(4.0, 60, 0.5, 1) == steady + backlog
+    assert raw_workers(4.0, 60, 0.5, 2) == (steady + backlog) / 2
+
+def _fresh():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeRedis(decode_responses=True)
+
+def test_ewma_smooths_by_elapsed_time(monkeypatch):
+    monkeypatch.setattr(autoscale, "SMOOTHING_SEC", 60.0)
+    r = _fresh()
+    assert float(autoscale.update(r, 2.0, now=1000)["ewma"]) == 2.0  # first sample seeds it
+    state = autoscale.update(r, 10.0, now=1060)
+    assert float(state["ewma"]) == pytest.approx(2.0 + (1 - math.exp(-1)) * 8.0)
+    assert int(state["recommended"]) == int(state["target"]) == 8  # scale-up applies at once
+    # No time passed: a burst of refreshes does not move the average
+    assert float(autoscale.update(r, 20.0, now=1060)["ewma"]) == pytest.approx(float(state["ewma"]))
+
+def test_scale_down_waits_for_the_cooldown(monkeypatch):
+    monkeypatch.setattr(autoscale, "SMOOTHING_SEC", 1e-6)  # ewma == raw: isolate the cooldown
+    monkeypatch.setattr(autoscale, "DOWN_COOLDOWN_SEC", 300.0)
+    r = _fresh()
+    assert autoscale.update(r, 6.0, now=1000)["recommended"] == "6"
+    state = autoscale.update(r, 2.0, now=1010)
+    assert (state["target"], state["recommended"], state["below_since"]) == ("2", "6", "1010")
+    assert autoscale.update(r, 2.0, now=1309)["recommended"] == "6"
+    state = autoscale.update(r, 2.0, now=1310)
+    assert (state["recommended"], state["changed_at"], state["below_since"]) == ("2", "1310", "")
+    # Load coming back resets the timer
+    autoscale.update(r, 6.0, now=1400)
+    autoscale.update(r, 2.0, now=1410)
+    assert autoscale.update(r, 6.0, now=1420)["below_since"] == ""
+
+def test_concurrent_refreshers_do_not_clobber_each_other(monkeypatch):
+    monkeypatch.setattr(autoscale, "SMOOTHING_SEC", 1e-6)
+    r = _fresh()
+    autoscale.update(r, 6.0, now=1000)
+    step, raced = autoscale._step, []
+
+    def racing_step(state, raw, now):
+        if not raced:  # another API process writes between our read and our write
+            raced.append(1)
+            autoscale.update(r, 2.0, now=1005)
+        return step(state, raw, now)
+
+    monkeypatch.setattr(autoscale, "_step", racing_step)
+    state = autoscale.update(r, 2.0, now=1008)
+    assert state["below_since"] == "1005"  # the retry saw the other process's write
+    assert r.hget(autoscale.STATE_KEY, "below_since") == "1005"
+
+def test_recommend_uses_the_given_client_and_reads_are_read_only(monkeypatch):
+    import json, time
+    import api.routes.routes_queue_and_metrics as rq
+
+    r = _fresh()
+    monkeypatch.setattr(rq, "r", None)  # everything must go through the injected client
+    monkeypatch.setattr(autoscale, "SMOOTHING_SEC", 1e-6)
+    r.hset(rq.KEY_HEARTBEAT, "w1", json.dumps({"ts": time.time(), "slots": 2}))
+    preview = autoscale.recommend(r, step=False)
+    assert preview["current_workers"] == 1 and preview["slots_per_worker"] == 2
+    assert not r.exists(autoscale.STATE_KEY)
+    stepped = autoscale.recommend(r)
+    state = r.hgetall(autoscale.STATE_KEY)
+    for _ in range(3):
+        assert autoscale.recommend(r, step=False)["recommended_workers"] == stepped["recommended_workers"]
+    assert r.hgetall(autoscale.STATE_KEY) == state
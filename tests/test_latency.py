@@ -0,0 +1,38 @@
+import math, os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "worker"))
+
+import timings
+from batching import Deferred
+from api.latency import _cumulative, merge, quantile, summary
+
+def test_bucket_fields_match_api_bounds():
+    assert timings.bucket(0.01) == "0.01"      # upper bounds are inclusive
+    assert timings.bucket(0.3) == "0.5"
+    assert timings.bucket(10_000) == "+Inf"
+    w = Deferred()
+    timings.record(w, "exec", "python", 1, 0.3)
+    assert w.ops[0][1] == ("metrics:hist:exec:python:1", "0.5", 1)
+
+def test_quantile_interpolates_within_bucket():
+    b = _cumulative({"1.0": "10", "2.5": "10", "sum": "20", "count": "20"})
+    assert b[-1] == (math.inf, 20)
+    assert quantile(0.5, b) == 1.0
+    assert quantile(0.75, b) == 1.75
+    assert quantile(0.5, _cumulative({})) is None
+
+def test_summary_merges_labels():
+    h1 = {"buckets": _cumulative({"0.1": "4"}), "sum": 0.2, "count": 4}
+    h2 = {"buckets": _cumulative({"5.0": "4"}), "sum": 16.0, "count": 4}
+    s = summary({("total", "python", "1"): h1, ("total", "js", "2"): h2})
+    assert s["total"]["count"] == 8
+    assert s["total"]["p50"] == 0.1
+    assert merge([h1["buckets"], h2["buckets"]])[-1] == (math.inf, 8)
+    assert s["exec"] == {"count": 0, "p50": None, "p95": None, "p99": None, "avg": None}
+
+def test_client_languages_fold_into_other():
+    import worker
+    assert worker.language_label(" Python ") == "python"
+    assert worker.language_label(None) == "unknown"
+    # Arbitrary strings would mint a new label and Redis histogram key each
+    assert {worker.language_label(f"lang{i}") for i in range(100)} == {"other"}
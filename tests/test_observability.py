@@ -0,0 +1,130 @@
+import os
+
+import pytest
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from api.observability import HTTP_REQUESTS, ObservabilityMiddleware
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(ObservabilityMiddleware)
+
+    @app.get("/obs-stream")
+    def stream():
+        return StreamingResponse(iter([b"a", b"b", b"c"]), media_type="text/plain")
+
+    return app
+
+def test_request_id_and_counts_without_touching_the_body():
+    before = HTTP_REQUESTS.labels("/obs-stream", "GET", "200")._value.get()
+    with TestClient(_app()) as c:
+        res = c.get("/obs-stream", headers={"x-request-id": "abc"})
+        assert res.content == b"abc"
+        assert res.headers["x-request-id"] == "abc"
+        assert len(c.get("/obs-stream").headers["x-request-id"]) == 36
+    assert HTTP_REQUESTS.labels("/obs-stream", "GET", "200")._value.get() == before + 2
+
+def test_labels_use_route_templates_and_are_capped():
+    from api.observability import HTTP_LABEL_OVERFLOW
+
+    app = FastAPI()
+    app.add_middleware(ObservabilityMiddleware, max_label_sets=1)
+
+    @app.get("/obs-runs/{run_id}")
+    def get_run(run_id: str):
+        return {"run_id": run_id}
+
+    overflow = HTTP_LABEL_OVERFLOW._value.get()
+    with TestClient(app) as c:
+        for run_id in ("a", "b", "c"):
+            c.get(f"/obs-runs/{run_id}")
+        c.get("/obs-missing/123")
+        c.post("/obs-runs/a")  # 405: a second (path, method) pair, over the cap
+    assert HTTP_REQUESTS.labels("/obs-runs/{run_id}", "GET", "200")._value.get() == 3
+    assert HTTP_REQUESTS.labels("<unmatched>", "GET", "404")._value.get() >= 1
+    assert HTTP_REQUESTS.labels("<overflow>", "POST", "405")._value.get() >= 1
+    assert HTTP_LABEL_OVERFLOW._value.get() == overflow + 1
+
+def test_refresher_caches_gauges_and_marks_staleness(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    import api.routes.routes_queue_and_metrics as rq
+    from api.observability import METRICS_REFRESH_ERRORS, RUNS_DLQ_DEPTH, RUNS_PROCESSED_TOTAL, _Refresher
+
+    fr = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(rq, "r", fr)
+    fr.rpush("runs:dead", "a", "b")
+    fr.set("metrics:runs_processed_total", 7)
+    ref = _Refresher(fr, stale_sec=60)
+    assert ref.age() == float("inf")
+    assert ref.refresh()
+    assert RUNS_DLQ_DEPTH._value.get() == 2 and RUNS_PROCESSED_TOTAL._value.get() == 7
+    assert ref.age() < 60
+
+    errors = METRICS_REFRESH_ERRORS._value.get()
+    server = fakeredis.FakeServer()
+    server.connected = False
+    down = _Refresher(fakeredis.FakeRedis(server=server, decode_responses=True))
+    assert not down.refresh()
+    assert METRICS_REFRESH_ERRORS._value.get() == errors + 1
+    assert RUNS_PROCESSED_TOTAL._value.get() == 7  # last good values stay exported
+
+def test_multiprocess_mode_merges_workers_and_drops_dead_gauges(tmp_path):
+    import subprocess, sys
+
+    root = os.path.join(os.path.dirname(__file__), "..")
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path), PYTHONPATH=root)
+    worker = ("from api.observability import HTTP_REQUESTS, HTTP_INFLIGHT, RUNS_DLQ_DEPTH\n"
+              "HTTP_REQUESTS.labels('/x', 'GET', '200').inc(); HTTP_INFLIGHT.inc(); RUNS_DLQ_DEPTH.set({n})\n")
+    for n in (3, 5):  # two exited workers
+        subprocess.run([sys.executable, "-c", worker.format(n=n)], env=env, check=True)
+    scrape = ("from api.observability import mark_dead_processes, render\n"
+              "print(len(mark_dead_processes())); print(render().decode())\n")
+    out = subprocess.run([sys.executable, "-c", scrape], env=env, check=True, capture_output=True, text=True).stdout
+    assert out.splitlines()[0] == "2"
+    assert 'http_requests_total{code="200",method="GET",path="/x"} 2.0' in out
+    assert "http_inflight_requests 1.0" not in out and "scw_runs_dead_queue_depth 5.0" not in out
+
+def test_multiprocess_reports_a_stale_refresher(tmp_path):
+    import subprocess, sys
+
+    root = os.path.join(os.path.dirname(__file__), "..")
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path), PYTHONPATH=root)
+    # Worker A: refresher has not succeeded for longer than METRICS_STALE_SEC; stays alive
+    stale = ("import sys, time\nfrom api.observability import _Refresher\n"
+             "ref = _Refresher(None, stale_sec=15); ref.last_ok = time.time() - 60; ref.mark()\n"
+             "print('ready', flush=True); sys.stdin.read()\n")
+    a = subprocess.Popen([sys.executable, "-c", stale], env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        assert a.stdout.readline().strip() == "ready"
+        # Worker B renders without ever having refreshed: it must not mask A
+        scrape = "from api.observability import render\nprint(render().decode())\n"
+        out = subprocess.run([sys.executable, "-c", scrape], env=env, check=True, capture_output=True, text=True).stdout
+    finally:
+        a.stdin.close()
+        a.wait(timeout=10)
+    assert "scw_metrics_stale 1.0" in out
+    age = [line for line in out.splitlines() if line.startswith("scw_metrics_age_seconds ")]
+    assert age and float(age[0].split()[1]) >= 60
+
+def test_refresher_builds_its_queue_once_on_the_shared_client(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    import api.autoscale as autoscale
+    import api.observability as obs
+    import api.routes.routes_queue_and_metrics as rq
+    from runqueue import StreamQueue
+
+    fr = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(rq, "r", None)  # no second client behind the refresher's back
+    built = []
+    monkeypatch.setattr(obs, "make_queue", lambda r: built.append(r) or StreamQueue(r, key="t:obs", consumer="api"))
+    monkeypatch.setattr(autoscale, "make_queue", lambda r: pytest.fail("autoscale built its own queue"))
+    groups = []
+    ref = obs._Refresher(fr)
+    create = fr.xgroup_create
+    monkeypatch.setattr(fr, "xgroup_create", lambda *a, **kw: groups.append(a) or create(*a, **kw))
+    for _ in range(3):
+        assert ref.refresh()
+    assert built == [fr] and len(groups) == 1
@@ -0,0 +1,74 @@
+import threading, time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api import profiler
+
+def _spin(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+def test_sampler_sees_busy_thread_and_formats_round_trip():
+    stop = threading.Event()
+    t = threading.Thread(target=_spin, args=(stop,), name="spinner")
+    t.start()
+    try:
+        stacks = profiler.profile(0.2, 0.005)
+    finally:
+        stop.set()
+        t.join()
+    spinner = [s for s in stacks if s[0][0] == "spinner"]
+    assert spinner and any(f[0] == "_spin" for f in spinner[0])
+    assert profiler.parse_collapsed(profiler.collapsed(stacks)) == stacks
+    doc = profiler.speedscope(stacks, "t", 0.005)
+    assert doc["profiles"][0]["type"] == "sampled" and len(doc["profiles"][0]["samples"]) == len(stacks)
+
+def test_admin_profile_endpoints(monkeypatch):
+    import api.routes.ops as ops
+
+    fr = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(ops, "r", fr)
+    fr.set("config:ADMIN_TOKEN", "s3cret")
+    app = FastAPI()
+    app.include_router(ops.router)
+    app.add_middleware(profiler.ProfileMiddleware, authorize=ops.authorized, interval=0.002,
+                       save=lambda profile_id, stacks: profiler.save(fr, profile_id, stacks))
+
+    @app.get("/busy")
+    def busy():
+        t0 = time.monotonic()
+        while time.monotonic() - t0 < 0.1:
+            sum(range(1000))
+        return {"ok": True}
+
+    admin = {"X-Admin-Token": "s3cret"}
+    with TestClient(app) as c:
+        assert c.get("/v1/ops/profile?seconds=0.1").status_code == 403
+        res = c.get("/v1/ops/profile?seconds=0.1&format=speedscope", headers=admin)
+        assert res.status_code == 200 and res.json()["profiles"][0]["unit"] == "seconds"
+        assert "x-profile-id" not in c.get("/busy", headers={"X-Profile": "1"}).headers  # no token
+        profile_id = c.get("/busy", headers={"X-Profile": "1", **admin}).headers["x-profile-id"]
+        text = c.get(f"/v1/ops/profile/requests/{profile_id}", headers=admin).text
+        assert "busy (test_profiler.py:" in text
+        assert c.get("/v1/ops/profile/requests/nope", headers=admin).status_code == 404
+
+def test_profiler_is_wired_into_the_api_app(monkeypatch):
+    import api.main as api_main
+    import api.routes.ops as ops
+
+    fr = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(ops, "r", fr)
+    monkeypatch.setattr(api_main, "r", fr)
+    fr.set("config:ADMIN_TOKEN", "s3cret")
+    admin = {"X-Admin-Token": "s3cret"}
+    with TestClient(api_main.app) as c:
+        assert c.get("/v1/ops/profile?seconds=0.05", headers=admin).status_code == 200
+        res = c.get("/v1/ops/quotas/p1", headers=admin)
+        assert res.status_code == 200
+        profile_id = c.get("/v1/ops/quotas/p1", headers={"X-Profile": "1", **admin}).headers["x-profile-id"]
+        assert c.get(f"/v1/ops/profile/requests/{profile_id}", headers=admin).status_code == 200
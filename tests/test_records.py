@@ -0,0 +1,43 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from records import ERROR_MAX_BYTES, decode_run, encode_run, migrate, pick_run, run_field_names
+
+def test_encode_decode_round_trip():
+    enc = encode_run({"status": "failed", "created_at": 1700000000123, "error": "é" * 100})
+    assert set(enc) == {"s", "c", "err"}
+    assert len(enc["err"].encode()) <= ERROR_MAX_BYTES
+    dec = decode_run({k: str(v) for k, v in enc.items()})
+    assert dec["status"] == "failed" and dec["created_at"] == 1700000000.123
+
+def test_migrate_legacy_hash_in_place():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    r.hset("run:r1", mapping={"run_id": "r1", "project_id": "p1", "status": "running",
+                              "created_at": "1700000000.5", "error": "x" * 200})
+    r.hset("run:r1", "s", "succeeded")  # a worker already wrote the compact field
+    assert migrate(r, ["run:r1"]) == 5
+    assert r.hgetall("run:r1") == {"p": "p1", "s": "succeeded", "c": "1700000000500", "err": "x" * ERROR_MAX_BYTES}
+    assert migrate(r, ["run:r1"]) == 0
+
+def test_pick_run_reads_either_schema():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    r.hset("run:a", mapping={"status": "queued"})
+    r.hset("run:b", mapping={"s": "running"})
+    names = ("status", "result_ref")
+    assert pick_run(names, r.hmget("run:a", run_field_names(*names))) == ["queued", None]
+    assert pick_run(names, r.hmget("run:b", run_field_names(*names))) == ["running", None]
+
+def test_long_client_text_stays_listpack_sized():
+    from records import VALUE_MAX_BYTES, encode_project
+    enc = {**encode_project({"name": "名" * 100, "created_at": 1700000000123}),
+           **encode_run({"language": "x" * 500, "project_id": "p1"})}
+    # Byte length, not characters: 100 CJK characters would be 300 bytes
+    assert all(len(str(v).encode()) <= VALUE_MAX_BYTES for v in enc.values())
+
+def test_api_rejects_oversized_names():
+    from fastapi.testclient import TestClient
+    import api.main as api_main
+    c = TestClient(api_main.app)
+    assert c.post("/v1/projects", json={"name": "n" * 65}).status_code == 422
+    assert c.post("/v1/runs", json={"project_id": "p", "language": "l" * 33, "code": "x"}).status_code == 422
@@ -0,0 +1,238 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from runqueue import ListQueue, StreamQueue
+
+def test_list_queue_fifo_and_depth():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    q = ListQueue(r, key="t:list")
+    for i in range(3):
+        q.enqueue(str(i))
+    jobs, depth = q.dequeue_blocking(2, with_depth=True)
+    assert [j.data for j in jobs] == ["0", "1"] and depth == 1
+    assert [j.data for j in q.dequeue_blocking(1)[0]] == ["2"]
+
+def test_stream_pending_until_ack_and_reclaim():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    a = StreamQueue(r, key="t:stream", group="g", consumer="a")
+    b = StreamQueue(r, key="t:stream", group="g", consumer="b")
+    for i in range(3):
+        a.enqueue(str(i))
+    jobs, _ = a.dequeue_blocking(2)
+    assert [j.data for j in jobs] == ["0", "1"]
+    a.ack(jobs[0])
+    s = a.stats()
+    assert s["pending"] == 1 and s["depth"] == 1 and s["length"] == 3
+    # "a" died holding "1": once idle long enough, "b" takes it over
+    b._next_claim = 0
+    import runqueue.redis_stream as rs
+    old, rs.CLAIM_IDLE_SEC = rs.CLAIM_IDLE_SEC, 0
+    try:
+        assert [j.data for j in b.dequeue_blocking(5)[0]] == ["1"]
+    finally:
+        rs.CLAIM_IDLE_SEC = old
+    assert [j.data for j in b.dequeue_blocking(5)[0]] == ["2"]
+
+def test_memory_queue_defers_to_writer_and_tracks_unacked():
+    import os, sys
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "worker"))
+    from batching import Deferred, flush
+    from runqueue import MemoryQueue
+
+    q = MemoryQueue("t:mem")
+    q.enqueue_many(["a", "b"])
+    jobs, depth = q.dequeue_blocking(5, with_depth=True)
+    assert [j.data for j in jobs] == ["a", "b"] and depth == 0
+    w = Deferred()
+    q.nack(jobs[0], "a2", w)
+    q.ack(jobs[1], w)
+    assert q.depth() == 0 and q.stats()["pending"] == 2   # nothing visible before the flush
+    flush(fakeredis.FakeRedis(), [w])
+    assert q.stats()["pending"] == 0
+    assert [j.data for j in q.dequeue_blocking(1, timeout=0.1)[0]] == ["a2"]
+    assert q.dequeue_blocking(1, timeout=0.05)[0] == []
+
+def test_api_and_worker_on_memory_queue():
+    import os, sys
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "worker"))
+    from fastapi.testclient import TestClient
+    import api.main as api_main
+    import worker
+    from batching import Deferred, flush
+    from runqueue import MemoryQueue
+
+    fr = fakeredis.FakeRedis(decode_responses=True)
+    q = MemoryQueue("t:single-node")
+    saved = (api_main.r, api_main.queue, worker.r, worker.queue, worker.coalescer, worker.limits)
+    api_main.r, api_main.queue, worker.r, worker.queue, worker.coalescer = fr, q, fr, q, None
+    worker.limits = worker.LimitResolver(fr)
+    try:
+        c = TestClient(api_main.app)
+        fr.hset("project:p1", mapping={"project_id": "p1"})
+        run_id = c.post("/v1/runs", json={"project_id": "p1", "language": "python", "code": "print(1)"}).json()["run_id"]
+        assert c.get("/v1/ops/queues").json()["sizes"]["runs"] == 1
+        [(payload, job)] = worker.parse(worker.dequeue(block=False))
+        w = Deferred()
+        worker.process(payload, w, job)
+        flush(fr, [w])
+        assert c.get(f"/v1/runs/{run_id}").json()["status"] == "succeeded"
+        assert q.stats() == {"backend": "memory", "key": "t:single-node", "depth": 0, "length": 0, "pending": 0}
+    finally:
+        api_main.r, api_main.queue, worker.r, worker.queue, worker.coalescer, worker.limits = saved
+
+def test_fair_queue_round_robin_and_weights():
+    import json
+    from runqueue import FairQueue
+    r = fakeredis.FakeRedis(decode_responses=True)
+    q = FairQueue(r, key="t:fair")
+    q.enqueue_many([json.dumps({"project_id": "noisy", "i": i}) for i in range(6)])
+    q.enqueue(json.dumps({"project_id": "a"}))
+    q.enqueue(json.dumps({"project_id": "b"}))
+    assert q.stats()["projects"] == {"noisy": 6, "a": 1, "b": 1}
+    q.set_weight("noisy", 2)
+    order = [json.loads(j.data)["project_id"] for j in q.dequeue_blocking(5)[0]]
+    assert order == ["noisy", "noisy", "a", "b", "noisy"]
+    assert q.depth() == 3 and q.stats()["active_projects"] == 1
+
+def test_language_routing_and_multi_key_pop():
+    import json
+    r = fakeredis.FakeRedis(decode_responses=True)
+    api = ListQueue(r, key="t:lang", languages=["python", "node"], consume=[])
+    api.enqueue_many([json.dumps({"language": lang}) for lang in ("python", "node", "cobol", "Python")])
+    assert api.stats()["languages"] == {"python": 2, "node": 1, "*": 1}
+    py_node = ListQueue(r, key="t:lang", languages=["python", "node"], consume=["python", "node"])
+    jobs, depth = py_node.dequeue_blocking(10, with_depth=True)
+    assert sorted(json.loads(j.data)["language"].lower() for j in jobs) == ["python", "python"]
+    assert depth == 1  # node is still queued; the catch-all is not this worker's
+    assert json.loads(py_node.dequeue_blocking(1, timeout=1)[0][0].data)["language"] == "node"
+    assert py_node.dequeue_blocking(1)[0] == []
+    everything = ListQueue(r, key="t:lang", languages=["python", "node"], consume=[])
+    assert json.loads(everything.dequeue_blocking(1, timeout=1)[0][0].data)["language"] == "cobol"
+    # A dedicated pool for languages nobody routes must not drain the catch-all
+    stray = ListQueue(r, key="t:pool", languages=[], consume=["python", "node", "python"])
+    assert stray.consume_keys == ["t:pool:lang:python", "t:pool:lang:node"]
+    assert stray.unrouted == ["python", "node"]
+
+def test_worker_reset_clears_every_backend(monkeypatch):
+    import json
+    import runqueue
+    import api.routes.ops as ops
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    r = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(ops, "r", r)
+    r.set("config:ADMIN_TOKEN", "s3cret")
+    r.sadd("runs", "r1")
+    r.hset("run:r1", "status", "queued")
+    r.rpush("quota:held:p1", "{}")
+    r.sadd("quota:held", "p1")
+    app = FastAPI()
+    app.include_router(ops.router)
+    admin = {"X-Admin-Token": "s3cret"}
+    payload = json.dumps({"project_id": "p1", "language": "python"})
+    queues = {
+        "list": runqueue.ListQueue(r, languages=["python"], consume=[]),
+        "fair": runqueue.FairQueue(r),
+        "stream": runqueue.StreamQueue(r, consumer="t"),
+    }
+    queues["fair"].set_weight("p1", 3)
+    with TestClient(app) as c:
+        for backend, q in queues.items():
+            monkeypatch.setattr(runqueue, "BACKEND", backend)
+            q.enqueue(payload)
+            dry = c.post("/v1/ops/worker/reset", json={"dry_run": True, "purge_runs": False}, headers=admin).json()
+            assert set(q.keys()) <= set(dry["summary"]["deleted"]) and q.keys()
+            assert "runs" not in dry["summary"]["deleted"]
+            c.post("/v1/ops/worker/reset", json={"purge_runs": backend == "stream"}, headers=admin)
+            assert q.keys() == [] and q.depth() == 0
+            assert not r.exists("quota:held:p1") and not r.exists("quota:held")
+    assert r.hget(queues["fair"].weights, "p1") == "3"  # configuration survives
+    assert not r.exists("runs") and not r.exists("run:r1")
+
+def test_stream_renews_in_flight_and_dead_letters_crash_loops(monkeypatch):
+    import json, os, sys, time
+    import runqueue.redis_stream as rs
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "worker"))
+    import worker
+
+    r = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(rs, "CLAIM_IDLE_SEC", 0.05)
+    a = StreamQueue(r, key="t:renew", group="g", consumer="a")
+    b = StreamQueue(r, key="t:renew", group="g", consumer="b")
+    a.enqueue(json.dumps({"run_id": "slow"}))
+    [job] = a.dequeue_blocking(1)[0]
+    time.sleep(0.1)
+    a.renew()  # the heartbeat of a live consumer: a long run is not handed out twice
+    assert b.reclaim(5) == []
+    a.abandon(job)
+    time.sleep(0.1)
+    a.renew()
+    [taken] = b.reclaim(5)
+    assert taken.id == job.id and taken.deliveries == 2
+
+    monkeypatch.setattr(worker, "r", r)
+    monkeypatch.setattr(worker, "queue", b)
+    taken.deliveries = worker.MAX_RETRIES + 1
+    assert worker.parse([taken]) == []
+    assert json.loads(r.lindex(worker.DLQ_QUEUE, 0))["_failure"]["class"] == "poison"
+    from records import decode_run
+    assert decode_run(r.hgetall("run:slow"))["status"] == "failed"
+    assert b.stats()["pending"] == 0
+
+def test_fair_queue_declares_its_keys_and_counts_depth():
+    import json
+    from runqueue import FairQueue
+    r = fakeredis.FakeRedis(decode_responses=True)
+    q = FairQueue(r, key="t:fair-total")
+    q.enqueue_many([json.dumps({"project_id": p, "i": i}) for p in ("a", "b", "c") for i in range(3)])
+    calls = []
+    script = q._dequeue
+    q._dequeue = lambda keys, args: calls.append((keys, args)) or script(keys=keys, args=args)
+    jobs, depth = q.dequeue_blocking(4, with_depth=True)
+    assert len(jobs) == 4 and depth == 5 == q.depth()
+    for keys, args in calls:
+        # Every project list the script may pop is passed as a key, never built from ARGV
+        assert sorted(keys[5:]) == sorted(f"t:fair-total:p:{p}" for p in args[1:])
+    # A stale ring entry (its list already empty) is dropped on the way; the counter ends at 0
+    r.rpush(q.ring, "ghost")
+    r.sadd(q.ring_set, "ghost")
+    jobs, depth = q.dequeue_blocking(10, with_depth=True)
+    assert len(jobs) == 5 and depth == 0 and r.get(q.total) == "0"
+
+def test_dlq_retry_keeps_entries_when_the_enqueue_fails(monkeypatch):
+    from fastapi.testclient import TestClient
+    import api.main as api_main
+
+    r = fakeredis.FakeRedis(decode_responses=True)
+    r.rpush(api_main.DLQ_QUEUE, "newest", "middle", "oldest")  # RPOP takes the oldest first
+
+    class Broken(ListQueue):
+        def enqueue_many(self, items, w=None):
+            raise RuntimeError("script failed")
+
+    monkeypatch.setattr(api_main, "r", r)
+    monkeypatch.setattr(api_main, "queue", Broken(r, key="t:dlq"))
+    c = TestClient(api_main.app)
+    assert c.post("/v1/ops/dlq/retry?limit=2").status_code == 503
+    assert r.lrange(api_main.DLQ_QUEUE, 0, -1) == ["newest", "middle", "oldest"]
+    monkeypatch.setattr(api_main, "queue", ListQueue(r, key="t:dlq"))
+    assert c.post("/v1/ops/dlq/retry?limit=2").json()["moved"] == 2
+    assert r.lrange(api_main.DLQ_QUEUE, 0, -1) == ["newest"] and r.llen("t:dlq") == 2
+
+def test_stream_dequeue_reads_depth_in_one_round_trip(monkeypatch):
+    import time
+    r = fakeredis.FakeRedis(decode_responses=True)
+    q = StreamQueue(r, key="t:depth", group="g", consumer="a")
+    q.enqueue_many(str(i) for i in range(5))
+    q._ensure_group()
+    q._next_claim = time.monotonic() + 60
+    direct, pipelines = [], []
+    execute, pipeline = r.execute_command, r.pipeline
+    monkeypatch.setattr(r, "execute_command", lambda *a, **kw: direct.append(a[0]) or execute(*a, **kw))
+    monkeypatch.setattr(r, "pipeline", lambda *a, **kw: pipelines.append(1) or pipeline(*a, **kw))
+    jobs, depth = q.dequeue_blocking(2, with_depth=True)
+    assert [j.data for j in jobs] == ["0", "1"] and depth == 3
+    assert direct == [] and len(pipelines) == 1
+    assert q.dequeue_blocking(2)[1] is None and direct == []
@@ -0,0 +1,57 @@
+import os, sys, time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import tracing
+
+def test_traceparent_round_trip():
+    tid, sid = tracing.new_trace_id(), tracing.new_span_id()
+    assert tracing.parse_traceparent(tracing.traceparent(tid, sid)) == (tid, sid)
+    assert tracing.parse_traceparent("00-" + "0" * 32 + "-" + sid + "-01") is None
+    assert tracing.parse_traceparent("garbage") is None
+    assert tracing.make_exporter("none") is None
+
+def test_run_trace_spans_api_request_and_worker(tmp_path):
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "worker"))
+    from fastapi.testclient import TestClient
+    import api.main as api_main
+    import worker
+    from batching import Deferred, flush
+    from runqueue import MemoryQueue
+
+    fr = fakeredis.FakeRedis(decode_responses=True)
+    q = MemoryQueue("t:trace")
+    ndjson = tracing.NDJSONExporter(str(tmp_path / "spans.ndjson"))
+    saved = (api_main.r, api_main.queue, worker.r, worker.queue, worker.coalescer, worker.limits, worker.tracer.exporter)
+    api_main.r, api_main.queue, worker.r, worker.queue, worker.coalescer = fr, q, fr, q, None
+    worker.limits = worker.LimitResolver(fr)
+    worker.tracer.exporter = tracing.MultiExporter([tracing.RedisExporter(), ndjson])
+    try:
+        c = TestClient(api_main.app)
+        fr.hset("project:p1", mapping={"n": "p1"})
+        parent = tracing.traceparent("ab" * 16, "cd" * 8)
+        res = c.post("/v1/runs", json={"project_id": "p1", "language": "python", "code": "print(1)"},
+                     headers={"traceparent": parent, "x-request-id": "req-1"}).json()
+        assert res["trace_id"] == "ab" * 16
+        [(payload, job)] = worker.parse(worker.dequeue(block=False))
+        trace = worker.tracer.start(payload)
+        w = Deferred()
+        worker.process(payload, w, job, trace)
+        t0 = time.time()
+        flush(fr, [w])
+        worker.tracer.export(fr, [trace], t0, time.time())
+
+        body = c.get(f"/v1/runs/{res['run_id']}/trace").json()
+        names = [s["name"] for s in body["spans"]]
+        assert names == ["api.create_run", "worker.dequeue", "worker.execute", "worker.status_write"]
+        api_span = body["spans"][0]
+        assert body["request_id"] == "req-1" and api_span["parent_id"] == "cd" * 8
+        assert all(s["parent_id"] == api_span["span_id"] for s in body["spans"][1:])
+        assert {s["trace_id"] for s in body["spans"]} == {"ab" * 16}
+        assert body["spans"][2]["attrs"]["status"] == "succeeded"
+        assert len((tmp_path / "spans.ndjson").read_text().splitlines()) == 3  # worker spans only
+    finally:
+        (api_main.r, api_main.queue, worker.r, worker.queue, worker.coalescer, worker.limits,
+         worker.tracer.exporter) = saved
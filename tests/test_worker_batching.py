@@ -0,0 +1,42 @@
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "worker"))
+
+from batching import BatchSizer, Deferred, flush
+
+def test_sizer_disabled_by_default_size():
+    s = BatchSizer(max_size=1)
+    s.observe(1000)
+    assert not s.enabled
+    assert s.size() == 1
+
+def test_sizer_tracks_depth():
+    s = BatchSizer(max_size=16, min_depth=4, share=4, alpha=1.0)
+    s.observe(2)
+    assert s.size() == 1          # shallow: back to blocking pop
+    s.observe(20)
+    assert s.size() == 5          # a quarter of what is queued
+    s.observe(10_000)
+    assert s.size() == 16         # capped
+
+class _Pipe:
+    def __init__(self, log):
+        self.log = log
+    def __getattr__(self, name):
+        return lambda *a, **k: self.log.append(name)
+    def execute(self):
+        self.log.append("EXECUTE")
+
+class _Redis:
+    def __init__(self):
+        self.log = []
+    def pipeline(self, transaction=True):
+        return _Pipe(self.log)
+
+def test_flush_uses_one_pipeline_then_callbacks():
+    rc, a, b = _Redis(), Deferred(), Deferred()
+    a.set("k", "v"); a.after(lambda: rc.log.append("after-a"))
+    b.hset("h", mapping={"x": 1})
+    flush(rc, [a, b])
+    assert rc.log == ["set", "hset", "EXECUTE", "after-a"]
+    assert not a.ops and not a.callbacks
@@ -0,0 +1,68 @@
+import os, sys, time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "worker"))
+
+from coalesce import Coalescer, fingerprint
+from records import decode_run, encode_run
+
+FP = fingerprint({"language": "python", "code": "print(1)"})
+
+def test_only_the_lease_owner_releases_it():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    c = Coalescer(r)
+    assert c.lead(FP, "a") and not c.lead(FP, "b")
+    c.publish(FP, "b", "failed")  # stale leader: must not drop a's lease
+    assert r.get(f"inflight:{FP}") == "a"
+    c.publish(FP, "a", "succeeded")
+    assert not r.exists(f"inflight:{FP}")
+    assert c.wait(FP, timeout=1) == {"run_id": "a", "status": "succeeded"}
+
+def test_wait_gives_up_when_the_lease_vanishes():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    c = Coalescer(r)
+    c.lead(FP, "a")
+    r.delete(f"inflight:{FP}")  # leader died, lease expired
+    t0 = time.monotonic()
+    assert c.wait(FP, timeout=5) is None
+    assert time.monotonic() - t0 < 1
+
+def test_copy_result_inline_and_blob_backed():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    c = Coalescer(r)
+    r.set("run:a:result", "42\n")
+    assert c.copy_result("a", "b") and r.get("run:b:result") == "42\n"
+    r.hset("run:big", mapping=encode_run({"result_ref": "local:ab/cd/abcd", "result_bytes": 70000}))
+    assert c.copy_result("big", "c")
+    data = decode_run(r.hgetall("run:c"))
+    assert data["result_ref"] == "local:ab/cd/abcd" and data["result_bytes"] == "70000"
+    assert not c.copy_result("nothing", "d")
+
+def test_follower_runs_the_job_itself_after_the_leader_fails(monkeypatch):
+    import worker
+    from batching import Deferred, flush
+    from engine import ExecutionResult
+    from runqueue import MemoryQueue
+
+    r = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(worker, "r", r)
+    monkeypatch.setattr(worker, "queue", MemoryQueue("t:coalesce"))
+    monkeypatch.setattr(worker, "coalescer", Coalescer(r))
+    monkeypatch.setattr(worker, "limits", worker.LimitResolver(r))
+    executed = []
+    monkeypatch.setattr(worker, "execute", lambda payload, lim=None, out=None:
+                        executed.append(payload["run_id"]) or ExecutionResult("1\n"))
+    payload = {"run_id": "f", "project_id": "p", "language": "python", "code": "print(1)"}
+    fp = fingerprint(payload, worker.limits.get(payload))
+    worker.coalescer.lead(fp, "leader")
+    worker.coalescer.publish(fp, "leader", "failed")
+    w = Deferred()
+    worker.process(payload, w)
+    flush(r, [w])
+    assert executed == ["f"]
+    assert decode_run(r.hgetall("run:f"))["status"] == "succeeded"
+    assert "coalesced_with" not in decode_run(r.hgetall("run:f"))
+    assert not r.exists(f"inflight:{fp}")  # the follower led its own attempt and released it
@@ -0,0 +1,98 @@
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "worker"))
+
+from engine import (ExecutionError, ExecutionTimeout, ForkServerEngine, PooledEngine, StubEngine,
+                    NON_RETRYABLE, POISON, RETRYABLE, classify)
+
+@pytest.fixture(scope="module")
+def pool():
+    e = PooledEngine(size=1)
+    yield e
+    e.close()
+
+def test_stub_engine():
+    res = StubEngine().run({"language": "python", "code": "x"})
+    assert res.output == "[python] OK len(code)=1"
+
+def test_pool_runs_code_and_reports_usage(pool):
+    res = pool.run({"language": "python", "code": "print(6 * 7)"})
+    assert res.output == "42\n"
+    assert set(res.usage()) == {"cpu_time", "max_rss_kb", "wall_time"}
+
+def test_pool_error_carries_traceback(pool):
+    with pytest.raises(ExecutionError) as ei:
+        pool.run({"language": "python", "code": "1/0"})
+    assert "ZeroDivisionError" in str(ei.value)
+    assert ei.value.result is not None
+    assert classify(ei.value) == NON_RETRYABLE
+
+def test_failure_classes(pool):
+    with pytest.raises(ExecutionError) as ei:
+        pool.run({"language": "python", "code": "def f(:"})
+    assert classify(ei.value) == NON_RETRYABLE and "SyntaxError" in str(ei.value)
+    with pytest.raises(ExecutionError) as ei:
+        pool.run({"language": "python", "code": ["not", "a", "string"]})
+    assert classify(ei.value) == POISON
+    assert classify(ExecutionError("sandbox crashed")) == RETRYABLE
+    assert classify(ConnectionError("redis went away")) == RETRYABLE
+
+def test_pool_wall_timeout_recycles_child(pool):
+    with pytest.raises(ExecutionTimeout):
+        pool.run({"language": "python", "code": "import time; time.sleep(5)"}, wall_sec=0.5)
+    assert pool.run({"language": "python", "code": "print('again')"}).output == "again\n"
+
+def test_pool_timeout_bills_killed_run(pool):
+    with pytest.raises(ExecutionTimeout) as ei:
+        pool.run({"language": "python", "code": "while True: pass"}, wall_sec=0.5)
+    usage = ei.value.result
+    assert usage.wall_time >= 0.5 and usage.cpu_time > 0.2 and usage.max_rss_kb > 0
+    with pytest.raises(ExecutionTimeout, match="cpu time limit"):
+        pool.run({"language": "python", "code": "while True: pass"}, cpu_sec=1, wall_sec=10)
+
+def test_output_is_streamed_in_chunks(pool, monkeypatch):
+    import engine
+    monkeypatch.setattr(engine, "STREAM_CHUNK_BYTES", 64)
+    code = "import sys\nfor i in range(50): print('x' * 20)\nprint('tail', end='')"
+    for e in (pool, ForkServerEngine(runners={}, size=1)):
+        chunks = []
+        try:
+            res = e.run({"language": "python", "code": code}, on_output=chunks.append)
+        finally:
+            if e is not pool:
+                e.close()
+        assert res.output == "" and len(chunks) > 10
+        assert "".join(chunks) == ("x" * 20 + "\n") * 50 + "tail"
+
+def test_pool_unknown_language(pool):
+    with pytest.raises(ExecutionError) as ei:
+        pool.run({"language": "cobol", "code": ""})
+    assert classify(ei.value) == NON_RETRYABLE
+
+def test_forkserver_isolates_runs():
+    e = ForkServerEngine(runners={}, size=1)
+    try:
+        e.run({"language": "python", "code": "import json; json.leaked = 1"})
+        res = e.run({"language": "python", "code": "import json; print(hasattr(json, 'leaked'))"})
+        assert res.output == "False\n"
+        with pytest.raises(ExecutionTimeout):
+            e.run({"language": "python", "code": "import time; time.sleep(5)"}, wall_sec=0.5)
+    finally:
+        e.close()
+
+def test_sandbox_does_not_see_worker_env(monkeypatch):
+    monkeypatch.setenv("REDIS_URL", "redis://:secret@redis:6379/0")
+    monkeypatch.setenv("ADMIN_TOKEN", "s3cret")
+    code = "import os; print(sorted(k for k in ('REDIS_URL', 'ADMIN_TOKEN') if k in os.environ))"
+    for e in (PooledEngine(size=1), ForkServerEngine(runners={}, size=1)):
+        try:
+            assert e.run({"language": "python", "code": code}).output == "[]\n"
+        finally:
+            e.close()
+
+def test_bad_hello_kills_child():
+    import engine
+    with pytest.raises(ExecutionError, match="bad hello"):
+        engine._Child([sys.executable, "-c", "import time; print('not json', flush=True); time.sleep(30)"])
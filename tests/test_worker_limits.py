@@ -0,0 +1,62 @@
+import os, sys
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "worker"))
+
+import usage
+from batching import Deferred, flush
+from engine import CPU_LIMIT_SEC, ExecutionResult
+from limits import LimitResolver, Limits
+from api.usage import rollup
+
+def test_project_beats_language_beats_default():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    r.set("config:RUN_WALL_LIMIT_SEC", "20")
+    r.set("config:RUN_WALL_LIMIT_SEC:lang:python", "5")
+    r.set("config:RUN_CPU_LIMIT_SEC:p1", "3")
+    r.set("config:RUN_WALL_LIMIT_SEC:p2", "0")  # ignored, falls through
+    lim = LimitResolver(r, cache_sec=0)
+    assert lim.get({"project_id": "p1", "language": "python"}) == Limits(3, 5.0)
+    assert lim.get({"project_id": "p2", "language": "Python"}) == Limits(CPU_LIMIT_SEC, 5.0)
+    assert lim.get({"language": "node"}) == Limits(CPU_LIMIT_SEC, 20.0)
+
+def test_usage_rollup_by_project():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    w = Deferred()
+    usage.record(w, "heavy", ExecutionResult("", cpu_time=4.0, wall_time=5.0, max_rss_kb=900))
+    usage.record(w, "heavy", ExecutionResult("", cpu_time=3.0, wall_time=30.0, max_rss_kb=500), timed_out=True)
+    usage.record(w, "light", ExecutionResult("", cpu_time=0.5, wall_time=0.6, max_rss_kb=100))
+    usage.record(w, "light", None)
+    flush(r, [w])
+    rows = rollup(r, 7)
+    assert [row["project_id"] for row in rows] == ["heavy", "light"]
+    assert rows[0] == {"project_id": "heavy", "executions": 2, "timeouts": 1,
+                       "cpu_time": 7.0, "wall_time": 35.0, "peak_rss_kb": 900}
+    assert rows[1]["executions"] == 2 and rows[1]["timeouts"] == 0
+
+def test_coalescing_respects_limits_and_bills_the_follower(monkeypatch):
+    import worker
+    from coalesce import Coalescer, fingerprint
+    from records import encode_run
+
+    run = {"language": "python", "code": "print(1)"}
+    assert fingerprint(run, Limits(3, 5.0)) == fingerprint(run, Limits(3, 5.0))
+    assert fingerprint(run, Limits(3, 5.0)) != fingerprint(run, Limits(3, 60.0))
+
+    r = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(worker, "r", r)
+    monkeypatch.setattr(worker, "coalescer", Coalescer(r))
+    fp = fingerprint(run, Limits(3, 5.0))
+    r.hset("run:leader", mapping=encode_run({"cpu_time": 2.5, "wall_time": 3.0, "max_rss_kb": 700}))
+    r.set("run:leader:result", "1\n")
+    worker.coalescer.lead(fp, "leader")
+    worker.coalescer.publish(fp, "leader", "succeeded")
+    w = Deferred()
+    assert worker.follow(fp, {"run_id": "f1", "project_id": "other", **run}, "python", w)
+    flush(r, [w])
+    [row] = rollup(r, 1)
+    assert row["project_id"] == "other" and row["cpu_time"] == 2.5 and row["peak_rss_kb"] == 700
+    assert r.get("run:f1:result") == "1\n"
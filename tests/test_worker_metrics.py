@@ -0,0 +1,48 @@
+import os, sys, urllib.request
+
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "worker"))
+
+import metrics
+from heartbeat import WORKER_ID
+
+def test_registry_keeps_cumulative_counters():
+    before = metrics.REGISTRY.get_sample_value("scw_worker_runs_processed_total", {"language": "metrics-test"}) or 0
+    for _ in range(3):
+        metrics.RUNS_PROCESSED.labels("metrics-test").inc()
+    metrics.EXEC_SECONDS.labels("metrics-test", "1").observe(0.3)
+    assert metrics.REGISTRY.get_sample_value("scw_worker_runs_processed_total", {"language": "metrics-test"}) == before + 3
+    assert metrics.REGISTRY.get_sample_value("scw_worker_execution_seconds_bucket",
+                                             {"language": "metrics-test", "attempt": "1", "le": "0.5"}) >= 1
+
+def test_push_groups_by_a_per_process_instance(monkeypatch):
+    pushed = []
+    monkeypatch.setattr(metrics, "PUSHGATEWAY_URL", "http://pushgateway:9091")
+    monkeypatch.setattr(metrics, "push_to_gateway", lambda url, **kw: pushed.append((url, kw)))
+    assert metrics.push()
+    [(url, kw)] = pushed
+    assert kw["grouping_key"] == {"instance": metrics.INSTANCE} and kw["registry"] is metrics.REGISTRY
+    if not os.getenv("RENDER_INSTANCE_ID"):
+        assert metrics.INSTANCE == WORKER_ID
+    metrics._Pusher(60).stop()  # exit flushes the last interval
+    assert len(pushed) == 2
+    monkeypatch.setattr(metrics, "push_to_gateway", lambda url, **kw: 1 / 0)
+    assert metrics.push() is False  # swallowed; the next tick retries
+    monkeypatch.setattr(metrics, "PUSHGATEWAY_URL", "")
+    assert metrics.push() is False
+
+def test_start_exporter_serves_the_registry_once(monkeypatch):
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    monkeypatch.setattr(metrics, "_started", False)
+    monkeypatch.setattr(metrics, "METRICS_PORT", port)
+    monkeypatch.setattr(metrics, "PUSHGATEWAY_URL", "")
+    metrics.start_exporter()
+    metrics.start_exporter()  # second call is a no-op, not "address already in use"
+    body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read()
+    assert b"scw_worker_runs_processed_total" in body
@@ -0,0 +1,77 @@
+import os, sys
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "worker"))
+
+from batching import Deferred, flush
+from output import OutputStream
+
+def test_streamed_chunks_are_read_back_joined():
+    from fastapi.testclient import TestClient
+    import api.main as api_main
+
+    fr = fakeredis.FakeRedis(decode_responses=True)
+    fr.hset("run:r1", mapping={"run_id": "r1", "status": "running"})
+    fr.set("run:r1:result", "stale output of attempt 1")
+    out = OutputStream(fr, "r1")
+    out.write("hello ")
+    saved, api_main.r = api_main.r, fr
+    try:
+        c = TestClient(api_main.app)
+        first = c.get("/v1/runs/r1/output").json()
+        assert first["chunks"] == ["hello "] and first["next"] == 1 and not first["done"]
+        out.write("world")
+        w = Deferred()
+        out.finish(w, "")
+        w.hset("run:r1", mapping={"status": "succeeded"})
+        flush(fr, [w])
+        rest = c.get("/v1/runs/r1/output", params={"offset": first["next"]}).json()
+        assert rest["chunks"] == ["world"] and rest["done"]
+        assert c.get("/v1/runs/r1").json()["result"] == "hello world"
+    finally:
+        api_main.r = saved
+
+def test_non_streaming_engine_output_is_a_plain_string():
+    fr = fakeredis.FakeRedis(decode_responses=True)
+    w = Deferred()
+    OutputStream(fr, "r2").finish(w, "[python] OK")
+    flush(fr, [w])
+    assert fr.get("run:r2:result") == "[python] OK"
+
+def test_large_output_spills_to_blob_store(tmp_path):
+    from fastapi.testclient import TestClient
+    import api.main as api_main
+    from blobstore import LocalBlobStore
+
+    fr = fakeredis.FakeRedis(decode_responses=True)
+    fr.hset("run:r3", mapping={"run_id": "r3", "status": "running"})
+    store = LocalBlobStore(str(tmp_path))
+    out = OutputStream(fr, "r3", store, threshold=100)
+    chunks = ["é" * 30 + "\n" for _ in range(10)]
+    for chunk in chunks:
+        out.write(chunk)
+    assert fr.llen("run:r3:result") == 1  # preview up to the threshold, the rest went to the blob
+    w = Deferred()
+    out.finish(w)
+    w.hset("run:r3", mapping={"status": "succeeded"})
+    flush(fr, [w])
+    assert not fr.exists("run:r3:result") and fr.hget("run:r3", "rr").startswith("local:")
+    saved = api_main.r, api_main.blobs
+    api_main.r, api_main.blobs = fr, store
+    try:
+        c = TestClient(api_main.app)
+        body = c.get("/v1/runs/r3").json()
+        assert body["result"] == "".join(chunks) and body["result_bytes"] == 610
+        assert c.get("/v1/runs/r3/result").text == "".join(chunks)
+        assert c.get("/v1/runs/r3/output").json()["result_url"] == "/v1/runs/r3/result"
+        # Pruned blob: an error status, not a 200 with a truncated JSON body
+        store.delete(fr.hget("run:r3", "rr"))
+        assert c.get("/v1/runs/r3").status_code == 404
+        assert c.get("/v1/runs/r3/result").status_code == 404
+        fr.hset("run:r3", "rr", "local:../../etc/passwd")
+        assert c.get("/v1/runs/r3/result").status_code == 502
+    finally:
+        api_main.r, api_main.blobs = saved
@@ -0,0 +1,43 @@
+import os, sys, json, time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "worker"))
+
+from quota import ProjectQuota
+
+def run(run_id, project="p1"):
+    payload = {"run_id": run_id, "project_id": project}
+    return payload, json.dumps(payload)
+
+def test_over_limit_runs_are_held_and_promoted_on_release():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    r.set("config:PROJECT_MAX_CONCURRENCY:p1", "2")
+    q = ProjectQuota(r)
+    assert q.admit([run("a"), run("b"), run("c"), run("x", "p2")]) == [True, True, False, True]
+    assert r.llen("quota:held:p1") == 1 and r.smembers("quota:held") == {"p1"}
+    # Re-admitting a run that already holds a lease never counts it twice
+    assert q.admit([run("a")]) == [True]
+    assert json.loads(q.release("a"))["run_id"] == "c"
+    assert set(r.zrange("quota:leases:p1", 0, -1)) == {"b", "c"}
+    assert r.smembers("quota:held") == set()
+    assert q.release("b") is None and q.release("c") is None
+    assert r.zcard("quota:leases:p1") == 0
+
+def test_expired_leases_free_capacity_for_sweep():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    r.set("config:PROJECT_MAX_CONCURRENCY", "1")
+    dead, live = ProjectQuota(r, lease_sec=1), ProjectQuota(r)
+    assert dead.admit([run("a"), run("b")]) == [True, False]
+    assert live.sweep() == []
+    time.sleep(1.1)  # "dead" never renewed its lease
+    assert [json.loads(item)["run_id"] for item in live.sweep()] == ["b"]
+    assert "b" in live.leases
+
+def test_unlimited_by_default():
+    r = fakeredis.FakeRedis(decode_responses=True)
+    q = ProjectQuota(r, default_limit=0)
+    assert q.admit([run(str(i)) for i in range(5)]) == [True] * 5
+    assert r.zcard("quota:leases:p1") == 0
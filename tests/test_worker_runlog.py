@@ -0,0 +1,24 @@
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "worker"))
+
+import runlog
+from batching import Deferred
+
+def test_lines_are_chunked_and_trimmed_in_same_batch():
+    log, w = runlog.RunLog("r1"), Deferred()
+    log.write("\n".join(f"line {i}" for i in range(runlog.CHUNK_LINES * 2 + 1)))
+    log.flush(w)
+    names = [name for name, _, _ in w.ops]
+    assert names == ["lpush", "lpush", "lpush", "ltrim", "hincrby"]  # updated_at rides on the status write
+    assert w.ops[3][1] == ("run:r1:logs", 0, runlog.MAX_CHUNKS - 1)
+    assert w.ops[4][1] == ("run:r1", "ll", runlog.CHUNK_LINES * 2 + 1)
+    assert w.ops[0][1][1].count("\n") == runlog.CHUNK_LINES - 1
+
+def test_oversized_line_is_cut_to_chunk_bytes():
+    log, w = runlog.RunLog("r1"), Deferred()
+    log.write("x" * (runlog.CHUNK_BYTES * 3))
+    log.flush(w)
+    chunk = w.ops[0][1][1]
+    assert len(chunk.encode()) <= runlog.CHUNK_BYTES
+    assert chunk.endswith("[line truncated]")
@@ -0,0 +1,22 @@
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "worker"))
+
+from heartbeat import WorkerStats
+
+def test_snapshot_idle():
+    snap = WorkerStats(slots=2).snapshot()
+    assert snap["busy"] == 0
+    assert snap["current_job"] is None
+    assert snap["avg_exec_sec"] is None
+    assert snap["slots"] == 2
+
+def test_snapshot_tracks_jobs():
+    st = WorkerStats(slots=1, window=60)
+    st.start("a"); time.sleep(0.05); st.finish("a")
+    st.start("b")
+    snap = st.snapshot()
+    assert snap["current_job"] == "b"
+    assert snap["jobs_in_window"] == 1
+    assert snap["avg_exec_sec"] >= 0.05
+    assert 0 < snap["utilisation"] <= 1.0
@@ -0,0 +1,75 @@
+# tracing/__init__.py
+"""
+Run traces, shared by the API (request span, trace context) and the worker
+(dequeue / execute / status-write spans).
+
+The API puts the context into the queue payload:
+
+  payload["_trace"] = {"trace_id": <32 hex>, "span_id": <16 hex>, "request_id": <x-request-id>}
+
+An incoming W3C `traceparent` header is continued; otherwise each run
+submission starts a trace. Spans are plain dicts (span()) handed to the
+configured exporters:
+
+  TRACE_EXPORTERS=redis          (default) run:{id}:trace, read back by GET /v1/runs/{id}/trace
+  TRACE_EXPORTERS=redis,ndjson   also append every span to TRACE_NDJSON_PATH for offline analysis
+  TRACE_EXPORTERS=none           tracing off
+
+Other exporters implement tracing.base.Exporter and register in make_exporter().
+"""
+from __future__ import annotations
+import os, re, secrets
+
+from tracing.base import Exporter, MultiExporter
+from tracing.ndjson import NDJSONExporter
+from tracing.store import RedisExporter, read_trace
+
+EXPORTERS = os.getenv("TRACE_EXPORTERS", "redis")
+PAYLOAD_KEY = "_trace"
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+def new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+def new_span_id() -> str:
+    return secrets.token_hex(8)
+
+def parse_traceparent(header: str | None) -> tuple[str, str] | None:
+    """(trace_id, parent span id) from a W3C traceparent header, None if absent or invalid."""
+    m = _TRACEPARENT.match((header or "").strip().lower())
+    if m is None or set(m.group(1)) == {"0"} or set(m.group(2)) == {"0"}:
+        return None
+    return m.group(1), m.group(2)
+
+def traceparent(trace_id: str, span_id: str) -> str:
+    return f"00-{trace_id}-{span_id}-01"
+
+def span(name: str, ctx: dict, start: float, end: float, service: str, span_id: str | None = None,
+         **attrs) -> dict:
+    """One finished span; `ctx` is a payload's `_trace` (its span_id becomes the parent)."""
+    return {
+        "trace_id": ctx.get("trace_id"), "span_id": span_id or new_span_id(), "parent_id": ctx.get("span_id"),
+        "name": name, "service": service, "start": round(start, 6),
+        "duration_ms": round(max(0.0, end - start) * 1000, 3),
+        "attrs": {k: v for k, v in attrs.items() if v is not None},
+    }
+
+def make_exporter(names: str | None = None) -> Exporter | None:
+    """Exporter(s) for TRACE_EXPORTERS; None when tracing is off."""
+    out = []
+    for name in (names if names is not None else EXPORTERS).split(","):
+        name = name.strip().lower()
+        if name in ("", "none"):
+            continue
+        if name == "redis":
+            out.append(RedisExporter())
+        elif name == "ndjson":
+            out.append(NDJSONExporter())
+        else:
+            raise ValueError(f"unknown trace exporter {name!r} (expected redis, ndjson or none)")
+    if not out:
+        return None
+    return out[0] if len(out) == 1 else MultiExporter(out)
+
+__all__ = ["Exporter", "MultiExporter", "NDJSONExporter", "RedisExporter", "PAYLOAD_KEY", "make_exporter",
+           "new_span_id", "new_trace_id", "parse_traceparent", "read_trace", "span", "traceparent"]
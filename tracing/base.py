@@ -0,0 +1,19 @@
+# tracing/base.py
+from __future__ import annotations
+
+class Exporter:
+    name = "base"
+
+    def export(self, w, run_id: str, spans: list[dict]) -> None:
+        """Hand off finished spans of one run; Redis writes go on `w` (client, pipeline or Deferred)."""
+        raise NotImplementedError
+
+class MultiExporter(Exporter):
+    name = "multi"
+
+    def __init__(self, exporters: list[Exporter]):
+        self.exporters = exporters
+
+    def export(self, w, run_id: str, spans: list[dict]) -> None:
+        for e in self.exporters:
+            e.export(w, run_id, spans)
@@ -0,0 +1,22 @@
+# tracing/ndjson.py
+from __future__ import annotations
+import os, json, threading
+
+from tracing.base import Exporter
+
+PATH = os.getenv("TRACE_NDJSON_PATH", "/tmp/scw-traces.ndjson")
+
+class NDJSONExporter(Exporter):
+    """One JSON span per line, appended to a local file (jq / pandas.read_json(lines=True))."""
+    name = "ndjson"
+
+    def __init__(self, path: str = PATH):
+        self.path = path
+        self._lock = threading.Lock()  # worker slots export concurrently
+
+    def export(self, w, run_id: str, spans: list[dict]) -> None:
+        if not spans:
+            return
+        data = "".join(json.dumps({"run_id": run_id, **s}, separators=(",", ":")) + "\n" for s in spans)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
@@ -0,0 +1,42 @@
+# tracing/store.py
+"""
+Spans of a run in Redis, for GET /v1/runs/{id}/trace:
+
+  run:{id}:trace   list of span JSON, in export order (API span first)
+
+Capped at TRACE_MAX_SPANS (retries add spans) and expired TRACE_TTL_SEC after the last write.
+"""
+from __future__ import annotations
+import os, json
+
+from tracing.base import Exporter
+
+MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "200"))
+TTL_SEC = int(os.getenv("TRACE_TTL_SEC", str(7 * 86400)))
+
+def trace_key(run_id: str) -> str:
+    return f"run:{run_id}:trace"
+
+class RedisExporter(Exporter):
+    name = "redis"
+
+    def __init__(self, max_spans: int = MAX_SPANS, ttl_sec: int = TTL_SEC):
+        self.max_spans, self.ttl_sec = max_spans, ttl_sec
+
+    def export(self, w, run_id: str, spans: list[dict]) -> None:
+        if not spans:
+            return
+        key = trace_key(run_id)
+        w.rpush(key, *(json.dumps(s, separators=(",", ":")) for s in spans))
+        w.ltrim(key, -self.max_spans, -1)
+        w.expire(key, self.ttl_sec)
+
+def read_trace(r, run_id: str) -> list[dict]:
+    """Spans of a run ordered by start time."""
+    spans = []
+    for raw in r.lrange(trace_key(run_id), 0, -1) or []:
+        try:
+            spans.append(json.loads(raw))
+        except ValueError:
+            continue
+    return sorted(spans, key=lambda s: s.get("start") or 0)
@@ -151,7 +151,7 @@ export default function Home() {
             const jr = await fetch(`${apiUrl}/v1/runs/${d2.run_id}`);
             const j = await jr.json();
             setResult(j);
-            if (j.status === "completed" || j.status === "failed") {
+            if (j.status === "completed" || j.status === "failed" || j.status === "timeout") {
               clearInterval(poll);
               setStatusMsg(`Run ${j.status}.`);
             }
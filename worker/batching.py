@@ -0,0 +1,69 @@
+# batching.py
+"""
+Helpers for multi-job dequeue.
+
+BatchSizer  - picks how many items to pop per round trip from the observed
+              queue depth (EWMA). Shallow queue -> 1 (blocking pop).
+Deferred    - records Redis writes for one run so the dispatcher can flush the
+              writes of every run that finished together in one pipeline.
+"""
+from __future__ import annotations
+import os, math
+from typing import Any, Callable
+
+BATCH_MAX = int(os.getenv("WORKER_BATCH_MAX", "1"))
+# Below this (smoothed) depth the worker goes back to one blocking pop at a time
+BATCH_MIN_DEPTH = int(os.getenv("WORKER_BATCH_MIN_DEPTH", "4"))
+# Take at most 1/BATCH_SHARE of the visible queue per pop, leaving work for other workers
+BATCH_SHARE = float(os.getenv("WORKER_BATCH_SHARE", "4"))
+
+class BatchSizer:
+    def __init__(self, max_size: int = BATCH_MAX, min_depth: int = BATCH_MIN_DEPTH,
+                 share: float = BATCH_SHARE, alpha: float = 0.5):
+        self.max_size, self.min_depth = max(1, max_size), min_depth
+        self.share, self.alpha = max(1.0, share), alpha
+        self.depth = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 1
+
+    def observe(self, depth: int) -> None:
+        self.depth += self.alpha * (depth - self.depth)
+
+    def size(self) -> int:
+        if not self.enabled or self.depth < self.min_depth:
+            return 1
+        return max(1, min(self.max_size, math.ceil(self.depth / self.share)))
+
+class Deferred:
+    """Quacks like a redis client for writes; nothing is sent until flush()."""
+
+    def __init__(self):
+        self.ops: list[tuple[str, tuple, dict]] = []
+        self.callbacks: list[Callable[[], Any]] = []
+
+    def __getattr__(self, name: str):
+        def record(*args, **kwargs):
+            self.ops.append((name, args, kwargs))
+        return record
+
+    def after(self, fn: Callable[[], Any]) -> None:
+        """Run fn once this run's writes are on the server."""
+        self.callbacks.append(fn)
+
+def flush(r, writers: list[Deferred]) -> None:
+    """One pipeline for every recorded write, then the post-write callbacks."""
+    writers = [w for w in writers if w.ops or w.callbacks]
+    if not writers:
+        return
+    p = r.pipeline(transaction=False)
+    for w in writers:
+        for name, args, kwargs in w.ops:
+            getattr(p, name)(*args, **kwargs)
+    p.execute()
+    for w in writers:
+        for fn in w.callbacks:
+            fn()
+        w.ops.clear()
+        w.callbacks.clear()
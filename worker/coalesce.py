@@ -0,0 +1,95 @@
+# coalesce.py
+"""
+In-flight coalescing of identical runs.
+
+The first worker to start a given fingerprint (language + limits + code) takes a
+short-lived lease `inflight:{fp}`. Workers that dequeue the same fingerprint
+while the lease is held wait for the leader's outcome instead of executing:
+on success they copy the leader's result server-side (COPY), otherwise they
+fall back to executing the run themselves. A leader that dies simply lets its
+lease expire, which also releases the followers.
+
+A waiting follower keeps its execution slot and, with project quotas on, its
+project's concurrency lease (renewed by the heartbeat) while it polls. So the
+wait is capped at RUNS_COALESCE_WAIT_SEC (30 s by default, well below the
+leader's lease): past that the follower stops waiting and executes itself.
+"""
+from __future__ import annotations
+import os, time, json, hashlib
+
+from records import RUN_FIELDS
+
+LEASE_SEC = int(os.getenv("RUNS_COALESCE_LEASE_SEC", "120"))
+WAIT_SEC = min(float(os.getenv("RUNS_COALESCE_WAIT_SEC", "30")), LEASE_SEC)
+DONE_TTL_SEC = int(os.getenv("RUNS_COALESCE_DONE_TTL_SEC", "30"))
+POLL_SEC = 0.05
+
+# Release the lease only if we still own it, and publish the outcome atomically
+_PUBLISH_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then redis.call('DEL', KEYS[1]) end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', tonumber(ARGV[3]))
+return 1
+"""
+
+def fingerprint(payload: dict, limits=None) -> str:
+    """
+    Project is deliberately not part of it: identical code coalesces across
+    projects. The run's resolved CPU/wall limits (limits.Limits) are, so a
+    follower never gets a result produced under limits its own project lacks.
+    """
+    h = hashlib.sha256()
+    h.update((payload.get("language") or "").encode())
+    h.update(b"|")
+    if limits is not None:
+        h.update(f"{limits.cpu_sec}|{limits.wall_sec}|".encode())
+    h.update((payload.get("code") or "").encode())
+    return h.hexdigest()
+
+class Coalescer:
+    def __init__(self, r):
+        self.r = r
+        self._publish = r.register_script(_PUBLISH_LUA)
+
+    @staticmethod
+    def _keys(fp: str) -> tuple[str, str]:
+        return f"inflight:{fp}", f"inflight:{fp}:done"
+
+    def lead(self, fp: str, run_id: str) -> bool:
+        lease, _ = self._keys(fp)
+        return bool(self.r.set(lease, run_id, nx=True, ex=LEASE_SEC))
+
+    def publish(self, fp: str, run_id: str, status: str) -> None:
+        lease, done = self._keys(fp)
+        try:
+            self._publish(keys=[lease, done], args=[run_id, json.dumps({"run_id": run_id, "status": status}), DONE_TTL_SEC])
+        except Exception:
+            pass  # followers fall back once the lease expires
+
+    def wait(self, fp: str, timeout: float = WAIT_SEC) -> dict | None:
+        """Leader outcome, or None if the lease vanished without one (or we timed out)."""
+        lease, done = self._keys(fp)
+        deadline = time.monotonic() + timeout
+        delay = POLL_SEC
+        while time.monotonic() < deadline:
+            holder, outcome = self.r.mget(lease, done)
+            if outcome:
+                try:
+                    return json.loads(outcome)
+                except Exception:
+                    return None
+            if holder is None:
+                return None
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+        return None
+
+    def copy_result(self, leader_run_id: str, run_id: str) -> bool:
+        """Server-side copy of the result, or of its blob reference (output.py)."""
+        if self.r.copy(f"run:{leader_run_id}:result", f"run:{run_id}:result", replace=True):
+            return True
+        fields = [RUN_FIELDS["result_ref"], RUN_FIELDS["result_bytes"]]
+        ref, size = self.r.hmget(f"run:{leader_run_id}", *fields)
+        if not ref:
+            return False
+        self.r.hset(f"run:{run_id}", mapping=dict(zip(fields, (ref, size or 0))))
+        return True
@@ -0,0 +1,415 @@
+# engine.py
+"""
+Pluggable execution engines behind worker.execute().
+
+WORKER_ENGINE selects the implementation:
+  stub  (default) - no code is run; sleeps briefly and echoes a summary
+  pool            - pre-warmed, resource-limited child interpreters per
+                    language, fed over pipes (see sandbox_runner.py)
+  forkserver      - python runs are forked from a zygote that has already
+                    imported ENGINE_PRELOAD; other languages use the pool
+
+Every engine returns an ExecutionResult carrying the output plus per-run
+resource usage (cpu_time, max_rss_kb, wall_time) for the run hash. Given an
+`on_output` callback, the pool engines hand stdout over in chunks while the
+run executes instead (ENGINE_STREAM_CHUNK_BYTES / ENGINE_STREAM_INTERVAL_SEC)
+and the result's output is left empty.
+"""
+from __future__ import annotations
+import os, sys, time, json, signal, subprocess, threading, selectors
+from dataclasses import dataclass, field
+
+ENGINE = os.getenv("WORKER_ENGINE", "stub").strip().lower()
+# One warm child per execution slot unless told otherwise
+POOL_SIZE = int(os.getenv("ENGINE_POOL_SIZE", os.getenv("WORKER_SLOTS", "1")))
+MAX_JOBS_PER_CHILD = int(os.getenv("ENGINE_MAX_JOBS_PER_CHILD", "100"))
+CPU_LIMIT_SEC = int(os.getenv("ENGINE_CPU_LIMIT_SEC", "10"))
+WALL_LIMIT_SEC = float(os.getenv("ENGINE_WALL_LIMIT_SEC", "30"))
+MEMORY_LIMIT_MB = int(os.getenv("ENGINE_MEMORY_LIMIT_MB", "512"))
+MAX_OUTPUT_BYTES = int(os.getenv("ENGINE_MAX_OUTPUT_BYTES", str(1024 * 1024)))
+STREAM_CHUNK_BYTES = int(os.getenv("ENGINE_STREAM_CHUNK_BYTES", "16384"))
+STREAM_INTERVAL_SEC = float(os.getenv("ENGINE_STREAM_INTERVAL_SEC", "0.5"))
+PRELOAD = [m.strip() for m in os.getenv("ENGINE_PRELOAD", "").split(",") if m.strip()]
+ZYGOTE_GRACE_SEC = 5.0  # the zygote enforces wall time itself; this only guards a stuck zygote
+
+RUNNER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_runner.py")
+
+# language -> argv of a long-lived runner speaking the sandbox_runner protocol
+RUNNERS: dict[str, list[str]] = {
+    "python": [sys.executable, "-u", RUNNER_PATH, "--memory-mb", str(MEMORY_LIMIT_MB), "--preload", ",".join(PRELOAD)],
+}
+# The zygote never runs user code; it applies the memory limit to each forked run
+ZYGOTE_ARGV = [sys.executable, "-u", RUNNER_PATH, "--zygote", "--preload", ",".join(PRELOAD)]
+
+# Sandboxes get this environment, never the worker's (REDIS_URL, tokens, ...)
+SANDBOX_PASSTHROUGH = ("PYTHONPATH", "PYTHONHASHSEED", "PYTHONUTF8")
+
+def sandbox_env() -> dict[str, str]:
+    env = {
+        "PATH": os.getenv("PATH", "/usr/local/bin:/usr/bin:/bin"),
+        "LANG": "C.UTF-8",
+        "HOME": "/tmp",
+        "PYTHONDONTWRITEBYTECODE": "1",
+        "PYTHONIOENCODING": "utf-8",
+        "PYTHONUNBUFFERED": "1",
+    }
+    env.update({k: os.environ[k] for k in SANDBOX_PASSTHROUGH if k in os.environ})
+    return env
+
+@dataclass
+class ExecutionResult:
+    output: str
+    cpu_time: float | None = None
+    max_rss_kb: int | None = None
+    wall_time: float | None = None
+    stderr: str = ""
+    truncated: bool = False
+    extra: dict = field(default_factory=dict)
+
+    def usage(self) -> dict:
+        """Fields for the run hash; missing measurements are left out."""
+        out = {}
+        for k in ("cpu_time", "max_rss_kb", "wall_time"):
+            v = getattr(self, k)
+            if v is not None:
+                out[k] = str(v)
+        return out
+
+# Failure classes: drive the worker's retry policy, counters and DLQ annotation
+RETRYABLE, NON_RETRYABLE, POISON = "retryable", "non_retryable", "poison"
+
+class ExecutionError(Exception):
+    """
+    Run failed. `result` carries whatever usage was measured before the failure.
+    Plain ExecutionErrors are infrastructure trouble (sandbox died, pipe broke): retried.
+    """
+    failure_class = RETRYABLE
+
+    def __init__(self, message: str, result: ExecutionResult | None = None):
+        super().__init__(message)
+        self.result = result
+
+class NonRetryableError(ExecutionError):
+    """Deterministic failure (the code raised, unsupported language, resource limit)."""
+    failure_class = NON_RETRYABLE
+
+class ExecutionTimeout(NonRetryableError):
+    """Wall-clock or CPU-time limit hit; the child was killed. The run ends as `timeout`."""
+
+class PoisonPayload(ExecutionError):
+    """The queued payload itself is unusable (not JSON, not an object)."""
+    failure_class = POISON
+
+def classify(exc: BaseException) -> str:
+    """Failure class of any exception; unknown errors (e.g. Redis hiccups) are retryable."""
+    return exc.failure_class if isinstance(exc, ExecutionError) else RETRYABLE
+
+# --------------------------
+# Stub engine (previous behaviour)
+# --------------------------
+class StubEngine:
+    name = "stub"
+
+    def run(self, payload: dict, cpu_sec: int = CPU_LIMIT_SEC, wall_sec: float = WALL_LIMIT_SEC,
+            on_output=None) -> ExecutionResult:
+        lang = payload.get("language", "python")
+        code = payload.get("code", "")
+        t0 = time.monotonic()
+        time.sleep(0.5)
+        return ExecutionResult(output=f"[{lang}] OK len(code)={len(code)}", wall_time=round(time.monotonic() - t0, 6))
+
+    def close(self) -> None:
+        pass
+
+# --------------------------
+# Pooled subprocess engine
+# --------------------------
+class _Child:
+    def __init__(self, argv: list[str]):
+        # No preexec_fn: slots are threads, and running Python between fork and
+        # exec can deadlock there. The runner sets its own rlimits at start-up.
+        self.proc = subprocess.Popen(
+            argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=sandbox_env(),
+            start_new_session=True,  # own process group, so a kill takes grandchildren too
+            text=True,
+            bufsize=1,
+            close_fds=True,
+        )
+        self.jobs = 0
+        self._buf = b""        # bytes read from the protocol pipe but not yet returned
+        self.rusage = None    # filled in when we reap the child ourselves (kill / death)
+        self.cpu_sec = None   # budget of the job in flight, for the SIGXCPU message
+        hello = self._readline(WALL_LIMIT_SEC)
+        try:
+            self.info = json.loads(hello) if hello else {}
+        except ValueError:
+            self.kill()
+            raise ExecutionError(f"sandbox sent a bad hello line: {hello[:200]!r}")
+        # Child's own cpu seconds after its last reply: a killed job used the rest
+        self.cpu_seen = float(self.info.get("cpu_total") or 0)
+        if not self.info.get("ready"):
+            self.kill()
+            raise ExecutionError("sandbox failed to start")
+
+    def _readline(self, timeout: float) -> str | None:
+        """
+        One protocol line; "" when the child closed the pipe, None on timeout.
+        Reads the fd directly: a buffered readline() could swallow the next
+        line where select() no longer sees it.
+        """
+        deadline = time.monotonic() + timeout
+        fd = self.proc.stdout.fileno()
+        sel = selectors.DefaultSelector()
+        sel.register(fd, selectors.EVENT_READ)
+        try:
+            while b"\n" not in self._buf:
+                if not sel.select(max(0.0, deadline - time.monotonic())):
+                    return None
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    return ""
+                self._buf += chunk
+        finally:
+            sel.close()
+        line, self._buf = self._buf.split(b"\n", 1)
+        return line.decode() + "\n"
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def run(self, job: dict, timeout: float, on_output=None) -> dict:
+        """The job's reply; `{"out": ...}` lines before it go to on_output."""
+        self.jobs += 1
+        self.cpu_sec = job.get("cpu_sec")
+        try:
+            self.proc.stdin.write(json.dumps(job) + "\n")
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            raise self._death_error()
+        t0 = time.monotonic()
+        while True:
+            line = self._readline(max(0.0, t0 + timeout - time.monotonic()))
+            if not line:
+                if line is None:
+                    self.kill()
+                    raise ExecutionTimeout(f"wall time limit exceeded ({timeout:g}s)", self._usage(t0))
+                raise self._death_error(t0)
+            res = json.loads(line)
+            if "out" in res and "ok" not in res:
+                if on_output is not None:
+                    on_output(res["out"])
+                continue
+            self.cpu_seen = float(res.get("cpu_total") or self.cpu_seen)
+            return res
+
+    def _usage(self, t0: float) -> ExecutionResult:
+        """What a job that never replied used: wall time, plus cpu/rss if we reaped the child."""
+        ru = self.rusage
+        return ExecutionResult(
+            "",
+            wall_time=round(time.monotonic() - t0, 6),
+            cpu_time=round(max(0.0, ru.ru_utime + ru.ru_stime - self.cpu_seen), 6) if ru else None,
+            max_rss_kb=ru.ru_maxrss if ru else None,
+        )
+
+    def _death_error(self, t0: float | None = None) -> ExecutionError:
+        code = self._reap(1)
+        if code is None:
+            self.kill()
+        result = self._usage(t0) if t0 is not None else None
+        if code is None:
+            return ExecutionError("sandbox unresponsive", result)
+        if code == -signal.SIGXCPU:
+            return ExecutionTimeout(f"cpu time limit exceeded ({self.cpu_sec or CPU_LIMIT_SEC}s)", result)
+        if code == -signal.SIGKILL:
+            return ExecutionError("sandbox killed (memory limit?)", result)
+        return ExecutionError(f"sandbox crashed (exit code {code})", result)
+
+    def _reap(self, timeout: float) -> int | None:
+        """Popen.wait(), but via wait4() so the child's rusage is kept; None if still running."""
+        deadline = time.monotonic() + timeout
+        while self.proc.returncode is None:
+            try:
+                pid, status, ru = os.wait4(self.proc.pid, os.WNOHANG)
+            except ChildProcessError:
+                self.proc.poll()  # reaped elsewhere; the rusage is gone
+                break
+            if pid:
+                self.proc.returncode = os.waitstatus_to_exitcode(status)
+                self.rusage = ru
+                break
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(0.01)
+        return self.proc.returncode
+
+    def kill(self) -> None:
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except Exception:
+            pass
+        self._reap(2)
+
+class _Pool:
+    """Up to `size` children for one language. Checked out one job at a time."""
+
+    def __init__(self, argv: list[str], size: int, max_jobs: int = MAX_JOBS_PER_CHILD):
+        self.argv, self.size = argv, max(1, size)
+        self.max_jobs = max_jobs
+        self.idle: list[_Child] = []
+        self.total = 0
+        self.cv = threading.Condition()
+
+    def warm(self) -> None:
+        with self.cv:
+            while self.total < self.size:
+                self.idle.append(self._spawn())
+                self.total += 1
+
+    def acquire(self) -> _Child:
+        with self.cv:
+            while True:
+                while self.idle:
+                    child = self.idle.pop()
+                    if child.alive():
+                        return child
+                    self.total -= 1
+                if self.total < self.size:
+                    self.total += 1
+                    break
+                self.cv.wait()
+        try:
+            return self._spawn()
+        except Exception:
+            with self.cv:
+                self.total -= 1
+                self.cv.notify()
+            raise
+
+    def _spawn(self) -> _Child:
+        return _Child(self.argv)
+
+    def release(self, child: _Child) -> None:
+        if child.alive() and (self.max_jobs <= 0 or child.jobs < self.max_jobs):
+            with self.cv:
+                self.idle.append(child)
+                self.cv.notify()
+            return
+        # Crashed or worn out: replace it in the background so the slot stays warm
+        child.kill()
+        threading.Thread(target=self._replace, name="sandbox-respawn", daemon=True).start()
+
+    def _replace(self) -> None:
+        try:
+            fresh = self._spawn()
+        except Exception:
+            with self.cv:
+                self.total -= 1
+                self.cv.notify()
+            return
+        with self.cv:
+            self.idle.append(fresh)
+            self.cv.notify()
+
+    def close(self) -> None:
+        with self.cv:
+            for child in self.idle:
+                child.kill()
+            self.total -= len(self.idle)
+            self.idle.clear()
+
+class PooledEngine:
+    name = "pool"
+
+    def __init__(self, runners: dict[str, list[str]] | None = None, size: int = POOL_SIZE, warm: bool = True):
+        self.pools = {lang: _Pool(argv, size) for lang, argv in (runners or RUNNERS).items()}
+        if warm:
+            self.warm()
+
+    def warm(self) -> None:
+        for pool in self.pools.values():
+            pool.warm()
+
+    def _job(self, payload: dict, cpu_sec: int, wall_sec: float) -> dict:
+        return {"code": payload.get("code", ""), "cpu_sec": cpu_sec, "max_output": MAX_OUTPUT_BYTES,
+                "stream_bytes": STREAM_CHUNK_BYTES, "stream_sec": STREAM_INTERVAL_SEC}
+
+    def _reply_timeout(self, lang: str, wall_sec: float) -> float:
+        return wall_sec
+
+    def run(self, payload: dict, cpu_sec: int = CPU_LIMIT_SEC, wall_sec: float = WALL_LIMIT_SEC,
+            on_output=None) -> ExecutionResult:
+        lang = (payload.get("language") or "python").lower()
+        pool = self.pools.get(lang)
+        if pool is None:
+            raise NonRetryableError(f"unsupported language: {lang}")
+        if not isinstance(payload.get("code", ""), str):
+            raise PoisonPayload(f"code must be a string, got {type(payload.get('code')).__name__}")
+        job = self._job(payload, cpu_sec, wall_sec)
+        collected: list[str] = []
+        child = pool.acquire()
+        try:
+            res = child.run(job, self._reply_timeout(lang, wall_sec), on_output or collected.append)
+        finally:
+            pool.release(child)
+        result = ExecutionResult(
+            output="".join(collected) or res.get("stdout", ""),
+            cpu_time=res.get("cpu_time"),
+            max_rss_kb=res.get("max_rss_kb"),
+            wall_time=res.get("wall_time"),
+            stderr=res.get("stderr", ""),
+            truncated=bool(res.get("truncated")),
+        )
+        if res.get("timeout"):
+            # Wall limit in the zygote, or SIGXCPU: the run was killed
+            raise ExecutionTimeout(res.get("error") or "time limit exceeded", result)
+        if not res.get("ok"):
+            # The runner tags failures of the user's code ("code") and of its limits ("limit")
+            err = NonRetryableError if res.get("kind") in ("code", "limit") else ExecutionError
+            raise err(res.get("error") or "execution failed", result)
+        return result
+
+    def close(self) -> None:
+        for pool in self.pools.values():
+            pool.close()
+
+class ForkServerEngine(PooledEngine):
+    """
+    Python runs fork from a zygote that already imported ENGINE_PRELOAD, so a
+    run pays for fork() instead of interpreter start-up plus imports. Each run
+    gets its own process: nothing leaks between runs, and cpu/rss are exact.
+    """
+    name = "forkserver"
+
+    def __init__(self, runners: dict[str, list[str]] | None = None, size: int = POOL_SIZE, warm: bool = True,
+                 zygote_argv: list[str] | None = None):
+        super().__init__(runners, size, warm=False)
+        # Zygotes never run user code, so they are never recycled for age
+        self.pools["python"] = _Pool(zygote_argv or ZYGOTE_ARGV, size, max_jobs=0)
+        if warm:
+            self.warm()
+
+    def _job(self, payload: dict, cpu_sec: int, wall_sec: float) -> dict:
+        job = super()._job(payload, cpu_sec, wall_sec)
+        if (payload.get("language") or "python").lower() == "python":
+            job.update(wall_sec=wall_sec, memory_mb=MEMORY_LIMIT_MB)
+        return job
+
+    def _reply_timeout(self, lang: str, wall_sec: float) -> float:
+        return wall_sec + ZYGOTE_GRACE_SEC if lang == "python" else wall_sec
+
+ENGINES = {
+    "stub": StubEngine,
+    "pool": PooledEngine,
+    "forkserver": ForkServerEngine,
+}
+
+def make_engine(name: str = ENGINE):
+    try:
+        return ENGINES[name]()
+    except KeyError:
+        raise ValueError(f"unknown WORKER_ENGINE '{name}' (choose from: {', '.join(ENGINES)})")
@@ -0,0 +1,106 @@
+# heartbeat.py
+"""
+Per-worker live stats, published as a heartbeat.
+
+Every worker owns one field (its worker id) in the WORKER_HEARTBEAT_KEY hash;
+the value is a small JSON document refreshed every WORKER_HEARTBEAT_SEC.
+/v1/ops/metrics reads the whole hash with one HGETALL and ignores entries
+whose `ts` is older than WORKER_HEARTBEAT_TTL_SEC.
+"""
+from __future__ import annotations
+import os, time, json, socket, threading
+from collections import deque
+from typing import Callable
+
+HEARTBEAT_KEY = os.getenv("WORKER_HEARTBEAT_KEY", "workers:heartbeat")
+HEARTBEAT_SEC = float(os.getenv("WORKER_HEARTBEAT_SEC", "5"))
+HEARTBEAT_TTL = int(os.getenv("WORKER_HEARTBEAT_TTL_SEC", "30"))
+STATS_WINDOW = float(os.getenv("WORKER_STATS_WINDOW_SEC", "60"))
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+class WorkerStats:
+    """Sliding-window counters for one worker. Thread-safe."""
+
+    def __init__(self, slots: int = 1, window: float = STATS_WINDOW):
+        self.slots = max(1, slots)
+        self.window = window
+        self.started_at = time.time()
+        self._done: deque[tuple[float, float]] = deque()  # (finished_at, exec_seconds)
+        self._current: dict[str, float] = {}              # run_id -> started_at
+        self._lock = threading.Lock()
+
+    def start(self, run_id: str) -> None:
+        with self._lock:
+            self._current[run_id] = time.time()
+
+    def finish(self, run_id: str) -> None:
+        now = time.time()
+        with self._lock:
+            started = self._current.pop(run_id, None)
+            if started is not None:
+                self._done.append((now, now - started))
+            self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.window
+        while self._done and self._done[0][0] < cutoff:
+            self._done.popleft()
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            span = max(1e-6, min(self.window, now - self.started_at))
+            cutoff = now - span
+            done = len(self._done)
+            exec_total = sum(d for _, d in self._done)
+            # Busy time inside the window, including jobs still running
+            busy = sum(min(d, t - cutoff) for t, d in self._done)
+            busy += sum(now - max(s, cutoff) for s in self._current.values())
+            current = list(self._current)
+        return {
+            "ts": now,
+            "current_job": current[0] if current else None,
+            "busy": len(current),
+            "slots": self.slots,
+            "jobs_in_window": done,
+            "jobs_per_sec": round(done / span, 4),
+            "avg_exec_sec": round(exec_total / done, 4) if done else None,
+            "utilisation": round(min(1.0, busy / (span * self.slots)), 4),
+            "window_sec": self.window,
+        }
+
+class Heartbeat(threading.Thread):
+    """Background publisher. A failed write is skipped; the next beat retries."""
+
+    def __init__(self, r, stats: WorkerStats, worker_id: str = WORKER_ID, interval: float = HEARTBEAT_SEC,
+                 on_beat: Callable[[], None] | None = None):
+        super().__init__(name="heartbeat", daemon=True)
+        self.r, self.stats, self.worker_id = r, stats, worker_id
+        self.on_beat = on_beat  # e.g. lease renewal (quota.py)
+        self.interval = max(0.5, interval)
+        self.stopped = threading.Event()
+
+    def beat(self) -> None:
+        try:
+            p = self.r.pipeline(transaction=False)
+            p.hset(HEARTBEAT_KEY, self.worker_id, json.dumps(self.stats.snapshot()))
+            # Whole hash disappears once every worker is gone
+            p.expire(HEARTBEAT_KEY, HEARTBEAT_TTL * 4)
+            p.execute()
+            if self.on_beat is not None:
+                self.on_beat()
+        except Exception:
+            pass
+
+    def run(self) -> None:
+        self.beat()
+        while not self.stopped.wait(self.interval):
+            self.beat()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        try:
+            self.r.hdel(HEARTBEAT_KEY, self.worker_id)
+        except Exception:
+            pass
@@ -0,0 +1,65 @@
+# limits.py
+"""
+Per-run CPU-time and wall-clock limits.
+
+Resolved for each run, most specific first, from the `config:` keys the ops
+API manages (api/routes/ops.py, POST /v1/ops/limits/...):
+
+  config:RUN_CPU_LIMIT_SEC:{project_id}      config:RUN_WALL_LIMIT_SEC:{project_id}
+  config:RUN_CPU_LIMIT_SEC:lang:{language}   config:RUN_WALL_LIMIT_SEC:lang:{language}
+  config:RUN_CPU_LIMIT_SEC                   config:RUN_WALL_LIMIT_SEC
+
+then ENGINE_CPU_LIMIT_SEC / ENGINE_WALL_LIMIT_SEC. Missing, zero or garbage
+values fall through. One MGET per (project, language), cached for
+RUN_LIMITS_CACHE_SEC so a busy project does not cost a round trip per run.
+"""
+from __future__ import annotations
+import os, time, threading
+from dataclasses import dataclass
+
+from engine import CPU_LIMIT_SEC, WALL_LIMIT_SEC
+
+CACHE_SEC = float(os.getenv("RUN_LIMITS_CACHE_SEC", "10"))
+CPU_KEY, WALL_KEY = "config:RUN_CPU_LIMIT_SEC", "config:RUN_WALL_LIMIT_SEC"
+
+@dataclass(frozen=True)
+class Limits:
+    cpu_sec: int
+    wall_sec: float
+
+def _first(values: list[str | None], cast, default):
+    for v in values:
+        try:
+            n = cast(float(v))
+        except (TypeError, ValueError):
+            continue
+        if n > 0:
+            return n
+    return default
+
+class LimitResolver:
+    def __init__(self, r, cache_sec: float = CACHE_SEC):
+        self.r, self.cache_sec = r, cache_sec
+        self._cache: dict[tuple[str, str], tuple[float, Limits]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def keys(project: str, language: str) -> list[str]:
+        scopes = [f":{project}", f":lang:{language}", ""]
+        return [f"{CPU_KEY}{s}" for s in scopes] + [f"{WALL_KEY}{s}" for s in scopes]
+
+    def get(self, payload: dict) -> Limits:
+        project = str(payload.get("project_id") or "")
+        language = (payload.get("language") or "python").lower()
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get((project, language))
+        if hit is not None and hit[0] > now:
+            return hit[1]
+        values = self.r.mget(self.keys(project, language))
+        if not project:
+            values[0] = values[3] = None
+        limits = Limits(_first(values[:3], int, CPU_LIMIT_SEC), _first(values[3:], float, WALL_LIMIT_SEC))
+        with self._lock:
+            self._cache[(project, language)] = (now + self.cache_sec, limits)
+        return limits
@@ -0,0 +1,101 @@
+# metrics.py
+"""
+Worker-side Prometheus metrics.
+
+One persistent registry per worker process holds real cumulative counters and
+histograms. Nothing here touches the network on the hot path:
+  - PUSHGATEWAY_URL set   -> a background thread pushes the registry every
+                             PUSHGATEWAY_INTERVAL_SEC (and once more at exit)
+  - WORKER_METRICS_PORT   -> an in-process HTTP server exposes /metrics for
+                             pull-based scraping
+prometheus_client is optional; without it every metric is a no-op.
+"""
+from __future__ import annotations
+import os, threading, atexit
+
+from heartbeat import WORKER_ID
+
+PUSHGATEWAY_URL = os.getenv("PUSHGATEWAY_URL", "").strip()
+PUSH_INTERVAL = float(os.getenv("PUSHGATEWAY_INTERVAL_SEC", "15"))
+METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0") or 0)
+# Pushgateway grouping key: every process needs its own, or each push replaces the others' counters
+INSTANCE = os.getenv("RENDER_INSTANCE_ID") or WORKER_ID
+# Shared by the local histograms and the Redis bucket counters (timings.py)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+try:
+    from prometheus_client import CollectorRegistry, Counter, Histogram, push_to_gateway, start_http_server
+    ENABLED = True
+except ImportError:  # metrics stay optional for the worker image
+    ENABLED = False
+
+class _Noop:
+    """Stand-in for a metric when prometheus_client is not installed."""
+    def labels(self, *a, **kw): return self
+    def inc(self, *a, **kw): pass
+    def observe(self, *a, **kw): pass
+    def set(self, *a, **kw): pass
+
+if ENABLED:
+    REGISTRY = CollectorRegistry()
+    RUNS_PROCESSED = Counter("scw_worker_runs_processed_total", "Processed runs", ["language"], registry=REGISTRY)
+    RUNS_FAILED = Counter("scw_worker_runs_failed_total", "Runs that exhausted their retries", ["language"], registry=REGISTRY)
+    RUNS_RETRIED = Counter("scw_worker_runs_retried_total", "Run attempts that were re-queued", ["language"], registry=REGISTRY)
+    RUN_FAILURES = Counter("scw_worker_run_failures_total", "Failed attempts by failure class",
+                           ["language", "class"], registry=REGISTRY)
+    RUNS_COALESCED = Counter("scw_worker_runs_coalesced_total", "Runs answered from an identical in-flight run", ["language"], registry=REGISTRY)
+    QUEUE_WAIT_SECONDS = Histogram("scw_worker_queue_wait_seconds", "Dequeue time minus enqueue time",
+                                   ["language", "attempt"], buckets=LATENCY_BUCKETS, registry=REGISTRY)
+    EXEC_SECONDS = Histogram("scw_worker_execution_seconds", "Time spent in execute()",
+                             ["language", "attempt"], buckets=LATENCY_BUCKETS, registry=REGISTRY)
+    TOTAL_SECONDS = Histogram("scw_worker_total_seconds", "Submission to final status",
+                              ["language", "attempt"], buckets=LATENCY_BUCKETS, registry=REGISTRY)
+else:
+    REGISTRY = None
+    RUNS_PROCESSED = RUNS_FAILED = RUNS_RETRIED = RUNS_COALESCED = RUN_FAILURES = _Noop()
+    QUEUE_WAIT_SECONDS = EXEC_SECONDS = TOTAL_SECONDS = _Noop()
+
+def push() -> bool:
+    """Push the whole registry once. Failures are swallowed; the next tick retries."""
+    if not (ENABLED and PUSHGATEWAY_URL):
+        return False
+    try:
+        push_to_gateway(PUSHGATEWAY_URL, job="scw_worker", registry=REGISTRY, grouping_key={"instance": INSTANCE})
+        return True
+    except Exception:
+        return False
+
+class _Pusher(threading.Thread):
+    def __init__(self, interval: float):
+        super().__init__(name="metrics-pusher", daemon=True)
+        self.interval = max(1.0, interval)
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            push()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        push()  # final flush so the last interval is not lost
+
+_pusher: _Pusher | None = None
+_started = False
+
+def start_exporter() -> None:
+    """Start the optional pull endpoint and push thread. Safe to call more than once."""
+    global _pusher, _started
+    if _started:
+        return
+    _started = True
+    if not ENABLED:
+        if PUSHGATEWAY_URL or METRICS_PORT:
+            print("prometheus_client not installed; worker metrics disabled")
+        return
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT, registry=REGISTRY)
+        print(f"Worker metrics on :{METRICS_PORT}/metrics")
+    if PUSHGATEWAY_URL:
+        _pusher = _Pusher(PUSH_INTERVAL)
+        _pusher.start()
+        atexit.register(_pusher.stop)
@@ -0,0 +1,82 @@
+# output.py
+"""
+Run output streamed into Redis while the run executes.
+
+  run:{id}:result   list of stdout chunks, appended as the engine hands them over
+
+A non-streaming engine (stub) still ends with a plain string in the same key.
+Readers join the list on demand (api/main.py); a retry starts the list over.
+The worker never holds more than the chunk in flight.
+
+With a blob store configured (BLOB_STORE, see blobstore/), output beyond
+BLOB_THRESHOLD_BYTES is spilled to a blob instead: the chunks so far are
+copied over once, the rest goes straight to the blob, and on success the
+Redis key is replaced by `result_ref` / `result_bytes` on the run hash. Until
+then the Redis list keeps the first BLOB_THRESHOLD_BYTES as a live preview.
+"""
+from __future__ import annotations
+import os
+
+from blobstore import BlobStore, BlobWriter, THRESHOLD_BYTES
+from records import encode_run
+
+MAX_CHUNKS = int(os.getenv("RUN_OUTPUT_MAX_CHUNKS", "4096"))  # backstop on top of ENGINE_MAX_OUTPUT_BYTES
+
+class OutputStream:
+    def __init__(self, r, run_id: str, store: BlobStore | None = None, threshold: int = THRESHOLD_BYTES):
+        self.r, self.run_id, self.key = r, run_id, f"run:{run_id}:result"
+        self.store, self.threshold = store, threshold
+        self.chunks = self.bytes = 0
+        self.blob: BlobWriter | None = None
+
+    def _size(self, text: str) -> int:
+        return len(text.encode("utf-8", "replace"))
+
+    def _spill(self) -> None:
+        self.blob = self.store.writer(f"result/{self.run_id}")
+        for chunk in self.r.lrange(self.key, 0, -1) if self.chunks else []:
+            self.blob.write(chunk)
+
+    def write(self, text: str) -> None:
+        """Engine callback (slot thread): one live round trip per chunk, so clients see it now."""
+        if not text:
+            return
+        self.bytes += self._size(text)
+        if self.blob is None and self.store is not None and self.bytes > self.threshold:
+            self._spill()
+        if self.blob is not None:
+            self.blob.write(text)
+            return
+        if self.chunks >= MAX_CHUNKS:
+            return
+        p = self.r.pipeline(transaction=False)
+        if not self.chunks:
+            p.delete(self.key)  # output of an earlier attempt
+        p.rpush(self.key, text)
+        p.execute()
+        self.chunks += 1
+
+    def finish(self, w, output: str = "") -> None:
+        """Final result on `w`: the chunks / `output` from a non-streaming engine, or a blob reference."""
+        if output and self.blob is None and self.store is not None and self.bytes + self._size(output) > self.threshold:
+            self._spill()
+        if self.blob is not None:
+            if output:
+                self.blob.write(output)
+            ref = self.blob.commit()
+            self.blob = None
+            w.delete(self.key)
+            size = self.bytes + self._size(output)
+            w.hset(f"run:{self.run_id}", mapping=encode_run({"result_ref": ref, "result_bytes": size}))
+            return
+        if self.chunks:
+            if output:
+                w.rpush(self.key, output)
+            return
+        w.set(self.key, output)
+
+    def abort(self) -> None:
+        """Failed attempt: drop the unpublished blob; the Redis preview stays."""
+        if self.blob is not None:
+            self.blob.abort()
+            self.blob = None
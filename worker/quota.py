@@ -0,0 +1,149 @@
+# quota.py
+"""
+Per-project execution concurrency quotas.
+
+  quota:leases:{project}   zset run_id -> lease expiry (Redis TIME); one entry per executing run
+  quota:held:{project}     runs dequeued while the project was at its limit (FIFO)
+  quota:held               set of projects with held runs
+
+Limits are read inside the scripts, the same way api/routes/ops.py get_cfg does:
+`config:PROJECT_MAX_CONCURRENCY:{project}`, then `config:PROJECT_MAX_CONCURRENCY`,
+then the PROJECT_MAX_CONCURRENCY env var. 0 / unset = unlimited.
+
+A dequeued run either takes a lease or is parked on the holding list (its queue
+entry is acked). Finishing a run releases its lease and, in the same script,
+promotes the oldest held run of that project with a fresh lease. Nothing polls
+a full project; a periodic sweep only catches runs whose releasing worker died
+(its leases expire after QUOTA_LEASE_SEC unless renewed by the heartbeat).
+"""
+from __future__ import annotations
+import os, json, threading
+
+DEFAULT_LIMIT = int(os.getenv("PROJECT_MAX_CONCURRENCY", "0") or 0)
+LEASE_SEC = int(os.getenv("QUOTA_LEASE_SEC", "60"))
+SWEEP_SEC = float(os.getenv("QUOTA_SWEEP_SEC", "10"))
+CFG_KEY = "config:PROJECT_MAX_CONCURRENCY"
+HELD_SET = "quota:held"
+
+# Shared prologue: limit lookup, clock, expired-lease cleanup
+_PROLOGUE = """
+local limit = tonumber(redis.call('GET', KEYS[4]) or redis.call('GET', KEYS[5]) or ARGV[3]) or 0
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+local function lease(run_id)
+  redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), run_id)
+  redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]) * 2)
+end
+"""
+
+# KEYS: leases, held list, held set, project limit, default limit
+# ARGV: run_id, lease_sec, env limit, project, raw payload
+_ADMIT_LUA = _PROLOGUE + """
+if limit <= 0 then return 1 end
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) or redis.call('ZCARD', KEYS[1]) < limit then
+  lease(ARGV[1])
+  return 1
+end
+redis.call('LPUSH', KEYS[2], ARGV[5])
+redis.call('SADD', KEYS[3], ARGV[4])
+return 0
+"""
+
+# Same KEYS; ARGV: finished run_id ('' for a sweep), lease_sec, env limit, project
+_PROMOTE_LUA = _PROLOGUE + """
+if ARGV[1] ~= '' then redis.call('ZREM', KEYS[1], ARGV[1]) end
+if limit > 0 and redis.call('ZCARD', KEYS[1]) >= limit then return false end
+local item = redis.call('RPOP', KEYS[2])
+if redis.call('LLEN', KEYS[2]) == 0 then redis.call('SREM', KEYS[3], ARGV[4]) end
+if not item then return false end
+if limit > 0 then
+  local ok, payload = pcall(cjson.decode, item)
+  lease((ok and type(payload) == 'table' and payload.run_id) or item)
+end
+return item
+"""
+
+# KEYS: leases   ARGV: lease_sec, run_id...
+_RENEW_LUA = """
+local t = redis.call('TIME')
+local expiry = tonumber(t[1]) + tonumber(t[2]) / 1000000 + tonumber(ARGV[1])
+for i = 2, #ARGV do redis.call('ZADD', KEYS[1], 'XX', expiry, ARGV[i]) end
+return 1
+"""
+
+class ProjectQuota:
+    def __init__(self, r, lease_sec: int = LEASE_SEC, default_limit: int = DEFAULT_LIMIT):
+        self.r, self.lease_sec, self.default_limit = r, lease_sec, default_limit
+        self._admit = r.register_script(_ADMIT_LUA)
+        self._promote = r.register_script(_PROMOTE_LUA)
+        self._renew = r.register_script(_RENEW_LUA)
+        self.leases: dict[str, str] = {}  # run_id -> project, for runs this worker executes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _keys(project: str) -> list[str]:
+        return [f"quota:leases:{project}", f"quota:held:{project}", HELD_SET,
+                f"{CFG_KEY}:{project}", CFG_KEY]
+
+    def _args(self, run_id: str, project: str) -> list:
+        return [run_id, self.lease_sec, self.default_limit, project]
+
+    def _track(self, run_id: str, project: str) -> None:
+        with self._lock:
+            self.leases[run_id] = project
+
+    def admit(self, runs: list[tuple[dict, str]]) -> list[bool]:
+        """One pipelined round trip for a dequeued batch of (payload, raw); False = parked."""
+        checked = [(i, p) for i, (p, _) in enumerate(runs) if p.get("project_id") and p.get("run_id")]
+        out = [True] * len(runs)
+        if not checked:
+            return out
+        pipe = self.r.pipeline(transaction=False)
+        for i, payload in checked:
+            project = str(payload["project_id"])
+            self._admit(keys=self._keys(project), args=[*self._args(payload["run_id"], project), runs[i][1]],
+                        client=pipe)
+        for (i, payload), ok in zip(checked, pipe.execute()):
+            out[i] = bool(ok)
+            if ok:
+                self._track(payload["run_id"], str(payload["project_id"]))
+        return out
+
+    def release(self, run_id: str) -> str | None:
+        """Drop our lease; returns the project's next held run (already leased to us), if any."""
+        with self._lock:
+            project = self.leases.pop(run_id, None)
+        if project is None:
+            return None
+        return self._promote_one(project, run_id)
+
+    def _promote_one(self, project: str, run_id: str = "") -> str | None:
+        item = self._promote(keys=self._keys(project), args=self._args(run_id, project))
+        if item:
+            try:
+                self._track(json.loads(item)["run_id"], project)
+            except Exception:
+                pass  # the worker dead-letters it as poison
+        return item
+
+    def sweep(self) -> list[str]:
+        """Held runs of projects with free capacity (e.g. after a worker died holding leases)."""
+        out = []
+        for project in self.r.smembers(HELD_SET) or []:
+            while (item := self._promote_one(project)) is not None:
+                out.append(item)
+        return out
+
+    def renew(self) -> None:
+        """Extend this worker's leases; called from the heartbeat thread."""
+        with self._lock:
+            by_project: dict[str, list[str]] = {}
+            for run_id, project in self.leases.items():
+                by_project.setdefault(project, []).append(run_id)
+        if not by_project:
+            return
+        pipe = self.r.pipeline(transaction=False)
+        for project, run_ids in by_project.items():
+            self._renew(keys=[f"quota:leases:{project}"], args=[self.lease_sec, *run_ids], client=pipe)
+        pipe.execute()
@@ -0,0 +1,69 @@
+# runlog.py
+"""
+Bounded, chunked per-run logs.
+
+`run:{id}:logs` holds chunks (newest first), each at most RUN_LOG_CHUNK_LINES
+lines and RUN_LOG_CHUNK_BYTES bytes. Every append is LPUSH + LTRIM in the same
+pipeline, keeping the newest MAX_CHUNKS chunks, so a run never keeps more than
+RUN_LOG_MAX_LINES lines / RUN_LOG_MAX_BYTES bytes no matter how much it writes.
+
+`log_lines` on the run hash counts every line ever appended; the API compares
+it with what is still in the list to report "N lines dropped". A flush does not
+touch `updated_at`: the status write it ships with already does.
+"""
+from __future__ import annotations
+import os
+
+from records import RUN_FIELDS
+
+LOG_LINES_FIELD = RUN_FIELDS["log_lines"]
+
+LOG_MAX_LINES = int(os.getenv("RUN_LOG_MAX_LINES", "2000"))
+LOG_MAX_BYTES = int(os.getenv("RUN_LOG_MAX_BYTES", str(512 * 1024)))
+CHUNK_LINES = max(1, int(os.getenv("RUN_LOG_CHUNK_LINES", "50")))
+CHUNK_BYTES = max(256, int(os.getenv("RUN_LOG_CHUNK_BYTES", str(16 * 1024))))
+MAX_CHUNKS = max(1, min(LOG_MAX_LINES // CHUNK_LINES, LOG_MAX_BYTES // CHUNK_BYTES))
+
+_CUT = " …[line truncated]"
+
+def _fit(line: str) -> str:
+    data = line.encode("utf-8", "replace")
+    if len(data) <= CHUNK_BYTES:
+        return line
+    keep = CHUNK_BYTES - len(_CUT.encode())
+    return data[:keep].decode("utf-8", "ignore") + _CUT
+
+class RunLog:
+    """Accumulates lines for one run and emits full chunks."""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.lines: list[str] = []
+        self.size = 0
+        self.ready: list[tuple[str, int]] = []  # (chunk text, line count)
+
+    def write(self, text: str) -> None:
+        for line in str(text).splitlines() or [""]:
+            line = _fit(line)
+            n = len(line.encode("utf-8", "replace")) + 1
+            if self.lines and (len(self.lines) >= CHUNK_LINES or self.size + n > CHUNK_BYTES):
+                self._seal()
+            self.lines.append(line)
+            self.size += n
+
+    def _seal(self) -> None:
+        if self.lines:
+            self.ready.append(("\n".join(self.lines), len(self.lines)))
+            self.lines, self.size = [], 0
+
+    def flush(self, w) -> None:
+        """Record every pending chunk on `w` (client, pipeline or Deferred)."""
+        self._seal()
+        if not self.ready:
+            return
+        key = f"run:{self.run_id}:logs"
+        for chunk, _ in self.ready:
+            w.lpush(key, chunk)
+        w.ltrim(key, 0, MAX_CHUNKS - 1)
+        w.hincrby(f"run:{self.run_id}", LOG_LINES_FIELD, sum(n for _, n in self.ready))
+        self.ready = []
@@ -0,0 +1,276 @@
+# sandbox_runner.py
+"""
+Child-side loop for the pooled execution engine (see engine.py).
+
+Started once per pool slot as `python -u sandbox_runner.py`, then fed jobs over
+stdin as one JSON document per line; every job gets exactly one JSON line back
+on the original stdout. User code runs in a fresh globals dict with
+sys.stdout/sys.stderr captured, so the interpreter (and anything it already
+imported) is reused across jobs.
+
+Resource limits:
+  - memory: RLIMIT_AS from `--memory-mb`, set by the runner itself at start-up
+            (no preexec_fn in the parent, whose slots are threads)
+  - cpu:    the soft RLIMIT_CPU is moved to "cpu used so far + job budget"
+            before each job, so SIGXCPU kills the child when one job overruns
+  - wall:   enforced by the parent, which kills the child on timeout
+Every reply (and the ready line) carries `cpu_total`, the child's cpu so far,
+so the parent can bill a killed job from the child's rusage.
+
+Streaming: a job with `stream_bytes` > 0 gets its stdout back while it runs,
+as `{"out": text}` lines before the reply, each flushed once `stream_bytes`
+are buffered or `stream_sec` have passed. The reply's `stdout` is then empty,
+and neither side ever holds more than one chunk of output.
+
+Fork-server mode (`--zygote --preload mod1,mod2`): the process imports the
+preload list once and never runs user code itself. Each job is run in a child
+forked from it, so the imports are already in memory (copy-on-write) and every
+run starts from the same clean state. The zygote applies the memory and wall
+limits to each child and reports cpu/rss from wait4(), i.e. per run.
+"""
+import sys, os, io, json, time, signal, select, resource, threading, traceback, importlib
+
+def _cpu() -> float:
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    return ru.ru_utime + ru.ru_stime
+
+def _cap(text: str, limit: int) -> tuple[str, bool]:
+    data = text.encode("utf-8", "replace")
+    if limit <= 0 or len(data) <= limit:
+        return text, False
+    return data[:limit].decode("utf-8", "ignore"), True
+
+class _Stream(io.TextIOBase):
+    """sys.stdout for a streamed job: a bounded buffer handed to `emit` in chunks."""
+
+    def __init__(self, emit, chunk_bytes: int, interval: float, limit: int):
+        self.emit, self.chunk_bytes, self.interval, self.limit = emit, chunk_bytes, interval, limit
+        self.parts: list[str] = []
+        self.buffered = self.total = 0
+        self.truncated = False
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        # Output printed just before a long sleep still shows up within `interval`
+        self.timer = threading.Thread(target=self._tick, daemon=True)
+        self.timer.start()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        n = len(text.encode("utf-8", "replace"))
+        with self.lock:
+            if self.limit > 0 and self.total + n > self.limit:
+                text, self.truncated = _cap(text, self.limit - self.total)[0], True
+                n = len(text.encode("utf-8", "replace"))
+            if text:
+                self.parts.append(text)
+                self.buffered += n
+                self.total += n
+            if self.buffered >= self.chunk_bytes:
+                self._flush()
+        return len(text)
+
+    def _flush(self) -> None:
+        if self.parts:
+            text, self.parts, self.buffered = "".join(self.parts), [], 0
+            self.emit(text)
+
+    def _tick(self) -> None:
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                self._flush()
+
+    def close(self) -> None:
+        self.stopped.set()
+        with self.lock:
+            self._flush()
+
+def run_job(job: dict, emit=None) -> dict:
+    cpu_budget = int(job.get("cpu_sec") or 0)
+    if cpu_budget > 0:
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = int(_cpu()) + cpu_budget + 1
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+    limit = int(job.get("max_output") or 0)
+    stream_bytes = int(job.get("stream_bytes") or 0)
+    if emit is not None and stream_bytes > 0:
+        out = _Stream(emit, stream_bytes, float(job.get("stream_sec") or 0.5), limit)
+    else:
+        out = io.StringIO()
+    err = io.StringIO()
+    real_out, real_err = sys.stdout, sys.stderr
+    ok, error, kind = True, None, "code"  # kind: what to blame if not ok
+    cpu0, wall0 = _cpu(), time.monotonic()
+    sys.stdout, sys.stderr = out, err
+    try:
+        exec(compile(job.get("code", ""), "<run>", "exec"), {"__name__": "__main__", "__builtins__": __builtins__})
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            ok, error = False, f"SystemExit: {e.code}"
+    except MemoryError:
+        ok, error = False, "memory limit exceeded (MemoryError)"
+        kind = "limit"
+    except BaseException as e:
+        # Drop this module's frame so the traceback starts in the user's code
+        ok, error = False, "".join(traceback.format_exception(type(e), e, e.__traceback__.tb_next))
+    finally:
+        sys.stdout, sys.stderr = real_out, real_err
+
+    if isinstance(out, _Stream):
+        out.close()
+        stdout, truncated = "", out.truncated
+    else:
+        stdout, truncated = _cap(out.getvalue(), limit)
+    stderr, _ = _cap(err.getvalue(), limit)
+    return {
+        "ok": ok,
+        "stdout": stdout,
+        "stderr": stderr,
+        "error": error,
+        "kind": None if ok else kind,
+        "truncated": truncated,
+        "cpu_time": round(_cpu() - cpu0, 6),
+        "wall_time": round(time.monotonic() - wall0, 6),
+        # Linux reports KiB; this is the child's high-water mark so far
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "cpu_total": round(_cpu(), 6),
+    }
+
+def preload(modules: list[str]) -> tuple[list[str], list[str]]:
+    ok, failed = [], []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+            ok.append(name)
+        except Exception:
+            failed.append(name)
+    return ok, failed
+
+def _kill_group(pid: int) -> None:
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+def fork_job(job: dict, relay=None) -> dict:
+    """
+    Run one job in a fresh child forked from this (pre-imported) process.
+    The child's `{"out": ...}` lines are passed to `relay` as they arrive.
+    """
+    rfd, wfd = os.pipe()
+    wall0 = time.monotonic()
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            os.close(rfd)
+            os.setpgid(0, 0)
+            mem = int(job.get("memory_mb") or 0)
+            if mem > 0:
+                resource.setrlimit(resource.RLIMIT_AS, (mem << 20, mem << 20))
+            def send(msg: dict) -> None:
+                view = memoryview((json.dumps(msg) + "\n").encode())
+                while view:
+                    view = view[os.write(wfd, view):]
+            send(run_job(job, emit=lambda text: send({"out": text})))
+        except BaseException:
+            code = 1
+        finally:
+            os._exit(code)
+
+    os.close(wfd)
+    try:
+        os.setpgid(pid, pid)
+    except OSError:
+        pass  # child already did it, or already exited
+    wall = float(job.get("wall_sec") or 0)
+    deadline = wall0 + wall if wall > 0 else None
+    pending, reply, timed_out = b"", None, False
+    while True:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        ready, _, _ = select.select([rfd], [], [], timeout)
+        if not ready:
+            timed_out = True
+            _kill_group(pid)
+            break
+        chunk = os.read(rfd, 65536)
+        if not chunk:
+            break
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            if line.startswith(b'{"out":') and relay is not None:
+                relay(line)
+            else:
+                reply = line
+    os.close(rfd)
+    _, status, ru = os.wait4(pid, 0)
+    elapsed = round(time.monotonic() - wall0, 6)
+
+    res = None
+    if not timed_out and reply:
+        try:
+            res = json.loads(reply)
+        except Exception:
+            res = None
+    if res is None:
+        if timed_out:
+            res = {"ok": False, "timeout": True, "kind": "limit", "error": f"wall time limit exceeded ({wall:g}s)"}
+        elif os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGXCPU:
+            res = {"ok": False, "timeout": True, "kind": "limit", "error": f"cpu time limit exceeded ({job.get('cpu_sec')}s)"}
+        elif os.WIFSIGNALED(status):
+            res = {"ok": False, "kind": "crash", "error": f"run killed by signal {os.WTERMSIG(status)}"}
+        else:
+            res = {"ok": False, "kind": "crash", "error": f"run crashed (exit code {os.waitstatus_to_exitcode(status)})"}
+    # wait4() gives exact per-child numbers, including a child that was killed
+    res["cpu_time"] = round(ru.ru_utime + ru.ru_stime, 6)
+    res["max_rss_kb"] = ru.ru_maxrss
+    res["wall_time"] = elapsed
+    return res
+
+def _arg(name: str) -> str | None:
+    return sys.argv[sys.argv.index(name) + 1] if name in sys.argv[:-1] else None
+
+def limit_self(memory_mb: int) -> None:
+    """Before anything else runs; the zygote passes no memory limit (it sets one per forked run)."""
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    if memory_mb > 0:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_mb << 20, memory_mb << 20))
+
+def main() -> None:
+    zygote = "--zygote" in sys.argv
+    limit_self(int(_arg("--memory-mb") or 0))
+    modules = [m.strip() for m in (_arg("--preload") or "").split(",") if m.strip()]
+
+    # Keep the protocol channel private: fd 1 now points at /dev/null so raw
+    # writes from user code (os.write(1, ...), C extensions) cannot corrupt it.
+    proto = os.fdopen(os.dup(1), "w", buffering=1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    sys.stdout = io.TextIOWrapper(os.fdopen(1, "wb", buffering=0), write_through=True)
+
+    loaded, failed = preload(modules)
+    proto.write(json.dumps({"ready": True, "pid": os.getpid(), "preloaded": loaded, "preload_failed": failed,
+                            "cpu_total": round(_cpu(), 6)}) + "\n")
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+        except Exception as e:
+            res = {"ok": False, "error": f"bad job: {e}"}
+        else:
+            if zygote:
+                res = fork_job(job, relay=lambda line: proto.write(line.decode() + "\n"))
+            else:
+                res = run_job(job, emit=lambda text: proto.write(json.dumps({"out": text}) + "\n"))
+        proto.write(json.dumps(res) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# timings.py
+"""
+Per-run latency histograms: queue wait, execution and total time, labelled by
+language and attempt.
+
+Each observation goes to the local Prometheus histogram (metrics.py) and to
+bucket counters in Redis so the API can export fleet-wide histograms on
+/metrics and quantiles in /v1/ops/queues:
+
+  metrics:hist:{kind}:{language}:{attempt}  ->  {<le>: n, ..., "+Inf": n, "sum": s, "count": n}
+
+Bucket fields are not cumulative; readers add them up.
+"""
+from __future__ import annotations
+import bisect
+
+import metrics
+
+HIST_PREFIX = "metrics:hist:"
+HIST_INDEX = "metrics:hist:index"  # set of every histogram key written so far
+
+_LOCAL = {
+    "queue_wait": metrics.QUEUE_WAIT_SECONDS,
+    "exec": metrics.EXEC_SECONDS,
+    "total": metrics.TOTAL_SECONDS,
+}
+
+def bucket(seconds: float) -> str:
+    i = bisect.bisect_left(metrics.LATENCY_BUCKETS, seconds)
+    return "+Inf" if i == len(metrics.LATENCY_BUCKETS) else repr(metrics.LATENCY_BUCKETS[i])
+
+def record(w, kind: str, language: str, attempt: int, seconds: float) -> None:
+    """Observe one value; the Redis writes are recorded on `w` (client, pipeline or Deferred)."""
+    seconds = max(0.0, seconds)
+    _LOCAL[kind].labels(language, str(attempt)).observe(seconds)
+    key = f"{HIST_PREFIX}{kind}:{language}:{attempt}"
+    w.hincrby(key, bucket(seconds), 1)
+    w.hincrby(key, "count", 1)
+    w.hincrbyfloat(key, "sum", round(seconds, 6))
+    w.sadd(HIST_INDEX, key)
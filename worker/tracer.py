@@ -0,0 +1,56 @@
+# tracer.py
+"""
+Worker spans of a run, exported through the exporters of TRACE_EXPORTERS
+(see tracing/): the API's trace context arrives in payload["_trace"].
+
+  worker.dequeue        enqueue (or retry re-enqueue) -> dequeued by this worker
+  worker.mark_running   the round trip that sets status "running"
+  worker.execute        engine run (or worker.coalesced: answered from another run)
+  worker.status_write   the flush carrying the final status, log lines and ack
+
+Spans are collected in memory while the run executes and exported in one
+pipeline per flush, right after the flush they describe.
+"""
+from __future__ import annotations
+
+from heartbeat import WORKER_ID
+from tracing import PAYLOAD_KEY, make_exporter, new_trace_id, span
+
+exporter = make_exporter()  # None: TRACE_EXPORTERS=none
+
+def _ts(v) -> float | None:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+class RunTrace:
+    def __init__(self, payload: dict):
+        self.run_id = payload.get("run_id") or "unknown"
+        # Runs enqueued without a context (older API) get one here; retries keep it
+        self.ctx = payload.setdefault(PAYLOAD_KEY, {"trace_id": new_trace_id()})
+        self.attempt = int(payload.get("_attempt", 0)) + 1
+        self.spans: list[dict] = []
+        enqueued, dequeued = _ts(payload.get("_enqueued") or payload.get("_created")), _ts(payload.get("_dequeued"))
+        if enqueued is not None and dequeued is not None:
+            self.add("worker.dequeue", enqueued, dequeued)
+
+    def add(self, name: str, start: float, end: float, **attrs) -> None:
+        self.spans.append(span(name, self.ctx, start, end, "worker", worker=WORKER_ID, attempt=self.attempt, **attrs))
+
+def start(payload: dict) -> RunTrace | None:
+    return RunTrace(payload) if exporter is not None else None
+
+def export(r, traces: list[RunTrace], flushed_at: float, done_at: float) -> None:
+    """Close each trace with the status write that just finished and export them in one pipeline."""
+    if not traces:
+        return
+    p = r.pipeline(transaction=False)
+    for t in traces:
+        t.add("worker.status_write", flushed_at, done_at, batch=len(traces))
+        exporter.export(p, t.run_id, t.spans)
+    try:
+        p.execute()
+    except Exception as e:
+        # Traces are diagnostics: never take the dispatcher down over them
+        print(f"trace export failed: {e!r}")
@@ -0,0 +1,42 @@
+# usage.py
+"""
+Per-project resource rollup, one set of keys per UTC day (read by api/usage.py):
+
+  usage:{day}:p:{project}   hash  executions, timeouts, cpu_time, wall_time
+  usage:{day}:peak_rss_kb   zset  project -> highest max_rss_kb of one execution
+  usage:{day}:projects      set   projects with usage that day
+
+Every attempt is billed, retries and timeouts included: they all held a slot.
+A coalesced run (coalesce.py) is billed the usage of the run it copied.
+Keys expire after USAGE_RETENTION_DAYS.
+"""
+from __future__ import annotations
+import os, time
+
+from engine import ExecutionResult
+
+PREFIX = "usage:"
+RETENTION_DAYS = int(os.getenv("USAGE_RETENTION_DAYS", "35"))
+NO_PROJECT = "_none"
+
+def day(ts: float | None = None) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(ts))
+
+def record(w, project: str | None, result: ExecutionResult | None, timed_out: bool = False) -> None:
+    project = str(project or NO_PROJECT)
+    d = day()
+    key, ttl = f"{PREFIX}{d}:p:{project}", RETENTION_DAYS * 86400
+    w.hincrby(key, "executions", 1)
+    if timed_out:
+        w.hincrby(key, "timeouts", 1)
+    if result is not None:
+        if result.cpu_time is not None:
+            w.hincrbyfloat(key, "cpu_time", result.cpu_time)
+        if result.wall_time is not None:
+            w.hincrbyfloat(key, "wall_time", result.wall_time)
+        if result.max_rss_kb is not None:
+            w.zadd(f"{PREFIX}{d}:peak_rss_kb", {project: result.max_rss_kb}, gt=True)
+            w.expire(f"{PREFIX}{d}:peak_rss_kb", ttl)
+    w.expire(key, ttl)
+    w.sadd(f"{PREFIX}{d}:projects", project)
+    w.expire(f"{PREFIX}{d}:projects", ttl)
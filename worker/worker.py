@@ -1,95 +1,409 @@
 # worker.py
 from __future__ import annotations
-import os, time, json, traceback
+import os, sys, time, json, hashlib, traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 import redis
+try:
+    from runqueue import Job, make_queue
+except ImportError:  # running from a checkout: the shared packages sit next to worker/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from runqueue import Job, make_queue
+from runqueue.redis_list import ROUTED_LANGUAGES, WORKER_LANGUAGES
+from blobstore import make_store
+from records import encode_run, now_ms, pick_run, run_field_names
 
-# Optional prometheus pushgateway
-PUSHGATEWAY_URL = os.getenv("PUSHGATEWAY_URL", "").strip()
-
-if PUSHGATEWAY_URL:
-    from prometheus_client import CollectorRegistry, Counter, push_to_gateway
+# Local Prometheus registry, pushed/served off the hot path (see metrics.py)
+import metrics
+from heartbeat import Heartbeat, WorkerStats, WORKER_ID
+from engine import ExecutionResult, ExecutionTimeout, POISON, RETRYABLE, RUNNERS, classify, make_engine
+from coalesce import Coalescer, fingerprint
+from batching import BatchSizer, Deferred, flush
+from runlog import RunLog
+from quota import ProjectQuota, SWEEP_SEC
+from limits import LimitResolver, Limits
+from output import OutputStream
+import timings, tracer, usage
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-RUNS_QUEUE = os.getenv("RUNS_QUEUE", "runs")
 DLQ_QUEUE = os.getenv("RUNS_DLQ", "runs:dead")
 MAX_RETRIES = int(os.getenv("RUNS_MAX_RETRIES", "3"))
 POLL_TIMEOUT = int(os.getenv("RUNS_POLL_TIMEOUT_SEC", "5"))
+COALESCE = os.getenv("RUNS_COALESCE", "1") == "1"
+QUOTAS = os.getenv("RUNS_PROJECT_QUOTAS", "1") == "1"
+SLOTS = max(1, int(os.getenv("WORKER_SLOTS", "1")))
+IDLE_POLL_SEC = 0.2  # re-check the queue this often while some (not all) slots are busy
+# `language` is client input: only these become metric labels and histogram keys
+KNOWN_LANGUAGES = frozenset({*RUNNERS, *ROUTED_LANGUAGES})
 
 r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+stats = WorkerStats(slots=SLOTS)
+sizer = BatchSizer()
+engine = None  # created in __main__ so importing this module never spawns sandboxes
+coalescer = Coalescer(r) if COALESCE else None
+quota = ProjectQuota(r) if QUOTAS else None
+limits = LimitResolver(r)
+blobs = make_store()  # BLOB_STORE=local: large results leave Redis (output.py)
+queue = make_queue(r, consumer=WORKER_ID)  # RUNS_QUEUE_BACKEND=list|stream
+
+def language_label(language: str | None) -> str:
+    language = (language or "").strip().lower()
+    if not language:
+        return "unknown"
+    return language if language in KNOWN_LANGUAGES else "other"
 
-def log_run(run_id: str, line: str) -> None:
-    r.lpush(f"run:{run_id}:logs", line)
-    r.hset(f"run:{run_id}", mapping={"updated_at": str(time.time())})
+# Write helpers take an optional `w`: the live client by default, or a
+# Deferred recorder when the dispatcher flushes several runs at once.
+def log_run(run_id: str, line: str, w=None) -> None:
+    # One-off line; process() batches its lines through a RunLog instead
+    log = RunLog(run_id)
+    log.write(line)
+    log.flush(w or r)
 
-def set_status(run_id: str, status: str) -> None:
-    r.hset(f"run:{run_id}", mapping={"status": status, "updated_at": str(time.time())})
+def set_status(run_id: str, status: str, w=None) -> None:
+    (w or r).hset(f"run:{run_id}", mapping=encode_run({"status": status, "updated_at": now_ms()}))
 
-def incr_processed(language: str | None = None) -> None:
+def incr_processed(language: str | None = None, w=None) -> None:
+    w = w or r
     # Redis counters for API /metrics
-    r.incr("metrics:runs_processed_total")
+    w.incr("metrics:runs_processed_total")
     if language:
-        r.hincrby("metrics:runs_processed_by_lang", language, 1)
-
-    # Optional Pushgateway
-    if PUSHGATEWAY_URL:
-        reg = CollectorRegistry()
-        c_total = Counter("scw_worker_runs_processed_total", "Processed runs", registry=reg)
-        c_total.inc(1)
-        if language:
-            c_lang = Counter("scw_worker_runs_processed_by_language", "Processed runs by language", ["language"], registry=reg)
-            c_lang.labels(language).inc(1)
-        # It's OK if this fails; we don't crash the worker
-        try:
-            push_to_gateway(PUSHGATEWAY_URL, job="scw_worker", registry=reg, grouping_key={"instance": os.getenv("RENDER_INSTANCE_ID", "local")})
-        except Exception:
-            pass
+        w.hincrby("metrics:runs_processed_by_lang", language, 1)
+    # Local cumulative counter; exported by the metrics thread / pull endpoint
+    metrics.RUNS_PROCESSED.labels(language or "unknown").inc()
+
+def incr_failed(language: str | None = None, w=None) -> None:
+    (w or r).incr("metrics:runs_failed_total")
+    metrics.RUNS_FAILED.labels(language or "unknown").inc()
+
+def incr_failure(failure_class: str, language: str | None = None, w=None) -> None:
+    # Every failed attempt, by class (retryable / non_retryable / poison)
+    (w or r).hincrby("metrics:runs_failures_by_class", failure_class, 1)
+    metrics.RUN_FAILURES.labels(language or "unknown", failure_class).inc()
 
-def execute(payload: dict) -> str:
+def annotate(payload: dict, failure_class: str, error: str) -> str:
+    """DLQ entry: the payload plus why it ended up there."""
+    return json.dumps({**payload, "_failure": {"class": failure_class, "error": error[:500], "ts": time.time()}})
+
+def execute(payload: dict, lim: Limits | None = None, out: OutputStream | None = None) -> ExecutionResult:
     """
-    Your actual execution logic.
-    Return string result; raise Exception on retryable failure.
+    Run the payload on the configured engine (WORKER_ENGINE, see engine.py)
+    under its CPU/wall limits (limits.py), streaming stdout into `out` if
+    given. Raise Exception on retryable failure; ExecutionError may carry
+    partial usage.
     """
-    lang = payload.get("language", "python")
-    code = payload.get("code", "")
-    time.sleep(0.5)
-    return f"[{lang}] OK len(code)={len(code)}"
+    global engine
+    if engine is None:
+        engine = make_engine()
+    lim = lim or limits.get(payload)
+    on_output = out.write if out is not None else None
+    return engine.run(payload, cpu_sec=lim.cpu_sec, wall_sec=lim.wall_sec, on_output=on_output)
 
-def main():
-    print(f"Worker started. Listening on queue '{RUNS_QUEUE}'...")
-    while True:
-        item = r.brpop(RUNS_QUEUE, timeout=POLL_TIMEOUT)
-        if not item:
-            continue
-        _, raw = item
-        try:
-            payload = json.loads(raw)
-        except Exception:
-            r.lpush(DLQ_QUEUE, raw)
-            continue
+def record_usage(run_id: str, result: ExecutionResult | None, w=None) -> None:
+    usage = result.usage() if result is not None else {}
+    if usage:
+        (w or r).hset(f"run:{run_id}", mapping=encode_run(usage))
 
+def since(ts, now: float | None = None) -> float | None:
+    try:
+        return (now or time.time()) - float(ts)
+    except (TypeError, ValueError):
+        return None
+
+def record_total(payload: dict, lang: str, attempt: int, w) -> None:
+    # Submission (`_created`, set by the API) to final status
+    total = since(payload.get("_created"))
+    if total is not None:
+        timings.record(w, "total", lang, attempt, total)
+
+USAGE_FIELDS = ("cpu_time", "max_rss_kb", "wall_time")
+
+def leader_usage(leader_run_id: str) -> ExecutionResult:
+    values = pick_run(USAGE_FIELDS, r.hmget(f"run:{leader_run_id}", run_field_names(*USAGE_FIELDS)))
+    cpu, rss, wall = (float(v) if v not in (None, "") else None for v in values)
+    return ExecutionResult("", cpu_time=cpu, max_rss_kb=int(rss) if rss is not None else None, wall_time=wall)
+
+def follow(fp: str, payload: dict, lang: str, w) -> bool:
+    """Wait for the run leading this fingerprint; True if its result was copied."""
+    run_id = payload.get("run_id") or "unknown"
+    log_run(run_id, "Waiting for identical in-flight run")
+    outcome = coalescer.wait(fp)
+    if not outcome or outcome.get("status") != "succeeded":
+        return False
+    leader = outcome.get("run_id", "")
+    if not coalescer.copy_result(leader, run_id):
+        return False
+    w.hset(f"run:{run_id}", mapping=encode_run({"coalesced_with": leader}))
+    # Billed what the leader's execution cost: the follower's project got the same work done
+    shared = leader_usage(leader)
+    usage.record(w, payload.get("project_id"), shared)
+    record_usage(run_id, shared, w)
+    set_status(run_id, "succeeded", w)
+    log_run(run_id, f"DONE (coalesced with {leader})", w)
+    incr_processed(lang, w)
+    w.incr("metrics:runs_coalesced_total")
+    metrics.RUNS_COALESCED.labels(lang).inc()
+    return True
+
+def mark_running(payloads: list[dict]) -> None:
+    """Status + attempt line for every dequeued run, in one round trip."""
+    p = r.pipeline(transaction=False)
+    for payload in payloads:
         run_id = payload.get("run_id") or "unknown"
-        attempt = int(payload.get("_attempt", 0))
-        set_status(run_id, "running")
-        log_run(run_id, f"Attempt {attempt+1}")
+        set_status(run_id, "running", p)
+        log_run(run_id, f"Attempt {int(payload.get('_attempt', 0)) + 1}", p)
+    p.execute()
+
+def _error_lines(e: Exception, payload: dict, attempt: int, failure_class: str) -> str:
+    if failure_class != RETRYABLE:
+        # The message already is the user's traceback / the limit hit; ours adds nothing
+        return f"ERROR ({failure_class}): {e}"
+    # Retries usually fail the same way: keep the full traceback once per distinct one
+    tb = traceback.format_exc()
+    digest = hashlib.sha1(tb.encode()).hexdigest()[:16]
+    if payload.get("_tb") == digest:
+        return f"ERROR: {e} (same traceback as attempt {payload.get('_tb_attempt', '?')})"
+    payload["_tb"], payload["_tb_attempt"] = digest, attempt
+    return f"ERROR: {e}\n{tb}"
+
+def process(payload: dict, w: Deferred, job: Job | None = None, trace: tracer.RunTrace | None = None) -> None:
+    """
+    Execute one run (already marked running); final writes are recorded on `w`,
+    together with the ack (or nack for a retry) of its queue `job`. Spans go to `trace`.
+    """
+    job = job or Job(json.dumps(payload))
+    run_id = payload.get("run_id") or "unknown"
+    attempt = int(payload.get("_attempt", 0))
+    lang = language_label(payload.get("language"))
+    # Retries are re-stamped with `_enqueued`; first attempts wait since `_created`
+    waited = since(payload.get("_enqueued") or payload.get("_created"), payload.pop("_dequeued", None))
+    if waited is not None:
+        timings.record(w, "queue_wait", lang, attempt + 1, waited)
+    fp, leader, lim = None, False, None
+    if coalescer is not None:
+        lim = limits.get(payload)
+        fp = fingerprint(payload, lim)
+        leader = coalescer.lead(fp, run_id)
+        if not leader:
+            followed = time.time()
+            if follow(fp, payload, lang, w):
+                if trace is not None:
+                    trace.add("worker.coalesced", followed, time.time())
+                record_total(payload, lang, attempt + 1, w)
+                queue.ack(job, w)
+                return
+            # Leader failed or vanished: execute ourselves
+            leader = coalescer.lead(fp, run_id)
 
+    log = RunLog(run_id)  # this run's lines go out as one chunk with the final writes
+    out = OutputStream(r, run_id, blobs)
+    stats.start(run_id)
+    ended_at = status = failure_class = None
+    try:
+        started, started_at = time.monotonic(), time.time()
         try:
-            result = execute(payload)
-            r.set(f"run:{run_id}:result", result)
-            set_status(run_id, "succeeded")
-            log_run(run_id, "DONE")
-            incr_processed(payload.get("language"))
-        except Exception as e:
-            attempt += 1
-            payload["_attempt"] = attempt
-            log_run(run_id, f"ERROR: {e}\n{traceback.format_exc()}")
-            if attempt < MAX_RETRIES:
-                delay = min(2 ** attempt, 30)
-                time.sleep(delay)
-                r.lpush(RUNS_QUEUE, json.dumps(payload))
-                set_status(run_id, "queued")
-            else:
-                set_status(run_id, "failed")
-                r.lpush(DLQ_QUEUE, json.dumps(payload))
+            result = execute(payload, lim, out=out)
+        finally:
+            stats.finish(run_id)
+            timings.record(w, "exec", lang, attempt + 1, time.monotonic() - started)
+            ended_at = time.time()
+        usage.record(w, payload.get("project_id"), result)
+        out.finish(w, result.output)
+        record_usage(run_id, result, w)
+        if result.stderr:
+            log.write(f"STDERR: {result.stderr}")
+        status = "succeeded"
+        set_status(run_id, status, w)
+        log.write("DONE")
+        incr_processed(lang, w)
+        record_total(payload, lang, attempt + 1, w)
+        queue.ack(job, w)
+        if leader:
+            # Followers COPY our result, so publish only once it is written
+            w.after(lambda: coalescer.publish(fp, run_id, "succeeded"))
+    except Exception as e:
+        out.abort()
+        if leader:
+            coalescer.publish(fp, run_id, "failed")
+        failure_class = classify(e)
+        timed_out = isinstance(e, ExecutionTimeout)
+        log.write(_error_lines(e, payload, attempt + 1, failure_class))
+        incr_failure(failure_class, lang, w)
+        attempt += 1
+        payload["_attempt"] = attempt
+        record_usage(run_id, getattr(e, "result", None), w)
+        usage.record(w, payload.get("project_id"), getattr(e, "result", None), timed_out)
+        if failure_class == RETRYABLE and attempt < MAX_RETRIES:
+            delay = min(2 ** attempt, 30)
+            time.sleep(delay)
+            payload["_enqueued"] = str(time.time())
+            queue.nack(job, json.dumps(payload), w)
+            status = "queued"
+            set_status(run_id, status, w)
+            metrics.RUNS_RETRIED.labels(lang).inc()
+        else:
+            # Non-retryable failures land here on their first attempt
+            status = "timeout" if timed_out else "failed"
+            set_status(run_id, status, w)
+            w.hset(f"run:{run_id}", mapping=encode_run({"failure_class": failure_class, "error": str(e)}))
+            incr_failed(lang, w)
+            record_total(payload, lang, attempt, w)
+            w.lpush(DLQ_QUEUE, annotate(payload, failure_class, str(e)))
+            queue.ack(job, w)
+    finally:
+        log.flush(w)
+        if trace is not None and ended_at is not None:
+            trace.add("worker.execute", started_at, ended_at, engine=getattr(engine, "name", None),
+                      status=status, failure_class=failure_class)
+
+def dequeue(block: bool) -> list[Job]:
+    """
+    Deep queue: take up to sizer.size() jobs in one round trip.
+    Otherwise one job: blocking read when idle (block), non-blocking while slots are busy.
+    With batching on, the depth is read in the same round trip to feed the sizer.
+    """
+    n = sizer.size()
+    if n > 1:
+        jobs, depth = queue.dequeue_blocking(n, with_depth=True)
+        sizer.observe(depth)
+        if jobs:
+            return jobs
+    jobs, depth = queue.dequeue_blocking(1, POLL_TIMEOUT if block else 0, with_depth=sizer.enabled)
+    if depth is not None:
+        sizer.observe(depth)
+    return jobs
+
+def decode(data: str) -> tuple[dict | None, str | None]:
+    """(payload, None) for a runnable payload, else (None, DLQ entry annotated as poison)."""
+    try:
+        payload = json.loads(data)
+    except Exception as e:
+        error = f"malformed payload: {e}"
+    else:
+        if isinstance(payload, dict):
+            if "_poison" not in payload:
+                return payload, None
+            return None, data  # a dead-lettered poison entry that was retried: back it goes, unchanged
+        error = f"expected a JSON object, got {type(payload).__name__}"
+    return None, json.dumps({"_poison": data[:4096], "_failure": {"class": POISON, "error": error, "ts": time.time()}})
+
+def parse(jobs: list[Job]) -> list[tuple[dict, Job]]:
+    out, now = [], time.time()
+    for job in jobs:
+        payload, dead = decode(job.data)
+        if dead is None and job.deliveries > MAX_RETRIES:
+            # Reclaimed from dead consumers this often: the run itself may be what kills them
+            error = f"delivered {job.deliveries} times without being acknowledged"
+            dead = annotate(payload, POISON, error)
+        if dead is not None:
+            p = r.pipeline(transaction=False)
+            p.lpush(DLQ_QUEUE, dead)
+            incr_failure(POISON, None, p)
+            if payload is not None and payload.get("run_id"):
+                set_status(payload["run_id"], "failed", p)
+                p.hset(f"run:{payload['run_id']}", mapping=encode_run({"failure_class": POISON, "error": error}))
+            queue.ack(job, p)
+            p.execute()
+            continue
+        payload["_dequeued"] = now  # queue wait ends here, not when a slot frees up
+        out.append((payload, job))
+    return out
+
+def admit(runs: list[tuple[dict, Job]]) -> list[tuple[dict, Job]]:
+    """
+    Runs whose project is under its concurrency limit. The rest now sit on the
+    project's holding list (see quota.py), so their queue entries are acked.
+    """
+    if quota is None or not runs:
+        return runs
+    ok = quota.admit([(payload, job.data) for payload, job in runs])
+    held = [run for run, admitted in zip(runs, ok) if not admitted]
+    if held:
+        p = r.pipeline(transaction=False)
+        for payload, job in held:
+            run_id = payload["run_id"]
+            set_status(run_id, "queued", p)
+            log_run(run_id, f"Held: project {payload['project_id']} is at its concurrency limit", p)
+            queue.ack(job, p)
+        p.execute()
+    return [run for run, admitted in zip(runs, ok) if admitted]
+
+def renew() -> None:
+    # Heartbeat: in-flight stream entries are not reclaimed, quota leases do not expire
+    queue.renew()
+    if quota is not None:
+        quota.renew()
+
+def release(run_id: str, ready: list[str]) -> None:
+    # Frees the lease; the project's next held run comes back already leased to us
+    item = quota.release(run_id)
+    if item is not None:
+        ready.append(item)
+
+def main():
+    unrouted = getattr(queue, "unrouted", [])
+    if unrouted:
+        # Nothing is ever pushed to those lists: the pool would sit idle while its runs queue elsewhere
+        raise SystemExit(f"WORKER_LANGUAGES {unrouted} not in RUNS_LANGUAGES {ROUTED_LANGUAGES}: refusing to start")
+    if WORKER_LANGUAGES and queue.name != "list":
+        print(f"WORKER_LANGUAGES is ignored by the {queue.name} backend")
+    keys = getattr(queue, "consume_keys", [queue.key])
+    print(f"Worker {WORKER_ID} started. Listening on {queue.name} queue {', '.join(keys)} "
+          f"(slots={SLOTS}, batch_max={sizer.max_size})...")
+    backlog: deque[tuple[dict, Job]] = deque()         # dequeued, not started yet
+    pending: dict[Future, tuple[Deferred, Job]] = {}   # running in a slot
+    traces: dict[Deferred, tracer.RunTrace] = {}       # spans of pending runs (TRACE_EXPORTERS)
+    ready: list[str] = []                              # held runs promoted (and leased) for us
+    next_sweep = time.monotonic() + SWEEP_SEC
+    with ThreadPoolExecutor(max_workers=SLOTS, thread_name_prefix="slot") as pool:
+        while True:
+            if ready:
+                # Not admitted again: promotion already took the lease
+                backlog.extend(parse([Job(data) for data in ready]))
+                ready.clear()
+            if not backlog and len(pending) < SLOTS:
+                if quota is not None and time.monotonic() >= next_sweep:
+                    # Held runs whose releasing worker died; their leases have expired
+                    next_sweep = time.monotonic() + SWEEP_SEC
+                    backlog.extend(parse([Job(data) for data in quota.sweep()]))
+                if not backlog:
+                    backlog.extend(admit(parse(dequeue(block=not pending))))
+
+            starting = []
+            while backlog and len(pending) + len(starting) < SLOTS:
+                starting.append(backlog.popleft())
+            if starting:
+                marked = time.time()
+                mark_running([payload for payload, _ in starting])
+                for payload, job in starting:
+                    w = Deferred()
+                    if quota is not None:
+                        # Runs at flush, after the run's final status is written
+                        w.after(lambda run_id=payload.get("run_id"): release(run_id, ready))
+                    trace = tracer.start(payload)
+                    if trace is not None:
+                        trace.add("worker.mark_running", marked, time.time(), batch=len(starting))
+                        traces[w] = trace
+                    pending[pool.submit(process, payload, w, job, trace)] = (w, job)
+
+            if not pending:
+                continue
+            # Slots full or work waiting locally: block until a run finishes.
+            # Otherwise come back shortly to pick up newly queued work.
+            full = len(pending) >= SLOTS or bool(backlog)
+            done, _ = wait(pending, timeout=None if full else IDLE_POLL_SEC, return_when=FIRST_COMPLETED)
+            writers = []
+            for fut in done:
+                w, job = pending.pop(fut)
+                writers.append(w)
+                if fut.exception() is not None:
+                    # Left unacknowledged and no longer renewed: a stream backend hands it out again via XAUTOCLAIM
+                    queue.abandon(job)
+                    print(f"process failed: {fut.exception()!r}")
+            flushed_at = time.time()
+            flush(r, writers)
+            if traces:
+                tracer.export(r, [traces.pop(w) for w in writers if w in traces], flushed_at, time.time())
 
 if __name__ == "__main__":
     try:
@@ -97,4 +411,13 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"Redis not reachable: {e}")
         time.sleep(2)
-    main()
+    metrics.start_exporter()
+    engine = make_engine()
+    print(f"Execution engine: {engine.name}")
+    hb = Heartbeat(r, stats, on_beat=renew)
+    hb.start()
+    try:
+        main()
+    finally:
+        hb.stop()
+        engine.close()